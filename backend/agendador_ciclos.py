@@ -0,0 +1,195 @@
+"""
+==============================================
+AGENDADOR DE CICLOS (FILA DE START)
+==============================================
+Um START (botão da pneumática ou API) que chega com um ciclo rodando
+entra numa fila limitada em vez de ser descartado. O próximo ciclo
+começa assim que o anterior libera o hardware (pórtico parado, dedo
+solto, IR desligado); o relatório e o JSON do ciclo anterior terminam
+em segundo plano durante o ciclo seguinte.
+
+Cada pedido leva origem, operador e modelo. A previsão (ETA) usa a
+média móvel das durações observadas de cada modelo e, antes da primeira
+execução, a estimativa do simulador de ciclo.
+"""
+
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+import asyncio
+import itertools
+import time
+
+from execucao_ciclo import CicloInterrompido
+
+CAPACIDADE_PADRAO = 5
+# Peso da última duração na média móvel por modelo
+ALFA_DURACAO = 0.3
+HISTORICO_MAXIMO = 20
+
+
+class ErroFilaCheia(Exception):
+    pass
+
+
+@dataclass
+class PedidoCiclo:
+    """Pedido de START com os metadados do operador"""
+    id: int
+    origem: str
+    operador: Optional[str] = None
+    modelo: Optional[str] = None
+    proximo_modelo: Optional[str] = None
+    fail_fast: bool = False
+    reteste: Optional[str] = None
+    recebido_em: str = field(default_factory=lambda: datetime.now().isoformat())
+    status: str = "na_fila"  # na_fila, executando, concluido, erro, cancelado, interrompido
+    iniciado_em: Optional[str] = None
+    duracao_s: Optional[float] = None
+    espera_s: Optional[float] = None
+    mensagem: Optional[str] = None
+    eta_s: Optional[float] = None
+    _recebido: float = field(default_factory=time.perf_counter, repr=False)
+
+    def resumo(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "origem": self.origem,
+            "operador": self.operador,
+            "modelo": self.modelo,
+            "proximo_modelo": self.proximo_modelo,
+            "fail_fast": self.fail_fast,
+            "reteste": self.reteste,
+            "recebido_em": self.recebido_em,
+            "status": self.status,
+            "iniciado_em": self.iniciado_em,
+            "espera_s": self.espera_s,
+            "duracao_s": self.duracao_s,
+            "eta_s": self.eta_s,
+            "mensagem": self.mensagem,
+        }
+
+
+class AgendadorCiclos:
+    """Fila limitada de pedidos; um ciclo por vez, o próximo sai quando o hardware é liberado"""
+
+    def __init__(self, executar: Callable[[PedidoCiclo], Awaitable[Any]],
+                 estimar_duracao: Callable[[Optional[str]], float],
+                 capacidade: int = CAPACIDADE_PADRAO):
+        self.executar = executar
+        self.estimar_duracao = estimar_duracao
+        self.capacidade = capacidade
+        self.fila: Deque[PedidoCiclo] = deque()
+        self.atual: Optional[PedidoCiclo] = None
+        self.historico: Deque[PedidoCiclo] = deque(maxlen=HISTORICO_MAXIMO)
+        self.duracoes: Dict[str, float] = {}
+        self._ids = itertools.count(1)
+        self._novo = asyncio.Event()
+        self._inicio_atual: Optional[float] = None
+        self.tarefa: Optional[asyncio.Task] = None
+
+    def iniciar(self):
+        if self.tarefa is None or self.tarefa.done():
+            self.tarefa = asyncio.create_task(self.rodar())
+
+    async def parar(self):
+        if self.tarefa is not None:
+            self.tarefa.cancel()
+            try:
+                await self.tarefa
+            except asyncio.CancelledError:
+                pass
+
+    def enfileirar(self, origem: str, operador: Optional[str] = None, modelo: Optional[str] = None,
+                   proximo_modelo: Optional[str] = None, fail_fast: bool = False,
+                   reteste: Optional[str] = None) -> PedidoCiclo:
+        if len(self.fila) >= self.capacidade:
+            raise ErroFilaCheia(f"Fila de ciclos cheia ({self.capacidade} pedidos)")
+        pedido = PedidoCiclo(next(self._ids), origem, operador, modelo, proximo_modelo, fail_fast, reteste)
+        self.fila.append(pedido)
+        self._atualizar_eta()
+        self._novo.set()
+        print(f"🗂️ Pedido {pedido.id} na fila ({origem}, modelo {modelo or 'ativo'}) - posição {len(self.fila)}, ETA {pedido.eta_s}s")
+        return pedido
+
+    def cancelar(self, pedido_id: Optional[int] = None) -> List[PedidoCiclo]:
+        """Remove um pedido da fila (ou todos, sem id); o ciclo em execução não é afetado"""
+        cancelados = [p for p in self.fila if pedido_id is None or p.id == pedido_id]
+        for pedido in cancelados:
+            self.fila.remove(pedido)
+            pedido.status = "cancelado"
+            self.historico.append(pedido)
+        self._atualizar_eta()
+        return cancelados
+
+    def _duracao_estimada(self, modelo: Optional[str]) -> float:
+        if modelo in self.duracoes:
+            return self.duracoes[modelo]
+        try:
+            return self.estimar_duracao(modelo)
+        except Exception as e:
+            print(f"⚠️ Sem estimativa de duração para {modelo}: {e}")
+            return 0.0
+
+    def _atualizar_eta(self):
+        """ETA de cada pedido = restante do ciclo atual + ciclos à frente na fila"""
+        restante = 0.0
+        if self.atual is not None:
+            decorrido = time.perf_counter() - self._inicio_atual
+            restante = max(0.0, self._duracao_estimada(self.atual.modelo) - decorrido)
+        for pedido in self.fila:
+            pedido.eta_s = round(restante, 1)
+            restante += self._duracao_estimada(pedido.modelo)
+
+    async def rodar(self):
+        while True:
+            if not self.fila:
+                self._novo.clear()
+                await self._novo.wait()
+                continue
+            pedido = self.fila.popleft()
+            self.atual, self._inicio_atual = pedido, time.perf_counter()
+            pedido.status = "executando"
+            pedido.iniciado_em = datetime.now().isoformat()
+            pedido.espera_s = round(self._inicio_atual - pedido._recebido, 3)
+            try:
+                await self.executar(pedido)
+                pedido.status = "concluido"
+            except asyncio.CancelledError:
+                pedido.status = "cancelado"
+                raise
+            except CicloInterrompido as e:
+                pedido.status = "interrompido"
+                pedido.mensagem = str(e)
+            except Exception as e:
+                pedido.status = "erro"
+                pedido.mensagem = str(e)
+                print(f"❌ Pedido {pedido.id}: {e}")
+            finally:
+                pedido.duracao_s = round(time.perf_counter() - self._inicio_atual, 3)
+                # Só ciclos completos entram na média (fail-fast e reteste pressionam menos botões)
+                if pedido.status == "concluido" and not pedido.fail_fast and not pedido.reteste:
+                    chave = pedido.modelo
+                    anterior = self.duracoes.get(chave)
+                    self.duracoes[chave] = pedido.duracao_s if anterior is None else \
+                        (1 - ALFA_DURACAO) * anterior + ALFA_DURACAO * pedido.duracao_s
+                self.historico.append(pedido)
+                self.atual = None
+                self._atualizar_eta()
+
+    def resumo(self) -> Dict[str, Any]:
+        self._atualizar_eta()
+        restante = 0.0
+        if self.atual is not None:
+            restante = max(0.0, self._duracao_estimada(self.atual.modelo) - (time.perf_counter() - self._inicio_atual))
+        return {
+            "profundidade": len(self.fila),
+            "capacidade": self.capacidade,
+            "atual": self.atual.resumo() if self.atual else None,
+            "restante_atual_s": round(restante, 1),
+            "eta_fila_vazia_s": round(restante + sum(self._duracao_estimada(p.modelo) for p in self.fila), 1),
+            "fila": [p.resumo() for p in self.fila],
+            "historico": [p.resumo() for p in list(self.historico)[-5:]],
+            "duracao_media_s": {str(k): round(v, 1) for k, v in self.duracoes.items()},
+        }
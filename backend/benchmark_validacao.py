@@ -0,0 +1,185 @@
+"""
+==============================================
+BENCHMARK DA VALIDAÇÃO DE IMAGENS
+==============================================
+Mede latência (p50/p90/p99), throughput por núcleo e pico de memória de
+cada etapa da validação usando as fotos reais de camera_photos_modelo1
+e test_results como fixtures. Compara com um baseline salvo e falha
+(exit code 1) quando alguma etapa regride além do limiar.
+
+Uso:
+    python benchmark_validacao.py                   # mede e compara com o baseline
+    python benchmark_validacao.py --salvar-baseline # grava o baseline atual
+"""
+
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+import argparse
+import json
+import platform
+import re
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from validacao_imagens import (
+    calcular_similaridade_histograma,
+    calcular_similaridade_template_matching,
+    comparar_imagem_com_referencia,
+    encontrar_imagem_referencia,
+    limpar_cache_referencias,
+    processar_imagem,
+)
+
+BASELINE_PADRAO = Path("benchmark_baseline.json")
+
+# Regressão tolerada no p50 de cada etapa (0.25 = 25% mais lento)
+LIMIAR_REGRESSAO_PADRAO = 0.25
+
+PADRAO_FOTO = re.compile(r"^botao_(?P<numero>\d{3})_(?P<nome>.+)_camera_(?P<camera>\d+)_\d{8}_\d{6}_\d+\.jpg$")
+
+
+def coletar_fixtures(referencia_dir: Path, resultados_dir: Path, limite: int) -> List[Tuple[Path, int, str, int]]:
+    """Fotos de teste (ou, na falta delas, as próprias referências) com número, nome e câmera"""
+    fotos = sorted(resultados_dir.glob("ciclo_*/fotos/botao_*.jpg"))
+    if not fotos:
+        fotos = sorted(referencia_dir.glob("botao_*.jpg"))
+
+    fixtures = []
+    for foto in fotos:
+        match = PADRAO_FOTO.match(foto.name)
+        if match:
+            fixtures.append((foto, int(match["numero"]), match["nome"], int(match["camera"])))
+    return fixtures[:limite] if limite else fixtures
+
+def medir(funcao: Callable[[], Any], repeticoes: int) -> Dict[str, float]:
+    """Executa a função N vezes e retorna percentis de latência, throughput e pico de memória"""
+    funcao()  # aquecimento
+
+    tempos = np.empty(repeticoes)
+    for i in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos[i] = time.perf_counter() - inicio
+
+    # Memória medida em passada separada (tracemalloc distorce a latência)
+    tracemalloc.start()
+    for _ in range(min(repeticoes, 5)):
+        funcao()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    tempos_ms = tempos * 1000
+    return {
+        "p50_ms": round(float(np.percentile(tempos_ms, 50)), 3),
+        "p90_ms": round(float(np.percentile(tempos_ms, 90)), 3),
+        "p99_ms": round(float(np.percentile(tempos_ms, 99)), 3),
+        "media_ms": round(float(tempos_ms.mean()), 3),
+        # Execução em um único processo = throughput por núcleo
+        "ops_por_segundo_por_nucleo": round(float(repeticoes / tempos.sum()), 2),
+        "pico_memoria_kb": round(pico / 1024, 1),
+    }
+
+def executar_benchmark(referencia_dir: Path, resultados_dir: Path, limite: int, repeticoes: int) -> Dict[str, Any]:
+    """Mede cada etapa do caminho de validação sobre as fixtures"""
+    fixtures = coletar_fixtures(referencia_dir, resultados_dir, limite)
+    if not fixtures:
+        raise RuntimeError("Nenhuma foto encontrada para usar como fixture")
+
+    pares = []
+    for foto, numero, nome, camera_id in fixtures:
+        referencia = encontrar_imagem_referencia(numero, nome, camera_id, referencia_dir)
+        if referencia is not None:
+            pares.append((foto, referencia, numero, nome, camera_id))
+    if not pares:
+        raise RuntimeError("Nenhuma foto com referência correspondente")
+
+    imagens = [(processar_imagem(str(f)), processar_imagem(str(r))) for f, r, *_ in pares]
+    indice = {"i": 0}
+
+    def proximo(lista):
+        item = lista[indice["i"] % len(lista)]
+        indice["i"] += 1
+        return item
+
+    def comparar_sem_cache():
+        limpar_cache_referencias()
+        foto, ref, *_ = proximo(pares)
+        comparar_imagem_com_referencia(str(foto), str(ref))
+
+    etapas = {
+        "processar_imagem": lambda: processar_imagem(str(proximo(pares)[0])),
+        "calcular_similaridade_template_matching": lambda: calcular_similaridade_template_matching(*proximo(imagens)),
+        "calcular_similaridade_histograma": lambda: calcular_similaridade_histograma(*proximo(imagens)),
+        "encontrar_imagem_referencia": lambda: encontrar_imagem_referencia(*proximo(pares)[2:], referencia_dir),
+        "comparar_imagem_com_referencia": lambda: comparar_imagem_com_referencia(*(str(p) for p in proximo(pares)[:2])),
+        "comparar_imagem_com_referencia_sem_cache": comparar_sem_cache,
+    }
+
+    resultados = {}
+    for nome, funcao in etapas.items():
+        indice["i"] = 0
+        resultados[nome] = medir(funcao, repeticoes)
+        r = resultados[nome]
+        print(f"⏱️ {nome:45s} p50={r['p50_ms']:8.3f} ms  p90={r['p90_ms']:8.3f} ms  "
+              f"p99={r['p99_ms']:8.3f} ms  {r['ops_por_segundo_por_nucleo']:9.2f} ops/s  "
+              f"pico={r['pico_memoria_kb']:9.1f} KB")
+
+    return {
+        "gerado_em": datetime.now().isoformat(),
+        "maquina": {"python": platform.python_version(), "plataforma": platform.platform(), "processador": platform.processor()},
+        "fixtures": len(pares),
+        "repeticoes": repeticoes,
+        "etapas": resultados,
+    }
+
+def comparar_com_baseline(atual: Dict[str, Any], baseline: Dict[str, Any], limiar: float) -> List[str]:
+    """Lista as etapas cujo p50 piorou mais que o limiar em relação ao baseline"""
+    regressoes = []
+    for nome, medida in atual["etapas"].items():
+        referencia = baseline.get("etapas", {}).get(nome)
+        if not referencia or referencia["p50_ms"] <= 0:
+            continue
+        variacao = medida["p50_ms"] / referencia["p50_ms"] - 1.0
+        simbolo = "❌" if variacao > limiar else "✅"
+        print(f"{simbolo} {nome:45s} {referencia['p50_ms']:8.3f} ms -> {medida['p50_ms']:8.3f} ms ({variacao:+.1%})")
+        if variacao > limiar:
+            regressoes.append(nome)
+    return regressoes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do caminho de validação de imagens")
+    parser.add_argument("--referencias", default="camera_photos_modelo1")
+    parser.add_argument("--resultados", default="test_results")
+    parser.add_argument("--limite", type=int, default=64, help="Máximo de fotos usadas como fixture (0 = todas)")
+    parser.add_argument("--repeticoes", type=int, default=50)
+    parser.add_argument("--baseline", default=str(BASELINE_PADRAO))
+    parser.add_argument("--limiar", type=float, default=LIMIAR_REGRESSAO_PADRAO)
+    parser.add_argument("--salvar-baseline", action="store_true")
+    args = parser.parse_args()
+
+    atual = executar_benchmark(Path(args.referencias), Path(args.resultados), args.limite, args.repeticoes)
+    baseline_path = Path(args.baseline)
+
+    if args.salvar_baseline:
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump(atual, f, indent=2, ensure_ascii=False)
+        print(f"💾 Baseline salvo em: {baseline_path}")
+        sys.exit(0)
+
+    if not baseline_path.exists():
+        print(f"⚠️ Baseline {baseline_path} não encontrado - use --salvar-baseline para criá-lo")
+        sys.exit(0)
+
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    regressoes = comparar_com_baseline(atual, baseline, args.limiar)
+    if regressoes:
+        print(f"❌ Regressão acima de {args.limiar:.0%} em: {', '.join(regressoes)}")
+        sys.exit(1)
+    print("✅ Nenhuma regressão acima do limiar")
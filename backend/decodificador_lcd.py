@@ -0,0 +1,192 @@
+"""
+==============================================
+DECODIFICADOR DE SEGMENTOS DO LCD
+==============================================
+Lê o display do controle (dígitos de 7 segmentos e ícones) a partir de
+máscaras pré-calculadas por modelo. As máscaras viram uma imagem de
+rótulos (um rótulo por segmento) na ROI do display; a leitura é um único
+np.bincount ponderado pela imagem, e cada dígito é traduzido por uma
+tabela de 128 posições. A validação passa a ser uma comparação exata
+com o estado esperado do display para cada botão.
+
+Configuração (ModeloControle.config["lcd"] ou modelos/<nome>_lcd.json),
+retângulos [x, y, largura, altura] relativos à ROI, na resolução 640x480:
+    {
+        "camera_id": 0,
+        "roi": [200, 120, 180, 90],
+        "segmento_escuro": true,
+        "digitos": [{"a": [..], "b": [..], "c": [..], "d": [..], "e": [..], "f": [..], "g": [..]}, ...],
+        "icones": {"AUTO": [..], "TURBO": [..]},
+        "estados_esperados": {"POWER": {"digitos": "24", "icones": ["AUTO"]}, ...}
+    }
+"""
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+import argparse
+import json
+
+import numpy as np
+
+from validacao_imagens import ContextoValidacao, processar_imagem, registrar_etapa_validacao
+
+SEGMENTOS = "abcdefg"
+
+# Contraste mínimo (relativo ao fundo da ROI) para considerar um segmento aceso
+LIMIAR_CONTRASTE = 0.25
+
+# Segmentos com contraste dentro desta faixa em torno do limiar tornam a leitura inconclusiva
+BANDA_INCERTEZA = 0.08
+
+# Segmentos acesos -> caractere
+CARACTERES_7_SEGMENTOS = {
+    "0": "abcdef", "1": "bc", "2": "abdeg", "3": "abcdg", "4": "bcfg",
+    "5": "acdfg", "6": "acdefg", "7": "abc", "8": "abcdefg", "9": "abcdfg",
+    "A": "abcefg", "C": "adef", "E": "adefg", "F": "aefg", "H": "bcefg",
+    "L": "def", "P": "abefg", "-": "g", " ": "",
+}
+
+def _codigo(segmentos: str) -> int:
+    return sum(1 << SEGMENTOS.index(s) for s in segmentos)
+
+# Tabela indexada pelo código de 7 bits (bit 0 = segmento a); "?" = combinação inválida
+TABELA_7_SEGMENTOS = np.full(1 << len(SEGMENTOS), "?", dtype="<U1")
+for _caractere, _segmentos in CARACTERES_7_SEGMENTOS.items():
+    TABELA_7_SEGMENTOS[_codigo(_segmentos)] = _caractere
+
+PESOS_BITS = 1 << np.arange(len(SEGMENTOS))
+
+
+@dataclass
+class EstadoDisplay:
+    """Estado lido do display"""
+    digitos: str
+    icones: List[str]
+    confiavel: bool
+    contraste: np.ndarray = field(repr=False, default=None)
+
+    def resumo(self) -> Dict[str, Any]:
+        return {"digitos": self.digitos, "icones": self.icones, "confiavel": self.confiavel}
+
+    def confere(self, esperado: Dict[str, Any]) -> bool:
+        """Comparação exata; ícones só são conferidos se o estado esperado os listar"""
+        if "digitos" in esperado and self.digitos != esperado["digitos"]:
+            return False
+        if "icones" in esperado and sorted(self.icones) != sorted(esperado["icones"]):
+            return False
+        return True
+
+
+class DecodificadorLCD:
+    """Máscaras de segmentos de um modelo, pré-calculadas como imagem de rótulos"""
+
+    def __init__(self, roi: Sequence[int], digitos: List[Dict[str, Sequence[int]]],
+                 icones: Optional[Dict[str, Sequence[int]]] = None, camera_id: int = 0,
+                 segmento_escuro: bool = True, estados_esperados: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.roi = tuple(int(v) for v in roi)
+        self.camera_id = camera_id
+        self.segmento_escuro = segmento_escuro
+        self.estados_esperados = estados_esperados or {}
+        self.nomes_icones = list((icones or {}).keys())
+        self.total_digitos = len(digitos)
+
+        # Rótulo 0 = fundo; 1..7*N = segmentos dos dígitos; depois os ícones
+        _, _, largura, altura = self.roi
+        self.rotulos = np.zeros((altura, largura), dtype=np.int32)
+        retangulos = [digito[s] for digito in digitos for s in SEGMENTOS]
+        retangulos += [icones[nome] for nome in self.nomes_icones]
+        for rotulo, (x, y, w, h) in enumerate(retangulos, start=1):
+            self.rotulos[y:y + h, x:x + w] = rotulo
+
+        self.total_rotulos = len(retangulos) + 1
+        self._rotulos_flat = self.rotulos.ravel()
+        self._contagem = np.maximum(np.bincount(self._rotulos_flat, minlength=self.total_rotulos), 1)
+
+    @classmethod
+    def de_config(cls, config: Dict[str, Any]) -> "DecodificadorLCD":
+        return cls(
+            roi=config["roi"],
+            digitos=config.get("digitos", []),
+            icones=config.get("icones"),
+            camera_id=config.get("camera_id", 0),
+            segmento_escuro=config.get("segmento_escuro", True),
+            estados_esperados=config.get("estados_esperados"),
+        )
+
+    def decodificar(self, gray: np.ndarray) -> EstadoDisplay:
+        """Lê o display de uma imagem processada (escala de cinza, 640x480)"""
+        x, y, w, h = self.roi
+        janela = gray[y:y + h, x:x + w]
+
+        # Média de intensidade por rótulo em uma única passada
+        medias = np.bincount(self._rotulos_flat, weights=janela.ravel(), minlength=self.total_rotulos) / self._contagem
+        fundo = medias[0]
+        if self.segmento_escuro:
+            contraste = (fundo - medias[1:]) / max(fundo, 1.0)
+        else:
+            contraste = (medias[1:] - fundo) / max(255.0 - fundo, 1.0)
+
+        acesos = contraste >= LIMIAR_CONTRASTE
+        total_segmentos = self.total_digitos * len(SEGMENTOS)
+        codigos = acesos[:total_segmentos].reshape(self.total_digitos, len(SEGMENTOS)) @ PESOS_BITS
+        digitos = "".join(TABELA_7_SEGMENTOS[codigos])
+        icones = [nome for nome, aceso in zip(self.nomes_icones, acesos[total_segmentos:]) if aceso]
+
+        confiavel = not np.any(np.abs(contraste - LIMIAR_CONTRASTE) < BANDA_INCERTEZA) and "?" not in digitos
+        return EstadoDisplay(digitos=digitos, icones=icones, confiavel=confiavel, contraste=contraste)
+
+    def esperado(self, nome_botao: str) -> Optional[Dict[str, Any]]:
+        return self.estados_esperados.get(nome_botao)
+
+    def extras(self, nome_botao: str, camera_id: int) -> Dict[str, Any]:
+        """Extras da cascata para a câmera (vazio se ela não enxerga o display ou não há estado esperado)"""
+        esperado = self.esperado(nome_botao)
+        if camera_id != self.camera_id or esperado is None:
+            return {}
+        return {"lcd": {"decodificador": self, "esperado": esperado}}
+
+
+def carregar_decodificador(config: Dict[str, Any], arquivo: Optional[Path] = None) -> Optional[DecodificadorLCD]:
+    """Decodificador do modelo: config["lcd"] ou, na falta dele, o arquivo <nome>_lcd.json"""
+    config_lcd = config.get("lcd")
+    if config_lcd is None and arquivo is not None and arquivo.exists():
+        with open(arquivo, 'r', encoding='utf-8') as f:
+            config_lcd = json.load(f)
+    if config_lcd is None:
+        return None
+    return DecodificadorLCD.de_config(config_lcd)
+
+def etapa_lcd(ctx: ContextoValidacao) -> Optional[bool]:
+    """Etapa da cascata: compara o display lido com o estado esperado do botão"""
+    lcd = ctx.extras.get("lcd")
+    if lcd is None:
+        return None
+
+    estado = lcd["decodificador"].decodificar(ctx.img_teste)
+    confere = estado.confere(lcd["esperado"])
+    ctx.resultado["lcd"] = {"lido": estado.resumo(), "esperado": lcd["esperado"], "confere": confere}
+    if not estado.confiavel:
+        return None
+
+    ctx.resultado["similaridade_media"] = 1.0 if confere else 0.0
+    return confere
+
+registrar_etapa_validacao("lcd", etapa_lcd)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Decodifica o display de uma imagem com as máscaras de um modelo")
+    parser.add_argument("config", help="JSON com a configuração do LCD")
+    parser.add_argument("imagens", nargs="+")
+    args = parser.parse_args()
+
+    with open(args.config, 'r', encoding='utf-8') as f:
+        decodificador = DecodificadorLCD.de_config(json.load(f))
+
+    for caminho in args.imagens:
+        gray = processar_imagem(caminho)
+        if gray is None:
+            continue
+        estado = decodificador.decodificar(gray)
+        print(f"🔢 {Path(caminho).name}: {estado.resumo()}")
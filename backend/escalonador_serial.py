@@ -0,0 +1,168 @@
+"""
+==============================================
+ESCALONADOR DE ESCRITAS SERIAIS
+==============================================
+Uma thread escritora por porta, dona do port.write (com o serial_lock da
+porta), com duas filas:
+
+    prioritaria - parada de emergência e bytes de tempo real do GRBL
+                  (!, ~, ?, Ctrl-X, 0x85): sai antes de qualquer escrita
+                  normal ainda na fila
+    normal      - comandos da sequência, G-code, GET do Nano, ...
+
+Uma escrita prioritária espera no máximo a escrita normal que já está em
+andamento (cada item normal é uma linha curta). Se essa escrita ficar
+travada por mais de LATENCIA_MAXIMA_S (controle de fluxo, USB parado), ela
+é abortada com cancel_write() para a prioritária passar.
+
+Parada de emergência usa descartar_normais=True: os comandos normais ainda
+na fila (ex.: um P_1 enfileirado) são descartados em vez de saírem depois
+do P_0 de emergência.
+
+A latência de cada faixa (enfileirado -> escrito) é medida e exposta em
+resumo().
+"""
+
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Deque, Dict, Optional, Tuple
+import threading
+import time
+
+import numpy as np
+
+# Bytes de tempo real do GRBL (não passam pelo buffer de linhas)
+BYTES_TEMPO_REAL = (b"!", b"~", b"?", b"\x18", b"\x85")
+# Escrita normal travada por mais que isso com prioritária esperando é abortada
+LATENCIA_MAXIMA_S = 0.05
+AMOSTRAS_LATENCIA = 500
+
+
+class ErroEscalonador(Exception):
+    pass
+
+
+class EstatisticaFaixa:
+    """Latências (ms) de uma faixa: enfileirado -> escrito"""
+
+    def __init__(self):
+        self.amostras: Deque[float] = deque(maxlen=AMOSTRAS_LATENCIA)
+        self.escritas = 0
+        self.maxima_ms = 0.0
+
+    def registrar(self, latencia_ms: float):
+        self.amostras.append(latencia_ms)
+        self.escritas += 1
+        self.maxima_ms = max(self.maxima_ms, latencia_ms)
+
+    def resumo(self) -> Dict[str, Any]:
+        if not self.amostras:
+            return {"escritas": self.escritas}
+        p50, p95, p99 = np.percentile(self.amostras, [50, 95, 99])
+        return {
+            "escritas": self.escritas,
+            "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3),
+            "p99_ms": round(float(p99), 3),
+            "maxima_ms": round(self.maxima_ms, 3),
+        }
+
+
+class EscalonadorSerial:
+    """Escritas de uma porta serial com faixa prioritária"""
+
+    def __init__(self, port, lock: threading.Lock, nome: str = "porta"):
+        self.port = port
+        self.lock = lock
+        self.nome = nome
+        self.condicao = threading.Condition()
+        self.prioritaria: Deque[Tuple[bytes, Future, float]] = deque()
+        self.normal: Deque[Tuple[bytes, Future, float]] = deque()
+        self.estatisticas = {"prioritaria": EstatisticaFaixa(), "normal": EstatisticaFaixa()}
+        self.descartadas = 0
+        self.escritas_abortadas = 0
+        self.escrevendo_desde: Optional[float] = None
+        self.executando = True
+        self.thread = threading.Thread(target=self._loop_escrita, daemon=True, name=f"Escritor-{nome}")
+        self.thread.start()
+
+    def enviar(self, dados: bytes, prioridade: bool = False, descartar_normais: bool = False) -> Future:
+        """Enfileira os bytes; o futuro resolve quando eles foram escritos na porta"""
+        futuro: Future = Future()
+        agora = time.perf_counter()
+        descartados = []
+        with self.condicao:
+            if not self.executando:
+                raise ErroEscalonador(f"Escalonador da {self.nome} parado")
+            if descartar_normais:
+                descartados, self.normal = list(self.normal), deque()
+                self.descartadas += len(descartados)
+            (self.prioritaria if prioridade else self.normal).append((dados, futuro, agora))
+            self.condicao.notify()
+        for dados_descartados, futuro_descartado, _ in descartados:
+            futuro_descartado.set_exception(ErroEscalonador(f"Descartado pela parada: {dados_descartados!r}"))
+        if prioridade and self.escrevendo_desde is not None:
+            # Se a escrita normal em andamento travar, ela é abortada para a prioritária passar
+            threading.Timer(LATENCIA_MAXIMA_S, self._destravar).start()
+        return futuro
+
+    def _destravar(self):
+        desde = self.escrevendo_desde
+        with self.condicao:
+            esperando = bool(self.prioritaria)
+        if esperando and desde is not None and time.perf_counter() - desde > LATENCIA_MAXIMA_S:
+            cancelar = getattr(self.port, "cancel_write", None)
+            if cancelar is not None:
+                self.escritas_abortadas += 1
+                print(f"⚠️ {self.nome}: escrita travada abortada para a faixa prioritária")
+                cancelar()
+
+    def _loop_escrita(self):
+        while True:
+            with self.condicao:
+                self.condicao.wait_for(lambda: self.prioritaria or self.normal or not self.executando)
+                if not self.executando:
+                    break
+                faixa = "prioritaria" if self.prioritaria else "normal"
+                dados, futuro, enfileirado = (self.prioritaria if self.prioritaria else self.normal).popleft()
+            try:
+                with self.lock:
+                    self.escrevendo_desde = time.perf_counter()
+                    self.port.write(dados)
+                self.estatisticas[faixa].registrar((time.perf_counter() - enfileirado) * 1000)
+                futuro.set_result(len(dados))
+            except Exception as e:
+                print(f"❌ {self.nome}: erro ao escrever {dados!r}: {e}")
+                futuro.set_exception(e)
+            finally:
+                self.escrevendo_desde = None
+        self._falhar_pendentes(ErroEscalonador(f"Escalonador da {self.nome} fechado"))
+
+    def _falhar_pendentes(self, erro: Exception):
+        with self.condicao:
+            pendentes = list(self.prioritaria) + list(self.normal)
+            self.prioritaria.clear()
+            self.normal.clear()
+        for _, futuro, _ in pendentes:
+            if not futuro.done():
+                futuro.set_exception(erro)
+
+    def resumo(self) -> Dict[str, Any]:
+        with self.condicao:
+            fila = {"prioritaria": len(self.prioritaria), "normal": len(self.normal)}
+        return {
+            "executando": self.executando,
+            "fila": fila,
+            "latencia": {faixa: e.resumo() for faixa, e in self.estatisticas.items()},
+            "descartadas": self.descartadas,
+            "escritas_abortadas": self.escritas_abortadas,
+        }
+
+    def fechar(self):
+        """Para a thread escritora (a porta continua aberta)"""
+        with self.condicao:
+            self.executando = False
+            self.condicao.notify_all()
+        if self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join(timeout=2)
+        self._falhar_pendentes(ErroEscalonador(f"Escalonador da {self.nome} fechado"))
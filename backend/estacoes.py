@@ -0,0 +1,223 @@
+"""
+==============================================
+ESTAÇÕES (BERÇO 1 E BERÇO 2)
+==============================================
+Cada berço é uma estação com seu próprio Nano de IR, seu subconjunto de
+câmeras, seu diretório de resultados e seu deslocamento no pórtico. As
+duas estações rodam o ciclo ao mesmo tempo; o recurso compartilhado (o
+pórtico XY com o dedo pneumático) é disputado pelo Portico:
+
+    com o pórtico     mover, pressionar, fotos, liberar (e a preparação)
+    sem o pórtico     captura IR, validação das fotos, início do IR
+
+Enquanto um berço espera o Nano entregar o IR ou valida as fotos, o
+pórtico atende o outro berço.
+
+O plano compilado da receita do modelo é adaptado para a estação por
+adaptar_plano(): movimentos deslocados, comandos pneumáticos trocados
+pelos do berço (ex.: {"K2_1": "K3_1"}) e captura IR no Nano do berço.
+O pórtico é devolvido depois de cada botão, então o movimento que a
+receita omite quando o botão repete a posição do anterior volta para o
+plano da estação (o outro berço pode ter levado o pórtico para longe).
+
+Configuração em estacoes.json (chaves sobrescrevem o padrão):
+    {
+        "berco2": {"habilitada": true, "deslocamento": [362.296, 0.0],
+                   "comandos": {"K2_1": "K3_1", "K4_1": "K5_1"}}
+    }
+
+O deslocamento padrão do berço 2 vem da distância entre as guias das
+câmeras 1 e 2 na tela de configuração; o berço 2 começa desabilitado até
+ter deslocamento e comandos calibrados.
+"""
+
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import json
+import re
+import time
+
+from receita_teste import Passo, PlanoExecucao
+
+ESTACOES_CONFIG_PATH = Path("estacoes.json")
+
+ESTACOES_PADRAO = {
+    "berco1": {
+        "descricao": "Berço 1",
+        "nano": "nano1",
+        "cameras": [0, 1],
+        "deslocamento": [0.0, 0.0],
+        "resultados_dir": "test_results/berco1",
+        "habilitada": True,
+    },
+    "berco2": {
+        "descricao": "Berço 2",
+        "nano": "nano2",
+        "cameras": [2, 3],
+        "deslocamento": [362.296, 0.0],
+        "resultados_dir": "test_results/berco2",
+        "habilitada": False,
+    },
+}
+
+_COORDENADA = re.compile(r"([XY])(-?\d+(?:\.\d+)?)")
+
+
+@dataclass
+class Estacao:
+    """Berço de teste: fontes próprias (Nano, câmeras) e estado da execução"""
+    nome: str
+    descricao: str
+    nano: str
+    cameras: Tuple[int, ...]
+    resultados_dir: Path
+    deslocamento: Tuple[float, float] = (0.0, 0.0)
+    comandos: Dict[str, str] = field(default_factory=dict)
+    habilitada: bool = True
+    # Estado da execução
+    executando: bool = False
+    liberada: bool = False
+    ciclo: int = 0
+    modelo: Optional[str] = None
+    botao_atual: Optional[int] = None
+    mensagem: Optional[str] = None
+    ultimo_relatorio: Optional[Dict[str, Any]] = None
+    duracao_ultimo_ciclo_s: Optional[float] = None
+
+    @classmethod
+    def de_config(cls, nome: str, dados: Dict[str, Any]) -> "Estacao":
+        return cls(
+            nome=nome,
+            descricao=dados.get("descricao", nome),
+            nano=dados["nano"],
+            cameras=tuple(int(c) for c in dados["cameras"]),
+            resultados_dir=Path(dados.get("resultados_dir", f"test_results/{nome}")),
+            deslocamento=tuple(float(v) for v in dados.get("deslocamento", (0.0, 0.0))),
+            comandos=dict(dados.get("comandos", {})),
+            habilitada=bool(dados.get("habilitada", True)),
+        )
+
+    def resumo(self) -> Dict[str, Any]:
+        return {
+            "nome": self.nome,
+            "descricao": self.descricao,
+            "habilitada": self.habilitada,
+            "nano": self.nano,
+            "cameras": list(self.cameras),
+            "deslocamento": list(self.deslocamento),
+            "resultados_dir": str(self.resultados_dir),
+            "executando": self.executando,
+            "ciclo": self.ciclo,
+            "modelo": self.modelo,
+            "botao_atual": self.botao_atual,
+            "mensagem": self.mensagem,
+            "duracao_ultimo_ciclo_s": self.duracao_ultimo_ciclo_s,
+        }
+
+
+def carregar_estacoes(arquivo: Path = ESTACOES_CONFIG_PATH) -> Dict[str, Estacao]:
+    """Estações padrão com as chaves de estacoes.json por cima (se o arquivo existir)"""
+    config = {nome: dict(dados) for nome, dados in ESTACOES_PADRAO.items()}
+    if arquivo.exists():
+        try:
+            with open(arquivo, "r", encoding="utf-8") as f:
+                for nome, dados in json.load(f).items():
+                    config.setdefault(nome, {}).update(dados)
+        except Exception as e:
+            print(f"⚠️ Erro ao ler {arquivo}: {e} - usando estações padrão")
+    return {nome: Estacao.de_config(nome, dados) for nome, dados in config.items()}
+
+
+def _deslocar(comando: str, deslocamento: Tuple[float, float]) -> str:
+    dx, dy = deslocamento
+    return _COORDENADA.sub(
+        lambda m: f"{m.group(1)}{round(float(m.group(2)) + (dx if m.group(1) == 'X' else dy), 3)}", comando
+    )
+
+def _adaptar_passos(passos: List[Passo], estacao: Estacao, porta_grbl: Optional[int]) -> List[Passo]:
+    adaptados = []
+    for passo in passos:
+        if passo.acao == "mover" and passo.porta == porta_grbl and any(estacao.deslocamento):
+            passo = replace(passo, comando=_deslocar(passo.comando, estacao.deslocamento))
+        elif passo.comando in estacao.comandos:
+            passo = replace(passo, comando=estacao.comandos[passo.comando])
+        if passo.acao == "capturar_ir":
+            passo = replace(passo, nano=estacao.nano)
+        adaptados.append(passo)
+    return adaptados
+
+def _restaurar_movimentos(botoes: List[Passo]) -> List[Passo]:
+    """Repete o último movimento nos botões que ficaram sem o seu (mesma posição do anterior)"""
+    restaurados: List[Passo] = []
+    ultimo_movimento: Optional[Passo] = None
+    for k, passo in enumerate(botoes):
+        restaurados.append(passo)
+        if passo.acao == "mover":
+            ultimo_movimento = passo
+        elif passo.acao == "iniciar_botao" and ultimo_movimento is not None:
+            proximo = next((p for p in botoes[k + 1:] if p.acao in ("mover", "iniciar_botao")), None)
+            if proximo is None or proximo.acao != "mover":
+                restaurados.append(replace(ultimo_movimento, descricao=f"Movimento {passo.botao + 1}",
+                                           botao=passo.botao))
+    return restaurados
+
+def adaptar_plano(plano: PlanoExecucao, estacao: Estacao) -> PlanoExecucao:
+    """Plano do modelo levado para o berço: deslocamento, comandos pneumáticos, Nano e um movimento por botão"""
+    porta_grbl = plano.portas.get("grbl")
+    botoes = _restaurar_movimentos(_adaptar_passos(plano.botoes, estacao, porta_grbl))
+    return replace(
+        plano,
+        preparacao=_adaptar_passos(plano.preparacao, estacao, porta_grbl),
+        inicio=_adaptar_passos(plano.inicio, estacao, porta_grbl),
+        botoes=botoes,
+        passos_removidos=plano.passos_removidos - (len(botoes) - len(plano.botoes)),
+    )
+
+
+class Portico:
+    """Arbitra o pórtico XY entre as estações (um berço por vez movendo/pressionando)"""
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.dono: Optional[str] = None
+        self.desde: Optional[float] = None
+        self.espera_ms: Dict[str, float] = {}
+        self.uso_ms: Dict[str, float] = {}
+        self.reservas: Dict[str, int] = {}
+
+    async def adquirir(self, estacao: str):
+        """Reserva o pórtico para a estação (sem efeito se ela já o tem)"""
+        if self.dono == estacao:
+            return
+        inicio = time.perf_counter()
+        await self.lock.acquire()
+        self.dono, self.desde = estacao, time.perf_counter()
+        self.espera_ms[estacao] = self.espera_ms.get(estacao, 0.0) + (self.desde - inicio) * 1000
+        self.reservas[estacao] = self.reservas.get(estacao, 0) + 1
+
+    def liberar(self, estacao: str):
+        """Devolve o pórtico (sem efeito se a estação não o tem)"""
+        if self.dono != estacao:
+            return
+        self.uso_ms[estacao] = self.uso_ms.get(estacao, 0.0) + (time.perf_counter() - self.desde) * 1000
+        self.dono, self.desde = None, None
+        self.lock.release()
+
+    @asynccontextmanager
+    async def reservar(self, estacao: str):
+        await self.adquirir(estacao)
+        try:
+            yield
+        finally:
+            self.liberar(estacao)
+
+    def resumo(self) -> Dict[str, Any]:
+        return {
+            "dono": self.dono,
+            "reservas": dict(self.reservas),
+            "espera_ms": {nome: round(ms, 1) for nome, ms in self.espera_ms.items()},
+            "uso_ms": {nome: round(ms, 1) for nome, ms in self.uso_ms.items()},
+        }
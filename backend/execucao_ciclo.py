@@ -0,0 +1,171 @@
+"""
+==============================================
+EXECUÇÃO CANCELÁVEL DO CICLO E PARADA SEGURA
+==============================================
+Toda tarefa de ciclo (sequência com fotos, ciclo de berço, sequência
+antiga sem fotos) é criada pelo RegistroTarefas, com nome e grupo, em
+vez de um asyncio.create_task solto. Assim a parada cancela as tarefas
+de verdade: o CancelledError chega no await em que a tarefa está (pausa
+da receita, captura IR via HTTP, espera do movimento, espera do pórtico)
+em vez de a sequência só perceber libera_envio_comandos no próximo botão.
+
+A parada segura segue uma sequência definida:
+
+    imediatas   - antes de cancelar: feed hold do GRBL e falha dos
+                  movimentos pendentes (as threads que esperam o Idle
+                  são liberadas na hora), dedo solto e IR desligado pela
+                  faixa prioritária
+    cancelamento - cancela as tarefas do grupo e espera elas terminarem
+                   (até TIMEOUT_CANCELAMENTO)
+    finais      - dedo solto de novo (caso uma tarefa tenha pressionado
+                  antes de ser cancelada), espera o GRBL parar e
+                  descarta o planner (soft reset depois do hold mantém
+                  a posição)
+
+Cada etapa tem o tempo medido; o relatório diz quando a máquina ficou
+parada de fato (latencia_parada_ms) e quanto tempo as tarefas levaram
+para sair (latencia_cancelamento_ms).
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import itertools
+import time
+
+TIMEOUT_CANCELAMENTO = 2.0
+
+EtapaParada = Tuple[str, Callable[[], Awaitable[Any]]]
+
+
+class CicloInterrompido(Exception):
+    """O ciclo foi cancelado por uma parada (não é erro do ciclo)"""
+    pass
+
+
+@dataclass
+class TarefaRegistrada:
+    id: int
+    nome: str
+    grupo: str
+    tarefa: asyncio.Task
+    criada_em: str = field(default_factory=lambda: datetime.now().isoformat())
+    _inicio: float = field(default_factory=time.perf_counter, repr=False)
+
+    def resumo(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "nome": self.nome,
+            "grupo": self.grupo,
+            "criada_em": self.criada_em,
+            "duracao_s": round(time.perf_counter() - self._inicio, 3),
+            "cancelando": self.tarefa.cancelling() > 0,
+        }
+
+
+class RegistroTarefas:
+    """Tarefas de ciclo em andamento, por grupo ("ciclo", "estacao:berco1", ...)"""
+
+    def __init__(self):
+        self.tarefas: Dict[int, TarefaRegistrada] = {}
+        self._ids = itertools.count(1)
+
+    def criar(self, nome: str, coro: Awaitable[Any], grupo: str = "ciclo") -> asyncio.Task:
+        tarefa = asyncio.create_task(coro, name=nome)
+        registrada = TarefaRegistrada(next(self._ids), nome, grupo, tarefa)
+        self.tarefas[registrada.id] = registrada
+        tarefa.add_done_callback(lambda t: self._concluida(registrada))
+        return tarefa
+
+    def _concluida(self, registrada: TarefaRegistrada):
+        self.tarefas.pop(registrada.id, None)
+        tarefa = registrada.tarefa
+        if not tarefa.cancelled() and tarefa.exception() is not None:
+            print(f"❌ Tarefa {registrada.nome} terminou com erro: {tarefa.exception()}")
+
+    def ativas(self, grupo: Optional[str] = None) -> List[TarefaRegistrada]:
+        return [r for r in self.tarefas.values() if grupo is None or r.grupo == grupo]
+
+    async def cancelar(self, grupo: Optional[str] = None,
+                       timeout: float = TIMEOUT_CANCELAMENTO) -> Tuple[List[str], List[str]]:
+        """Cancela as tarefas (do grupo) e espera saírem; retorna (canceladas, ainda pendentes)"""
+        alvo = [r for r in self.ativas(grupo) if r.tarefa is not asyncio.current_task()]
+        for registrada in alvo:
+            registrada.tarefa.cancel()
+        if alvo:
+            await asyncio.wait([r.tarefa for r in alvo], timeout=timeout)
+        return [r.nome for r in alvo], [r.nome for r in alvo if not r.tarefa.done()]
+
+    def resumo(self) -> Dict[str, Any]:
+        return {"ativas": [r.resumo() for r in self.tarefas.values()]}
+
+
+@dataclass
+class RelatorioParada:
+    """Resultado de uma parada segura"""
+    motivo: str
+    grupo: Optional[str]
+    solicitada_em: str = field(default_factory=lambda: datetime.now().isoformat())
+    etapas_ms: Dict[str, float] = field(default_factory=dict)
+    erros: Dict[str, str] = field(default_factory=dict)
+    tarefas_canceladas: List[str] = field(default_factory=list)
+    tarefas_pendentes: List[str] = field(default_factory=list)
+    latencia_cancelamento_ms: Optional[float] = None
+    latencia_parada_ms: Optional[float] = None
+    parada_em: Optional[str] = None
+    maquina_parada: bool = False
+
+    def resumo(self) -> Dict[str, Any]:
+        return {
+            "motivo": self.motivo,
+            "grupo": self.grupo,
+            "solicitada_em": self.solicitada_em,
+            "parada_em": self.parada_em,
+            "maquina_parada": self.maquina_parada,
+            "latencia_cancelamento_ms": self.latencia_cancelamento_ms,
+            "latencia_parada_ms": self.latencia_parada_ms,
+            "tarefas_canceladas": self.tarefas_canceladas,
+            "tarefas_pendentes": self.tarefas_pendentes,
+            "etapas_ms": self.etapas_ms,
+            "erros": self.erros,
+        }
+
+
+async def _executar_etapas(etapas: List[EtapaParada], relatorio: RelatorioParada) -> bool:
+    """Roda todas as etapas mesmo que alguma falhe; False se alguma falhou"""
+    ok = True
+    for nome, etapa in etapas:
+        inicio = time.perf_counter()
+        try:
+            await etapa()
+        except Exception as e:
+            ok = False
+            relatorio.erros[nome] = str(e)
+            print(f"⚠️ Parada: etapa {nome} falhou: {e}")
+        relatorio.etapas_ms[nome] = round((time.perf_counter() - inicio) * 1000, 1)
+    return ok
+
+
+async def parada_segura(registro: RegistroTarefas, imediatas: List[EtapaParada], finais: List[EtapaParada],
+                        motivo: str, grupo: Optional[str] = None) -> RelatorioParada:
+    """Etapas imediatas, cancelamento das tarefas do grupo (todas, sem grupo) e etapas finais"""
+    inicio = time.perf_counter()
+    relatorio = RelatorioParada(motivo, grupo)
+    print(f"🛑 Parada segura ({motivo}{f' - {grupo}' if grupo else ''})")
+
+    ok = await _executar_etapas(imediatas, relatorio)
+
+    inicio_cancelamento = time.perf_counter()
+    relatorio.tarefas_canceladas, relatorio.tarefas_pendentes = await registro.cancelar(grupo)
+    relatorio.latencia_cancelamento_ms = round((time.perf_counter() - inicio) * 1000, 1)
+    relatorio.etapas_ms["cancelamento"] = round((time.perf_counter() - inicio_cancelamento) * 1000, 1)
+
+    ok = await _executar_etapas(finais, relatorio) and ok
+
+    relatorio.latencia_parada_ms = round((time.perf_counter() - inicio) * 1000, 1)
+    relatorio.parada_em = datetime.now().isoformat()
+    relatorio.maquina_parada = ok and not relatorio.tarefas_pendentes
+    print(f"{'✅' if relatorio.maquina_parada else '⚠️'} Parada concluída em {relatorio.latencia_parada_ms:.0f} ms "
+          f"(tarefas: {len(relatorio.tarefas_canceladas)} canceladas, {len(relatorio.tarefas_pendentes)} pendentes)")
+    return relatorio
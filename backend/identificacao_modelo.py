@@ -0,0 +1,173 @@
+"""
+==============================================
+IDENTIFICAÇÃO AUTOMÁTICA DO MODELO NO BERÇO
+==============================================
+Índice de vizinho mais próximo com os dHashes (64 bits) das referências
+do primeiro botão de cada modelo registrado, por câmera. Na primeira
+captura do ciclo, o hash de cada câmera é comparado com todo o índice
+de uma vez (XOR + popcount vetorizados): o modelo com menor distância
+média entre as câmeras é o que está no berço.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+import threading
+import time
+
+import numpy as np
+
+from modelos_controle import ModeloControle, RegistroModelos
+from referencia_estatistica import agrupar_capturas_referencia
+from validacao_imagens import calcular_dhash, carregar_referencia, processar_frame
+
+# Distância média (bits) acima da qual nenhum modelo conhecido corresponde ao frame
+LIMIAR_IDENTIFICACAO = 16
+
+# Vantagem mínima (bits) do primeiro colocado sobre o segundo para trocar de modelo
+MARGEM_MINIMA = 4
+
+
+@dataclass
+class ResultadoIdentificacao:
+    """Modelo identificado na primeira captura do ciclo"""
+    modelo: Optional[str]
+    distancia_media: Optional[float]
+    margem: Optional[float]
+    confiavel: bool
+    distancias: Dict[str, float] = field(default_factory=dict)
+    cameras: List[int] = field(default_factory=list)
+    tempo_ms: float = 0.0
+
+    def resumo(self) -> Dict[str, Any]:
+        return {
+            "modelo": self.modelo,
+            "distancia_media": round(self.distancia_media, 2) if self.distancia_media is not None else None,
+            "margem": round(self.margem, 2) if self.margem is not None else None,
+            "confiavel": self.confiavel,
+            "distancias": {nome: round(d, 2) for nome, d in self.distancias.items()},
+            "cameras": self.cameras,
+            "tempo_ms": round(self.tempo_ms, 3),
+        }
+
+
+def _popcount64(valores: np.ndarray) -> np.ndarray:
+    """Conta os bits ligados de cada uint64"""
+    return np.unpackbits(valores.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+class IndiceModelos:
+    """Hashes do primeiro botão de cada modelo, agrupados por câmera"""
+
+    def __init__(self):
+        self.modelos: List[str] = []
+        self._entradas: List[Tuple[int, int, int]] = []  # (índice do modelo, câmera, hash)
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.indices_modelo = np.empty(0, dtype=np.int32)
+        self.cameras = np.empty(0, dtype=np.int32)
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def adicionar(self, modelo: str, camera_id: int, dhash: int):
+        if modelo not in self.modelos:
+            self.modelos.append(modelo)
+        self._entradas.append((self.modelos.index(modelo), camera_id, dhash))
+
+    def finalizar(self) -> "IndiceModelos":
+        """Converte as entradas em arrays contíguos para a consulta vetorizada"""
+        self.indices_modelo = np.array([e[0] for e in self._entradas], dtype=np.int32)
+        self.cameras = np.array([e[1] for e in self._entradas], dtype=np.int32)
+        self.hashes = np.array([e[2] for e in self._entradas], dtype=np.uint64)
+        return self
+
+    def adicionar_modelo(self, modelo: ModeloControle):
+        """Indexa todas as capturas de referência do primeiro botão do modelo"""
+        if not modelo.test_coordinates:
+            return
+        nome_botao = modelo.test_coordinates[0].get('nome', 'Botão 1')
+
+        encontrados = set()
+        for (numero, _, camera_id), caminhos in agrupar_capturas_referencia([modelo.referencia_dir]).items():
+            if numero != 1:
+                continue
+            for caminho in caminhos:
+                _, dhash = carregar_referencia(str(caminho))
+                if dhash is not None:
+                    self.adicionar(modelo.nome, camera_id, dhash)
+                    encontrados.add(camera_id)
+
+        # Sem JPEGs no disco: usa o hash gravado no pacote compilado
+        if modelo.pacote is not None:
+            for camera_id in range(4):
+                if camera_id in encontrados:
+                    continue
+                entrada = modelo.pacote.obter(1, nome_botao, camera_id)
+                if entrada is not None:
+                    self.adicionar(modelo.nome, camera_id, entrada.dhash)
+
+    def consultar(self, hashes_por_camera: Dict[int, int]) -> ResultadoIdentificacao:
+        """Modelo mais próximo: menor distância por câmera, média entre as câmeras"""
+        inicio = time.perf_counter()
+        if not len(self) or not hashes_por_camera:
+            return ResultadoIdentificacao(None, None, None, False, tempo_ms=(time.perf_counter() - inicio) * 1000)
+
+        cameras = sorted(hashes_por_camera)
+        consulta = np.array([hashes_por_camera[c] for c in cameras], dtype=np.uint64)
+        camera_pos = {c: k for k, c in enumerate(cameras)}
+
+        # Só compara entradas das câmeras presentes na consulta
+        mascara = np.isin(self.cameras, cameras)
+        posicoes = np.array([camera_pos.get(int(c), 0) for c in self.cameras[mascara]], dtype=np.int32)
+        distancias = _popcount64(np.bitwise_xor(self.hashes[mascara], consulta[posicoes]))
+
+        # Menor distância por (modelo, câmera) e média entre as câmeras de cada modelo
+        minimas = np.full((len(self.modelos), len(cameras)), np.inf)
+        np.minimum.at(minimas, (self.indices_modelo[mascara], posicoes), distancias)
+        validas = np.isfinite(minimas)
+        contagem = validas.sum(axis=1)
+        medias = np.where(contagem > 0, np.where(validas, minimas, 0).sum(axis=1) / np.maximum(contagem, 1), np.inf)
+
+        ordem = np.argsort(medias)
+        melhor = int(ordem[0])
+        distancia_media = float(medias[melhor])
+        margem = float(medias[ordem[1]] - distancia_media) if len(ordem) > 1 and np.isfinite(medias[ordem[1]]) else None
+
+        encontrado = np.isfinite(distancia_media) and distancia_media <= LIMIAR_IDENTIFICACAO
+        confiavel = bool(encontrado and (margem is None or margem >= MARGEM_MINIMA))
+        return ResultadoIdentificacao(
+            modelo=self.modelos[melhor] if encontrado else None,
+            distancia_media=distancia_media if np.isfinite(distancia_media) else None,
+            margem=margem,
+            confiavel=confiavel,
+            distancias={self.modelos[k]: float(medias[k]) for k in range(len(self.modelos)) if np.isfinite(medias[k])},
+            cameras=cameras,
+            tempo_ms=(time.perf_counter() - inicio) * 1000,
+        )
+
+
+_indice_cache: Optional[Tuple[Tuple, IndiceModelos]] = None
+_indice_lock = threading.Lock()
+
+def obter_indice(registro: RegistroModelos) -> IndiceModelos:
+    """Índice de todos os modelos registrados, reconstruído quando algum modelo é (re)carregado"""
+    global _indice_cache
+    with registro.lock:
+        modelos = list(registro.modelos.values())
+    assinatura = tuple((m.nome, str(m.referencia_dir), m.carregado_em) for m in modelos)
+
+    with _indice_lock:
+        if _indice_cache is not None and _indice_cache[0] == assinatura:
+            return _indice_cache[1]
+
+        indice = IndiceModelos()
+        for modelo in modelos:
+            indice.adicionar_modelo(modelo)
+        indice.finalizar()
+        _indice_cache = (assinatura, indice)
+        print(f"🧭 Índice de modelos construído: {len(indice)} hashes de {len(indice.modelos)} modelo(s)")
+        return indice
+
+def identificar_modelo(registro: RegistroModelos, frames: Dict[int, np.ndarray]) -> ResultadoIdentificacao:
+    """Identifica o modelo no berço a partir dos frames (BGR) da primeira captura"""
+    hashes = {camera_id: calcular_dhash(processar_frame(frame)) for camera_id, frame in frames.items() if frame is not None}
+    return obter_indice(registro).consultar(hashes)
@@ -1,6 +1,42 @@
 from tempfile import template
 from ir_reader import ir_reader, IRReader
-from typing import Dict, Optional, Any
+from validacao_imagens import (
+    CASCATA_CICLO,
+    processar_imagem,
+    calcular_similaridade_template_matching,
+    calcular_similaridade_histograma,
+    encontrar_imagem_referencia,
+    comparar_imagem_com_referencia,
+    comparar_com_referencia_processada,
+    consolidar_validacao_botao,
+    gerar_relatorio_controles,
+    limpar_cache_referencias,
+    processar_frame,
+)
+from pacote_referencia import compilar_pacote
+from modelos_controle import MODELOS_CONFIG_DIR, ModeloControle, RegistroModelos
+from identificacao_modelo import identificar_modelo, obter_indice
+from registro_imagens import RegistroCiclo
+from qualidade_frame import capturar_frame_com_qualidade
+from pipeline_ciclo import PipelineCiclo
+from receita_teste import ErroReceita, Passo, PlanoExecucao, carregar_receita, compilar_receita
+from simulador_ciclo import simular_plano
+from estacoes import Estacao, Portico, adaptar_plano, carregar_estacoes
+from agendador_ciclos import AgendadorCiclos, ErroFilaCheia, PedidoCiclo
+from modos_ciclo import ErroReteste, PlacarControles, Reteste, carregar_reteste, localizar_resultado
+from execucao_ciclo import CicloInterrompido, RegistroTarefas, RelatorioParada, parada_segura
+from tempos_adaptativos import FATOR_ESPERA_MAXIMA, TemposAdaptativos, esperas_receita, medir_estabilizacao
+from movimento_grbl import ControladorGRBL, ErroGRBL, TIMEOUT_SEGURANCA_MOVIMENTO
+from escalonador_serial import BYTES_TEMPO_REAL
+from transporte_serial import Assinatura, LinhaSerial, TransporteSerial
+from portas_seriais import ChavePorta, ConfiguracaoPorta, ErroPorta, carregar_portas
+from referencia_estatistica import (
+    carregar_modelo_referencia,
+    comparar_imagem_com_modelo,
+    construir_modelos_referencia,
+)
+from typing import Dict, List, Optional, Any, Tuple
+from dataclasses import dataclass, field
 from pathlib import Path
 from fastapi import FastAPI, Request, BackgroundTasks
 from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
@@ -42,6 +78,8 @@ class CameraManager:
         self.latest_frame: Optional[np.ndarray] = None
         self.is_running = False
         self.lock = threading.Lock()
+        self.frame_condition = threading.Condition(self.lock)
+        self.frame_count = 0  # Incrementado a cada frame novo (permite esperar pelo próximo)
         self.thread: Optional[threading.Thread] = None
         self.reconnect_attempts = 0
         self.max_reconnect_attempts = 10
@@ -101,6 +139,8 @@ class CameraManager:
                 
                 with self.lock:
                     self.latest_frame = frame.copy()
+                    self.frame_count += 1
+                    self.frame_condition.notify_all()
                     
             except Exception as e:
                 camera_logger.error(f"Erro na captura da câmera {self.camera_id}: {e}")
@@ -146,6 +186,19 @@ class CameraManager:
                 return self.latest_frame.copy()
         return None
     
+    def get_frame_with_count(self) -> Tuple[int, Optional[np.ndarray]]:
+        """Obtém o frame mais recente junto com o seu número no stream"""
+        with self.lock:
+            frame = self.latest_frame.copy() if self.latest_frame is not None else None
+            return self.frame_count, frame
+    
+    def wait_next_frame(self, after_count: int, timeout: float = 0.2) -> Tuple[int, Optional[np.ndarray]]:
+        """Espera um frame mais novo que after_count (retorna o atual se o timeout expirar)"""
+        with self.frame_condition:
+            self.frame_condition.wait_for(lambda: self.frame_count > after_count or not self.is_running, timeout)
+            frame = self.latest_frame.copy() if self.latest_frame is not None else None
+            return self.frame_count, frame
+    
     def is_connected(self) -> bool:
         """Verifica se a câmera está conectada"""
         return self.cap is not None and self.cap.isOpened()
@@ -203,10 +256,16 @@ async def lifespan(app: FastAPI):
         except Exception as e:
             camera_logger.error(f"Erro ao iniciar câmera {camera_id}: {e}")
     
+    # Carrega o modelo ativo (pacote de referência via memmap + modelos estatísticos) em background
+    registro_modelos.pre_carregar(registro_modelos.ativo)
+    
     # Inicia escuta de comando START via pneumática
     pneumatic_task = asyncio.create_task(listen_pneumatic_start())
     print("✅ Escuta pneumática iniciada")
     
+    # Fila de START (um ciclo por vez)
+    agendador_ciclos.iniciar()
+    
     yield
     
     # Shutdown: Parar todas as câmeras
@@ -214,6 +273,9 @@ async def lifespan(app: FastAPI):
     for manager in camera_managers.values():
         manager.stop()
     
+    await agendador_ciclos.parar()
+    await tarefas_ciclo.cancelar()
+    
     # Cancela task pneumática
     pneumatic_task.cancel()
     try:
@@ -264,12 +326,14 @@ libera_envio_comandos = False
 machine_state = MachineState.IDLE
 
 
-# LOCKS PARA SINCRONIZAÇÃO
-serial_lock1 = threading.Lock()
-serial_lock2 = threading.Lock()
-serial_lock3 = threading.Lock()
+# LOCKS PARA SINCRONIZAÇÃO (o lock de escrita de cada porta fica no registro de portas)
 state_lock = threading.Lock()
 
+# Assinaturas por padrão (a linha vai para todas as que casam; ninguém descarta as linhas dos outros)
+PADRAO_START = r"(?i)^START$"                 # porta 1: START da pneumática
+PADRAO_RESPOSTA_PORTA1 = r"(?i)^(?!START$)"   # porta 1: respostas dos relés/pneumática
+PADRAO_DADOS_IR = None                        # porta 3: todas as linhas do Nano IR
+
 
 command_executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix="MachineCmd")
 
@@ -290,11 +354,87 @@ def get_machine_state() -> MachineState:
 
 
 
-# Variáveis globais para as portas seriais
-serial_port1 = None  # Porta para comandos K/P (Arduino/Relés)
-serial_port2 = None  # Porta para comandos G-code (GRBL)
-serial_port3 = None  # Porta para receber dados IR (Nano)
-serial_port4 = None  # Porta adicional
+# Portas seriais por papel (ver portas_seriais.py); os números 1..4 são apelidos das principais:
+# 1 = pneumatica (comandos K/P, Arduino/Relés), 2 = grbl (G-code), 3 = ir (Nano), 4 = auxiliar.
+# Cada porta aberta tem um transporte (ver transporte_serial.py): thread leitora que monta as
+# linhas e thread escritora dona do port.write com o lock da porta - faixa prioritária para
+# emergência e bytes de tempo real do GRBL, faixa normal para o resto (ver escalonador_serial.py)
+portas = carregar_portas()
+
+# Controlador da porta 2 (GRBL): dono das leituras, casa ok/error e consulta o status
+controlador_grbl: Optional[ControladorGRBL] = None
+
+# True: movimentos terminam no ok + Idle do GRBL; False: espera o tempo fixo antigo
+MOVIMENTO_POR_ACK = True
+
+def porta_serial(port_number: ChavePorta):
+    """Porta pyserial aberta para o id ou número (None se desconhecida/desconectada)"""
+    porta = portas.porta(port_number)
+    return porta.serial if porta is not None and porta.conectada else None
+
+def porta_conectada(port_number: ChavePorta) -> bool:
+    return portas.conectada(port_number)
+
+def obter_transporte(port_number: ChavePorta) -> Optional[TransporteSerial]:
+    """Transporte ligado à porta atual (recriado se a porta mudou)"""
+    porta = portas.porta(port_number)
+    return porta.obter_transporte() if porta is not None else None
+
+async def escrever_porta(port_number: ChavePorta, dados: bytes, prioridade: bool = False,
+                         descartar_normais: bool = False, aguardar: bool = True):
+    """Escreve pelo transporte da porta (bytes de tempo real do GRBL sempre na faixa prioritária)"""
+    transporte = obter_transporte(port_number)
+    if transporte is None:
+        raise Exception(f"Porta {port_number} não disponível")
+    futuro = transporte.escrever(dados, prioridade or dados in BYTES_TEMPO_REAL, descartar_normais)
+    if aguardar:
+        await asyncio.wrap_future(futuro)
+
+def assinar_porta(port_number: ChavePorta, nome: str, padrao: Optional[str] = None,
+                  callback=None) -> Optional[Assinatura]:
+    """Assinatura no transporte atual da porta (recriada junto com o transporte)"""
+    transporte = obter_transporte(port_number)
+    if transporte is None:
+        return None
+    return transporte.assinar(nome, padrao, callback)
+
+async def ler_linha_porta(port_number: ChavePorta, nome: str, padrao: Optional[str] = None,
+                          timeout: Optional[float] = None) -> Optional[LinhaSerial]:
+    """Próxima linha da assinatura (None no timeout ou sem porta), sem bloquear o event loop"""
+    assinatura = assinar_porta(port_number, nome, padrao)
+    if assinatura is None:
+        await asyncio.sleep(timeout or 0)
+        return None
+    return await assinatura.ler(timeout)
+
+def obter_controlador_grbl() -> Optional[ControladorGRBL]:
+    """Controlador ligado à porta grbl atual (recriado se a porta mudou)"""
+    global controlador_grbl
+    porta = portas.obter("grbl")
+    if not porta.conectada:
+        return None
+    if controlador_grbl is None or controlador_grbl.port is not porta.serial or not controlador_grbl.executando:
+        if controlador_grbl is not None:
+            controlador_grbl.fechar()
+        controlador_grbl = ControladorGRBL(porta.serial, porta.lock, transporte=porta.obter_transporte())
+    return controlador_grbl
+
+async def enviar_linha_grbl(linha: str):
+    """Linha para o GRBL pelo controlador (mantém a contagem ok/caracteres); escrita direta sem ele"""
+    controlador = obter_controlador_grbl()
+    if controlador is None:
+        await escrever_porta("grbl", f"{linha}\n".encode())
+        return
+    # Espera por espaço no buffer RX fora do event loop; o ok chega pelo futuro do controlador
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, controlador.enviar_linha, linha)
+
+def fechar_controlador_grbl():
+    """Para a thread leitora antes de fechar/trocar a porta grbl"""
+    global controlador_grbl
+    if controlador_grbl is not None:
+        controlador_grbl.fechar()
+        controlador_grbl = None
 
 # Variáveis de controle
 process_running = False
@@ -305,8 +445,12 @@ libera_envio_comandos = False
 fingerdown_running = False
 current_test_cycle = 0
 last_test_report = None  # Armazena o último relatório de validação
+relatorio_em_geracao = None  # Relatório do último ciclo único ainda em segundo plano (reteste "ultimo")
 last_pneumatic_message = None  # Armazena a última mensagem recebida via pneumática
 
+# Diretório de referência do modelo padrão (modelo1)
+REFERENCIA_DIR = Path("camera_photos_modelo1")
+
 
 
 test_coordinates = [
@@ -839,8 +983,8 @@ async def fingerdown():
         print(f"📦 Ciclo de teste: {current_test_cycle}")
         
         # Verificar portas conectadas
-        port1_connected = serial_port1 and serial_port1.is_open
-        port2_connected = serial_port2 and serial_port2.is_open
+        port1_connected = porta_conectada(1)
+        port2_connected = porta_conectada(2)
         
         print(f"🔌 Porta 1 conectada: {port1_connected}")
         print(f"🔌 Porta 2 conectada: {port2_connected}")
@@ -851,26 +995,8 @@ async def fingerdown():
         # VERIFICAÇÃO INICIAL DE ESTADO
         await verificar_estado_inicial()
         
-        # SEQUÊNCIA FINGERDOWN OTIMIZADA
-        # 1. Avançar (Porta 1)
-        await enviar_comando_porta(1, "K2_1", "Avançar", timeout=3.0)
-        
-        # 2. Mover na posição (Porta 2) - COM VERIFICAÇÃO
-        await enviar_comando_porta(2, "G90 X29.787 Y82.987", "Mover para posição inicial", timeout=4.0)
-        
-        # 3. Pressionar (Porta 1)
-        await enviar_comando_porta(1, "P_1", "Pressionar", timeout=1.5)
-        
-        # 4. Travar (Porta 1)
-        await enviar_comando_porta(1, "K4_1", "Travar", timeout=1.0)
-        
-        # 5. Expandir a pilha (Porta 1) - COM CONTROLE
-        await enviar_comando_porta(1, "K7_1", "Expandir pilha - 1º", timeout=0.8)
-        await asyncio.sleep(0.2)  # Pequena pausa entre expansões
-        await enviar_comando_porta(1, "K7_1", "Expandir pilha - 2º", timeout=0.8)
-        
-        # 6. Tirar o pressionamento (Porta 1)
-        await enviar_comando_porta(1, "P_0", "Liberar pressão", timeout=1.0)
+        # SEQUÊNCIA FINGERDOWN (preparação da receita do modelo ativo)
+        await executar_passos(registro_modelos.modelo_ativo.plano_execucao().preparacao)
         
         print("✅ FINGERDOWN 1 CONCLUÍDO")
 
@@ -900,22 +1026,22 @@ async def verificar_estado_inicial():
         print("🔍 Verificando estado inicial...")
         
         # Reset inicial na Porta 2 (GRBL)
-        if serial_port2 and serial_port2.is_open:
-            serial_port2.write(b"\x18\n")  # Ctrl-X - Soft reset
+        controlador = obter_controlador_grbl()
+        if controlador is not None:
+            await escrever_porta(2, b"\x18")  # Ctrl-X - Soft reset (tempo real)
             await asyncio.sleep(1.0)
-            serial_port2.write(b"$X\n")    # Unlock
-            await asyncio.sleep(0.5)
-            serial_port2.write(b"G90\n")   # Absolute positioning
-            await asyncio.sleep(0.2)
-            serial_port2.write(b"G21\n")   # Millimeter units
-            await asyncio.sleep(0.2)
+            controlador.rearmar()  # movimentos liberados depois de uma parada
+            # Unlock, posicionamento absoluto e milímetros transmitidos juntos; espera só os ok
+            futuros = controlador.transmitir(["$X", "G90", "G21"])
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, controlador.aguardar, futuros, 2.0)
             print("✅ Reset GRBL realizado")
         
         # Estado inicial Porta 1
-        if serial_port1 and serial_port1.is_open:
-            serial_port1.write(b"P_0\n")   # Garantir pressionamento liberado
+        if porta_conectada(1):
+            await escrever_porta(1, b"P_0\n")   # Garantir pressionamento liberado
             await asyncio.sleep(0.3)
-            serial_port1.write(b"B1_0\n")  # Garantir IR desligado
+            await escrever_porta(1, b"B1_0\n")  # Garantir IR desligado
             await asyncio.sleep(0.3)
             print("✅ Estado inicial Porta 1 configurado")
             
@@ -927,19 +1053,25 @@ async def enviar_comando_porta(port_number: int, command: str, descricao: str, t
     try:
         print(f"📤 [{port_number}] {descricao}: {command}")
         
-        port = None
-        if port_number == 1:
-            port = serial_port1
-        elif port_number == 2:
-            port = serial_port2
-        elif port_number == 3:
-            port = serial_port3
-            
-        if not port or not port.is_open:
+        if not porta_conectada(port_number):
             raise Exception(f"Porta {port_number} não disponível")
         
+        # Movimento GRBL: termina no ok + Idle (timeout vira só rede de segurança)
+        if port_number == 2 and MOVIMENTO_POR_ACK and command.startswith(('G', 'X', 'Y')):
+            controlador = obter_controlador_grbl()
+            loop = asyncio.get_running_loop()
+            resultado = await loop.run_in_executor(
+                None, controlador.mover, command, max(timeout, TIMEOUT_SEGURANCA_MOVIMENTO)
+            )
+            print(f"✅ [{port_number}] {descricao} concluído em {resultado['tempo_total_ms']:.0f} ms")
+            return resultado
+        
         # Envia comando
-        port.write(f"{command}\n".encode())
+        if port_number == 2 and obter_controlador_grbl():
+            # Mantém o casamento ok/linha do controlador
+            controlador_grbl.enviar_linha(command)
+        else:
+            await escrever_porta(port_number, f"{command}\n".encode())
         
         # Aguarda tempo baseado no comando
         if timeout > 0:
@@ -959,23 +1091,16 @@ async def enviar_comando_porta(port_number: int, command: str, descricao: str, t
 async def verificar_status_grbl():
     """Verifica status do GRBL para garantir que está pronto"""
     try:
-        if serial_port2 and serial_port2.is_open:
-            # Limpa buffer
-            while serial_port2.in_waiting > 0:
-                serial_port2.read(serial_port2.in_waiting)
-            
-            # Solicita status
-            serial_port2.write(b"?\n")
-            await asyncio.sleep(0.1)
-            
-            # Lê resposta
-            if serial_port2.in_waiting > 0:
-                status = serial_port2.read(serial_port2.in_waiting).decode().strip()
-                if 'Idle' not in status and 'Run' not in status:
-                    print(f"⚠️ Status GRBL não ideal: {status}")
-                    # Tenta recuperar
-                    serial_port2.write(b"$X\n")
-                    await asyncio.sleep(0.5)
+        controlador = obter_controlador_grbl()
+        if controlador is not None:
+            # A thread leitora do controlador é dona das leituras da porta 2
+            loop = asyncio.get_running_loop()
+            status = await loop.run_in_executor(None, controlador.consultar_status)
+            if status is None or status.estado not in ('Idle', 'Run'):
+                print(f"⚠️ Status GRBL não ideal: {status.bruto if status else 'sem resposta'}")
+                # Tenta recuperar
+                controlador.enviar_linha("$X")
+                await asyncio.sleep(0.5)
                     
     except Exception as e:
         print(f"⚠️ Erro na verificação GRBL: {e}")
@@ -985,13 +1110,19 @@ async def emergency_stop():
     try:
         print("🛑 EMERGENCY STOP ATIVADO")
         
-        if serial_port1 and serial_port1.is_open:
-            serial_port1.write(b"P_0\n")
-            serial_port1.write(b"B1_0\n")
+        # Faixa prioritária: passa na frente (e descarta) os comandos normais na fila
+        if porta_conectada(1):
+            await escrever_porta(1, b"P_0\n", prioridade=True, descartar_normais=True)
+            await escrever_porta(1, b"B1_0\n", prioridade=True)
             
-        if serial_port2 and serial_port2.is_open:
-            serial_port2.write(b"\x85\n")  # Stop Jog
-            serial_port2.write(b"P_0\n")
+        if porta_conectada(2):
+            # Stop Jog (tempo real); as linhas de G-code na fila não são descartadas aqui: o
+            # controlador conta cada uma no buffer RX do GRBL (a parada usa controlador.abortar)
+            await escrever_porta(2, b"\x85")
+            try:
+                await enviar_linha_grbl("P_0")
+            except (ErroGRBL, TimeoutError) as e:
+                print(f"⚠️ Emergency stop: P_0 não enviado ao GRBL: {e}")
             
         await asyncio.sleep(1.0)
         print("✅ Emergency stop concluído")
@@ -1010,12 +1141,11 @@ async def inicio1():
         libera_envio_comandos = True
         linha_atual = 0
         
-        # Envia comando para iniciar IR
-        await enviar_comando_porta(1, "B1_1", "Iniciar IR", timeout=0.5)
-        await enviar_comando_porta(1, "B1_1", "Iniciar IR - 2º", timeout=2.5)
+        # Envia comando para iniciar IR (início da receita do modelo ativo)
+        await executar_passos(registro_modelos.modelo_ativo.plano_execucao().inicio)
         
         # Inicia sequência de comandos
-        asyncio.create_task(executar_sequencia_comandos())
+        tarefas_ciclo.criar("sequencia_comandos", executar_sequencia_comandos())
         
         return {"status": "success", "message": "Início1 executado"}
         
@@ -1034,7 +1164,7 @@ async def inicio1():
 # =========================
 
 @app.post("/send_command/{port_number}")
-async def send_command_endpoint(port_number: int, request: Request):
+async def send_command_endpoint(port_number: str, request: Request):
     """Endpoint para receber comandos do frontend"""
     try:
         # Parse do JSON do body
@@ -1059,29 +1189,21 @@ async def send_command_endpoint(port_number: int, request: Request):
         print(f"❌ Erro no endpoint send_command: {e}")
         return {"status": "error", "message": str(e)}
 
-async def send_raw_command(port_number: int, command: str):
-    """Envia comando direto para porta serial"""
-    global serial_port1, serial_port2, serial_port3, serial_port4
-    
+async def send_raw_command(port_number: ChavePorta, command: str):
+    """Envia comando direto para porta serial (id da porta ou número 1..4)"""
     try:
-        port = None
-        if port_number == 1:
-            port = serial_port1
-        elif port_number == 2:
-            port = serial_port2
-        elif port_number == 3:
-            port = serial_port3
-        elif port_number == 4:
-            port = serial_port4
-        else:
+        porta = portas.porta(port_number)
+        if porta is None:
             return {"status": "error", "message": f"Porta {port_number} inválida"}
         
-        if not port or not port.is_open:
+        if not porta.conectada:
             return {"status": "error", "message": f"Porta {port_number} não conectada"}
         
-        # Envia comando
-        command_bytes = f"{command}\n".encode()
-        port.write(command_bytes)
+        # Envia comando (porta grbl pelo controlador para manter o casamento ok/linha)
+        if porta.id == "grbl" and obter_controlador_grbl():
+            controlador_grbl.enviar_linha(command)
+        else:
+            await escrever_porta(port_number, f"{command}\n".encode())
         
         print(f"✅ Comando enviado para porta {port_number}: {command}")
         
@@ -1092,7 +1214,7 @@ async def send_raw_command(port_number: int, command: str):
             "status": "success", 
             "message": f"Comando '{command}' enviado para porta {port_number}",
             "command": command,
-            "port": port_number
+            "port": porta.numero if porta.numero is not None else porta.id
         }
         
     except Exception as e:
@@ -1100,7 +1222,7 @@ async def send_raw_command(port_number: int, command: str):
         print(f"❌ {error_msg}")
         return {"status": "error", "message": error_msg}
 
-async def start_calibration_sequence(port_number: int):
+async def start_calibration_sequence(port_number: ChavePorta):
     """Inicia sequência de calibração"""
     try:
         print("🔧 Iniciando calibração...")
@@ -1121,7 +1243,7 @@ async def start_calibration_sequence(port_number: int):
     except Exception as e:
         return {"status": "error", "message": f"Erro na calibração: {str(e)}"}
 
-async def start_test_sequence(port_number: int):
+async def start_test_sequence(port_number: ChavePorta):
     """Inicia sequência de teste"""
     try:
         print("🧪 Iniciando teste...")
@@ -1154,41 +1276,19 @@ async def executar_sequencia_comandos():
     # Lista para armazenar TODOS os dados IR capturados
     todos_dados_ir = []
     
+    # Modelo ativo no início do ciclo
+    estado = EstadoSequencia(modelo=registro_modelos.modelo_ativo, com_fotos=False)
+    
     try:
-        print(f"🎯 INICIANDO SEQUÊNCIA DE {len(test_coordinates)} COMANDOS")
+        print(f"🎯 INICIANDO SEQUÊNCIA DE {len(estado.modelo.test_coordinates)} COMANDOS")
         print("📝 Modo: UM único JSON consolidado com todos os botões")
         print("🔘 AGORA COM PRESSIONAMENTO DE BOTÕES!")
         
-        for i, coord in enumerate(test_coordinates):
-            if not libera_envio_comandos:
-                print("⏸️ Sequência interrompida")
-                break
-                
-            linha_atual = i
-            nome_botao = coord.get('nome', f'Botão {i+1}')
-            print(f"🔹 Comando {i+1}/{len(test_coordinates)} - {nome_botao}")
-            
-            # 1. Move para posição
-            command = f"{coord['command']} X{coord['x']} Y{coord['y']}"
-            await enviar_comando_porta(2, command, f"Movimento {i+1}", timeout=1.5)
-            
-            # 2. ✅ CORREÇÃO: PRESSIONA O BOTÃO antes de capturar IR
-            print(f"🔘 [{i+1}] Pressionando botão {nome_botao}...")
-            
-            # Pressiona o botão
-            await enviar_comando_porta(1, "P_1", f"Pressionar {nome_botao}", timeout=0.3)
-            await asyncio.sleep(0.2)  # Pequena pausa para estabilização
-            
-            # Libera o botão
-            await enviar_comando_porta(1, "P_0", f"Liberar {nome_botao}", timeout=0.3)
-            
-            # 3. Captura dados IR APÓS pressionar o botão
-            print(f"📡 [{i+1}] Capturando dados IR após pressionar {nome_botao}...")
-            resultado_ir = await capturar_dados_ir(
-                nano='nano1',
-                timeout=8000,
-                salvar_captura=False  # NÃO salva individualmente
-            )
+        await executar_plano_botoes(estado)
+        
+        # 4. Junta os dados IR pelo número do botão
+        for i, coord, nome_botao in sorted(estado.botoes_pressionados, key=lambda b: b[0]):
+            resultado_ir = resultado_ir_do_botao(estado, i + 1)
             
             # Adiciona à lista consolidada
             if resultado_ir.get('success'):
@@ -1205,13 +1305,9 @@ async def executar_sequencia_comandos():
                 print(f"✅ [{i+1}] Botão pressionado e dados IR capturados")
             else:
                 print(f"❌ [{i+1}] Falha na captura IR: {resultado_ir.get('error')}")
-            
-            # 4. Pequena pausa entre comandos
-            if i < len(test_coordinates) - 1:
-                await asyncio.sleep(1.0)
         
         print("✅ SEQUÊNCIA DE COMANDOS CONCLUÍDA")
-        print(f"📊 Total de botões pressionados: {len(todos_dados_ir)}")
+        print(f"📊 Total de botões pressionados: {len(todos_dados_ir)} - pipeline: {estado.pipeline.resumo()}")
         
         # 5. SALVA UM ÚNICO JSON COM TODOS OS DADOS
         if todos_dados_ir:
@@ -1229,140 +1325,7 @@ async def executar_sequencia_comandos():
 # =========================
 # SISTEMA DE COMPARAÇÃO DE IMAGENS
 # =========================
-
-def processar_imagem(img_path: str) -> np.ndarray:
-    """Processa imagem: carrega, redimensiona, converte para escala de cinza e normaliza"""
-    try:
-        img = cv2.imread(str(img_path))
-        if img is None:
-            raise ValueError(f"Não foi possível carregar imagem: {img_path}")
-        
-        # Redimensiona para tamanho padrão (640x480)
-        img = cv2.resize(img, (640, 480))
-        
-        # Converte para escala de cinza
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        
-        # Aplica blur para reduzir ruído
-        gray = cv2.GaussianBlur(gray, (5, 5), 0)
-        
-        # Normaliza
-        gray = cv2.normalize(gray, None, 0, 255, cv2.NORM_MINMAX)
-        
-        return gray
-    except Exception as e:
-        print(f"❌ Erro ao processar imagem {img_path}: {e}")
-        return None
-
-def calcular_similaridade_template_matching(img1: np.ndarray, img2: np.ndarray) -> float:
-    """Calcula similaridade usando template matching"""
-    try:
-        if img1 is None or img2 is None:
-            return 0.0
-        
-        # Garante que as imagens têm o mesmo tamanho
-        if img1.shape != img2.shape:
-            img2 = cv2.resize(img2, (img1.shape[1], img1.shape[0]))
-        
-        # Template matching
-        result = cv2.matchTemplate(img1, img2, cv2.TM_CCOEFF_NORMED)
-        similarity = float(result[0][0])
-        return max(0.0, similarity)  # Garante que não seja negativo
-    except Exception as e:
-        print(f"❌ Erro ao calcular template matching: {e}")
-        return 0.0
-
-def calcular_similaridade_histograma(img1: np.ndarray, img2: np.ndarray) -> float:
-    """Calcula similaridade usando histograma"""
-    try:
-        if img1 is None or img2 is None:
-            return 0.0
-        
-        # Garante que as imagens têm o mesmo tamanho
-        if img1.shape != img2.shape:
-            img2 = cv2.resize(img2, (img1.shape[1], img1.shape[0]))
-        
-        # Calcula histogramas
-        hist1 = cv2.calcHist([img1], [0], None, [256], [0, 256])
-        hist2 = cv2.calcHist([img2], [0], None, [256], [0, 256])
-        
-        # Normaliza histogramas
-        hist1 = cv2.normalize(hist1, hist1).flatten()
-        hist2 = cv2.normalize(hist2, hist2).flatten()
-        
-        # Calcula correlação
-        correlation = cv2.compareHist(hist1, hist2, cv2.HISTCMP_CORREL)
-        return float(correlation)
-    except Exception as e:
-        print(f"❌ Erro ao calcular similaridade de histograma: {e}")
-        return 0.0
-
-def encontrar_imagem_referencia(botao_numero: int, nome_botao: str, camera_id: int, referencia_dir: Path) -> Optional[Path]:
-    """Encontra imagem de referência correspondente"""
-    try:
-        nome_botao_clean = nome_botao.replace(' ', '_').replace('-', '_').upper()
-        
-        # Padrões de busca
-        patterns = [
-            f"botao_{botao_numero:03d}_{nome_botao_clean}_camera_{camera_id}_*.jpg",
-            f"botao_{botao_numero:03d}_*_{nome_botao_clean}_*_camera_{camera_id}_*.jpg",
-            f"*{nome_botao_clean}*camera_{camera_id}*.jpg",
-            f"*botao_{botao_numero:03d}*camera_{camera_id}*.jpg"
-        ]
-        
-        for pattern in patterns:
-            matches = list(referencia_dir.glob(pattern))
-            if matches:
-                # Retorna a mais recente se houver múltiplas
-                return max(matches, key=lambda p: p.stat().st_mtime)
-        
-        return None
-    except Exception as e:
-        print(f"❌ Erro ao buscar imagem de referência: {e}")
-        return None
-
-def comparar_imagem_com_referencia(imagem_teste_path: str, imagem_ref_path: str, threshold: float = 0.75) -> Dict[str, Any]:
-    """Compara imagem de teste com imagem de referência"""
-    try:
-        # Processa ambas as imagens
-        img_teste = processar_imagem(imagem_teste_path)
-        img_ref = processar_imagem(imagem_ref_path)
-        
-        if img_teste is None or img_ref is None:
-            return {
-                "aprovado": False,
-                "similaridade_template": 0.0,
-                "similaridade_hist": 0.0,
-                "similaridade_media": 0.0,
-                "erro": "Erro ao processar imagens"
-            }
-        
-        # Calcula similaridades
-        template_score = calcular_similaridade_template_matching(img_teste, img_ref)
-        hist_score = calcular_similaridade_histograma(img_teste, img_ref)
-        
-        # Média ponderada (template matching tem mais peso)
-        similaridade_media = (template_score * 0.7) + (hist_score * 0.3)
-        
-        # Determina aprovação
-        aprovado = similaridade_media >= threshold
-        
-        return {
-            "aprovado": aprovado,
-            "similaridade_template": round(template_score, 4),
-            "similaridade_hist": round(hist_score, 4),
-            "similaridade_media": round(similaridade_media, 4),
-            "threshold": threshold
-        }
-    except Exception as e:
-        print(f"❌ Erro ao comparar imagens: {e}")
-        return {
-            "aprovado": False,
-            "similaridade_template": 0.0,
-            "similaridade_hist": 0.0,
-            "similaridade_media": 0.0,
-            "erro": str(e)
-        }
+# Pré-processamento, métricas e cascata de validação (CASCATA_CICLO) em validacao_imagens.py
 
 # Mapeamento de botões para controles (baseado no RemoteControlContainer)
 MAPEAMENTO_CONTROLES = {
@@ -1384,92 +1347,50 @@ MAPEAMENTO_CONTROLES = {
     }
 }
 
-def obter_controle_do_botao(nome_botao: str) -> int:
+# Registro de modelos: modelo1 (coordenadas acima) + modelos/<nome>.json
+registro_modelos = RegistroModelos()
+registro_modelos.registrar(ModeloControle(
+    nome="modelo1",
+    test_coordinates=test_coordinates,
+    referencia_dir=REFERENCIA_DIR,
+))
+registro_modelos.carregar_diretorio()
+
+# Identificação do modelo no berço na primeira captura do ciclo
+# "trocar": troca para o modelo identificado (se confiável); "abortar": interrompe o ciclo
+IDENTIFICACAO_MODELO_ATIVA = True
+ACAO_MODELO_DIVERGENTE = "trocar"
+
+# START da pneumática em modo fail-fast (para quando a reprovação já está decidida)
+FAIL_FAST_PADRAO = False
+
+# Berço 1 e Berço 2 rodando em paralelo; o pórtico XY é disputado entre eles (ver estacoes.py)
+estacoes: Dict[str, Estacao] = carregar_estacoes()
+portico = Portico()
+
+# Tarefas de ciclo canceláveis pela parada segura (ver execucao_ciclo.py)
+tarefas_ciclo = RegistroTarefas()
+ultima_parada: Optional[RelatorioParada] = None
+# Último ciclo único terminou cancelado por uma parada
+ciclo_interrompido = False
+
+def obter_controle_do_botao(nome_botao: str, coordenadas: Optional[list] = None) -> int:
     """Retorna o número do controle baseado no nome do botão"""
     # Por padrão, todos os botões são testados em todos os 4 controles
     # Mas podemos mapear baseado na posição na sequência
     # Por enquanto, retorna baseado no índice do botão na sequência
-    for i, coord in enumerate(test_coordinates):
+    for i, coord in enumerate(coordenadas if coordenadas is not None else test_coordinates):
         if coord.get('nome') == nome_botao:
             # Distribui os botões entre os 4 controles
             return (i % 4) + 1
     return 1  # Default
 
-def gerar_relatorio_controles(resultados_validacao: list) -> Dict[str, Any]:
-    """Gera relatório final de aprovação/reprovação por controle"""
-    # Agrupa resultados por controle
-    controles_resultados = {1: [], 2: [], 3: [], 4: []}
-    
-    for resultado in resultados_validacao:
-        controle_num = resultado.get('controle_numero', 1)
-        if controle_num in controles_resultados:
-            controles_resultados[controle_num].append(resultado)
-    
-    relatorio = {
-        "controles": {},
-        "resumo": {
-            "total_controles": 4,
-            "controles_aprovados": 0,
-            "controles_reprovados": 0
-        }
-    }
-    
-    for controle_num in range(1, 5):
-        resultados_controle = controles_resultados[controle_num]
-        
-        if not resultados_controle:
-            relatorio["controles"][controle_num] = {
-                "status": "sem_dados",
-                "aprovado": False,
-                "total_botoes": 0,
-                "botoes_aprovados": 0,
-                "botoes_reprovados": 0,
-                "taxa_aprovacao": 0.0,
-                "similaridade_media": 0.0,
-                "botoes": []
-            }
-            continue
-        
-        # Calcula estatísticas
-        total_botoes = len(resultados_controle)
-        botoes_aprovados = sum(1 for r in resultados_controle if r.get('validacao', {}).get('aprovado', False))
-        botoes_reprovados = total_botoes - botoes_aprovados
-        
-        # Calcula similaridade média
-        similaridades = [r.get('validacao', {}).get('similaridade_media', 0.0) for r in resultados_controle]
-        similaridade_media = sum(similaridades) / len(similaridades) if similaridades else 0.0
-        
-        # Controle é aprovado se pelo menos 80% dos botões foram aprovados
-        taxa_aprovacao = botoes_aprovados / total_botoes if total_botoes > 0 else 0.0
-        controle_aprovado = taxa_aprovacao >= 0.8 and similaridade_media >= 0.70
-        
-        relatorio["controles"][controle_num] = {
-            "status": "aprovado" if controle_aprovado else "reprovado",
-            "aprovado": controle_aprovado,
-            "total_botoes": total_botoes,
-            "botoes_aprovados": botoes_aprovados,
-            "botoes_reprovados": botoes_reprovados,
-            "taxa_aprovacao": round(taxa_aprovacao * 100, 2),
-            "similaridade_media": round(similaridade_media, 4),
-            "botoes": [
-                {
-                    "nome": r.get('nome_botao'),
-                    "aprovado": r.get('validacao', {}).get('aprovado', False),
-                    "similaridade": r.get('validacao', {}).get('similaridade_media', 0.0)
-                }
-                for r in resultados_controle
-            ]
-        }
-        
-        if controle_aprovado:
-            relatorio["resumo"]["controles_aprovados"] += 1
-        else:
-            relatorio["resumo"]["controles_reprovados"] += 1
+def limpar_imagens_teste(ciclos: Optional[List[Path]] = None):
+    """Limpa as imagens capturadas durante os testes anteriores (NÃO as imagens de referência)
     
-    return relatorio
-
-def limpar_imagens_teste():
-    """Limpa as imagens capturadas durante os testes anteriores (NÃO as imagens de referência)"""
+    ciclos: diretórios listados antes de o novo ciclo começar (a limpeza roda em segundo
+    plano e não pode pegar as fotos do ciclo que está sendo gravado)
+    """
     try:
         resultados_dir = Path("test_results")
         if not resultados_dir.exists():
@@ -1478,7 +1399,7 @@ def limpar_imagens_teste():
         deleted_count = 0
         
         # Lista todos os diretórios de ciclos anteriores
-        for ciclo_dir in resultados_dir.glob("ciclo_*"):
+        for ciclo_dir in (resultados_dir.glob("ciclo_*") if ciclos is None else ciclos):
             if ciclo_dir.is_dir():
                 # Limpa todas as fotos dentro do diretório fotos/ do ciclo
                 fotos_dir = ciclo_dir / "fotos"
@@ -1509,9 +1430,594 @@ def limpar_imagens_teste():
     except Exception as e:
         print(f"⚠️ Erro ao limpar imagens de teste: {e}")
 
-async def executar_sequencia_comandos_com_fotos():
-    """Executa a sequência completa COM CAPTURA DE FOTOS de todas as câmeras a cada botão pressionado"""
-    global linha_atual, libera_envio_comandos, current_test_cycle, last_pneumatic_message, last_test_report
+async def capturar_frames_cameras(cameras: Optional[Tuple[int, ...]] = None) -> Dict[int, Tuple[Any, Any, int]]:
+    """Frames das câmeras conectadas (todas ou as do berço, em paralelo), já passados pelo controle de qualidade"""
+    loop = asyncio.get_running_loop()
+    cameras = tuple(range(MAX_CAMERAS)) if cameras is None else cameras
+    conectadas = {
+        camera_id: manager
+        for camera_id in cameras
+        if (manager := camera_managers.get(camera_id)) and manager.is_connected()
+    }
+    for camera_id in cameras:
+        if camera_id not in conectadas:
+            print(f"  ⚠️ Câmera {camera_id} não conectada")
+    
+    # Frame desfocado/saturado/obstruído é trocado pelo próximo do stream
+    resultados = await asyncio.gather(
+        *(loop.run_in_executor(None, capturar_frame_com_qualidade, manager) for manager in conectadas.values()),
+        return_exceptions=True
+    )
+    capturas = {}
+    for camera_id, resultado in zip(conectadas, resultados):
+        if isinstance(resultado, Exception):
+            print(f"  ❌ Erro ao capturar foto da câmera {camera_id}: {resultado}")
+        elif resultado[0] is None:
+            print(f"  ⚠️ Câmera {camera_id} sem frame disponível")
+        else:
+            capturas[camera_id] = resultado
+    return capturas
+
+def validar_fotos_botao(capturas: Dict[int, Tuple[Any, Any, int]], botao_numero: int, nome_botao: str,
+                        modelo: ModeloControle, pacote_referencia, registro_ciclo: RegistroCiclo,
+                        ciclo_fotos_dir: Path) -> Tuple[list, list]:
+    """Grava as fotos do botão e compara cada uma com a referência (roda fora do event loop)"""
+    fotos_capturadas = []
+    validacoes_fotos = []
+    # Normaliza nome do botão para o nome do arquivo
+    nome_botao_arquivo = nome_botao.replace(' ', '_').replace('-', '_').upper()
+    
+    # Diretório de referência
+    referencia_dir = modelo.referencia_dir
+    
+    for camera_id, (frame, qualidade, recapturas) in sorted(capturas.items()):
+        try:
+            if recapturas or not qualidade.aprovado:
+                print(f"  🔁 Câmera {camera_id}: {recapturas} recaptura(s) - qualidade {qualidade.resumo()}")
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+            filename = f"botao_{botao_numero:03d}_{nome_botao_arquivo}_camera_{camera_id}_{timestamp}.jpg"
+            # Salva na pasta de fotos do ciclo
+            filepath = ciclo_fotos_dir / filename
+            cv2.imwrite(str(filepath), frame)
+            
+            # 🔍 COMPARA COM IMAGEM DE REFERÊNCIA
+            entrada_ref = pacote_referencia.obter(botao_numero, nome_botao, camera_id) if pacote_referencia else None
+            img_ref_path = None if entrada_ref else encontrar_imagem_referencia(botao_numero, nome_botao, camera_id, referencia_dir)
+            modelo_ref = carregar_modelo_referencia(botao_numero, nome_botao, camera_id, modelo.modelos_estatisticos_dir)
+            # Estado esperado do display (só para a câmera que enxerga o LCD)
+            extras_lcd = modelo.decodificador_lcd.extras(nome_botao, camera_id) if modelo.decodificador_lcd else {}
+            
+            validacao = {
+                "camera_id": camera_id,
+                "aprovado": False,
+                "similaridade_media": 0.0,
+                "imagem_referencia_encontrada": False,
+                "qualidade_frame": {**qualidade.resumo(), "recapturas": recapturas}
+            }
+            
+            resultado_comparacao = None
+            if not qualidade.aprovado:
+                # Frame ruim mesmo após as recapturas: não gasta a comparação completa
+                validacao["imagem_referencia_encontrada"] = bool(entrada_ref is not None or img_ref_path or modelo_ref is not None)
+                validacao["erro"] = f"Frame reprovado no controle de qualidade: {', '.join(qualidade.motivos)}"
+                print(f"  ❌ REPROVADO Câmera {camera_id}: {validacao['erro']}")
+            elif entrada_ref is not None:
+                # Referência do pacote (memmap) comparada direto com o frame em memória
+                resultado_comparacao = comparar_com_referencia_processada(
+                    processar_frame(frame), entrada_ref.gray, entrada_ref.dhash,
+                    cascata=CASCATA_CICLO,
+                    extras={"modelo_estatistico": modelo_ref, "hist_ref": entrada_ref.hist, **extras_lcd},
+                    registro=registro_ciclo,
+                    camera_id=camera_id
+                )
+                validacao["imagem_referencia"] = f"{pacote_referencia.caminho.name}:{entrada_ref.chave}"
+            elif img_ref_path and img_ref_path.exists():
+                resultado_comparacao = comparar_imagem_com_referencia(
+                    str(filepath), str(img_ref_path),
+                    cascata=CASCATA_CICLO,
+                    extras={"modelo_estatistico": modelo_ref, **extras_lcd},
+                    registro=registro_ciclo,
+                    camera_id=camera_id
+                )
+                validacao["imagem_referencia"] = str(img_ref_path)
+            elif modelo_ref is not None:
+                # Sem JPEG de referência, mas com modelo estatístico construído
+                resultado_comparacao = comparar_imagem_com_modelo(str(filepath), modelo_ref)
+            
+            if resultado_comparacao is not None:
+                validacao.update(resultado_comparacao)
+                validacao["imagem_referencia_encontrada"] = True
+                
+                status = "✅ APROVADO" if resultado_comparacao["aprovado"] else "❌ REPROVADO"
+                print(f"  {status} Câmera {camera_id}: Similaridade {resultado_comparacao['similaridade_media']:.2%} (etapa: {resultado_comparacao.get('etapa_decisiva')})")
+            elif qualidade.aprovado:
+                print(f"  ⚠️ Câmera {camera_id}: Imagem de referência não encontrada")
+                validacao["erro"] = "Imagem de referência não encontrada"
+            
+            fotos_capturadas.append({
+                "camera_id": camera_id,
+                "filename": filename,
+                "filepath": str(filepath)
+            })
+            validacoes_fotos.append(validacao)
+            print(f"  ✅ Foto câmera {camera_id} salva: {filename}")
+        except Exception as e:
+            print(f"  ❌ Erro ao validar foto da câmera {camera_id}: {e}")
+    
+    return fotos_capturadas, validacoes_fotos
+
+async def validar_fotos_botao_em_ordem(pipeline: PipelineCiclo, anterior: Optional[int], *args) -> Tuple[list, list]:
+    """Validação do botão em segundo plano, depois da validação do botão anterior (hazard do RegistroCiclo)"""
+    await pipeline.aguardar("validacao", anterior)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, validar_fotos_botao, *args)
+
+@dataclass
+class EstadoSequencia:
+    """Estado de uma execução do plano de botões pelo motor"""
+    modelo: ModeloControle
+    com_fotos: bool
+    ciclo_fotos_dir: Optional[Path] = None
+    # IR e validação de cada botão correm em segundo plano durante o movimento para o próximo
+    pipeline: PipelineCiclo = field(default_factory=PipelineCiclo)
+    # Registro de imagens do ciclo: transformação por câmera estimada no primeiro botão
+    registro_ciclo: RegistroCiclo = field(default_factory=RegistroCiclo)
+    capturas: Dict[int, Dict[int, Tuple[Any, Any, int]]] = field(default_factory=dict)
+    botoes_pressionados: List[Tuple[int, Dict[str, Any], str]] = field(default_factory=list)
+    identificacao: Any = None
+    modelo_trocado: bool = False
+    total_botoes: int = 0
+    resultados: Dict[int, Dict[str, Any]] = field(default_factory=dict)
+    # Berço da execução (None = ciclo único com todas as câmeras, sem disputa do pórtico)
+    estacao: Optional[Estacao] = None
+    # Modos do ciclo (ver modos_ciclo.py): subconjunto da ordem de visita e parada antecipada
+    fail_fast: bool = False
+    reteste: Optional[Reteste] = None
+    ordem: Optional[List[int]] = None
+    placar: Optional[PlacarControles] = None
+    botoes_pulados: List[int] = field(default_factory=list)
+    modelo_verificado: bool = False
+    # Tempos adaptativos do modelo (None = desligado) e medições do ciclo por botão:
+    # {botao_numero: {"p1": instante do P_1, "aplicado": bool, "ir_s": s, "parar": threading.Event}}
+    tempos: Optional[TemposAdaptativos] = None
+    medicoes: Dict[int, Dict[str, Any]] = field(default_factory=dict)
+    
+    @property
+    def cameras(self) -> Optional[Tuple[int, ...]]:
+        return self.estacao.cameras if self.estacao else None
+    
+    def liberada(self) -> bool:
+        return self.estacao.liberada if self.estacao else libera_envio_comandos
+    
+    def plano(self) -> PlanoExecucao:
+        plano = self.modelo.plano_execucao(self.com_fotos, self.ordem)
+        return adaptar_plano(plano, self.estacao) if self.estacao else plano
+
+async def executar_passos(passos: List[Passo]):
+    """Motor dos passos simples da receita (preparação e início): comandos, movimentos e pausas"""
+    for passo in passos:
+        if passo.acao == "aguardar":
+            await asyncio.sleep(passo.tempo)
+        else:
+            await enviar_comando_porta(passo.porta, passo.comando, passo.descricao, timeout=passo.tempo)
+
+def pre_construir_indice_modelos():
+    """Constrói o índice da identificação em segundo plano durante o FingerDown (a 1ª captura só consulta)"""
+    if IDENTIFICACAO_MODELO_ATIVA:
+        asyncio.get_running_loop().run_in_executor(None, obter_indice, registro_modelos)
+
+async def identificar_modelo_no_berco(estado: EstadoSequencia, nome_botao: str) -> Optional[str]:
+    """Identifica o modelo pela primeira captura; retorna "trocar" ou "abortar" se ele divergir do esperado"""
+    global libera_envio_comandos, last_pneumatic_message
+    
+    modelo = estado.modelo
+    frames_identificacao = {
+        camera_id: manager.get_frame()
+        for camera_id, manager in camera_managers.items()
+        if manager and manager.is_connected() and (estado.cameras is None or camera_id in estado.cameras)
+    }
+    # Índice montado fora do event loop (lê as referências do disco se algum modelo foi recarregado)
+    loop = asyncio.get_running_loop()
+    identificacao = await loop.run_in_executor(None, identificar_modelo, registro_modelos, frames_identificacao)
+    estado.identificacao = identificacao
+    print(f"🧭 Modelo identificado: {identificacao.modelo} (esperado: {modelo.nome}) - {identificacao.resumo()}")
+    
+    # Sem frames/índice não há como identificar: segue com o modelo escolhido
+    divergente = identificacao.distancia_media is not None and identificacao.modelo != modelo.nome
+    if not divergente or (identificacao.modelo is not None and not identificacao.confiavel):
+        return None
+    
+    plano = estado.plano()
+    liberar = next((p for p in plano.botoes if p.acao == "liberar"), Passo("liberar", plano.portas["pneumatica"], "P_0"))
+    await enviar_comando_porta(liberar.porta, liberar.comando, f"Liberar {nome_botao}", timeout=0.3)
+    if ACAO_MODELO_DIVERGENTE == "trocar" and identificacao.modelo is not None and not estado.modelo_trocado:
+        # Troca a receita e refaz o primeiro botão nas coordenadas do modelo correto
+        # (num berço só a estação troca de modelo; o modelo ativo é do ciclo único)
+        loop = asyncio.get_running_loop()
+        carregar = registro_modelos.obter_carregado if estado.estacao else registro_modelos.ativar
+        estado.modelo = await loop.run_in_executor(None, carregar, identificacao.modelo)
+        if estado.estacao:
+            estado.estacao.modelo = estado.modelo.nome
+        estado.registro_ciclo = RegistroCiclo()
+        estado.modelo_trocado = True
+        last_pneumatic_message = f"🔁 Modelo trocado automaticamente para {estado.modelo.nome}"
+        print(f"🔁 Receita trocada para {estado.modelo.nome} - reiniciando no botão 1")
+        return "trocar"
+    
+    last_pneumatic_message = f"❌ Modelo no berço não corresponde a {modelo.nome}"
+    print(f"❌ Modelo divergente ({identificacao.modelo or 'desconhecido'}) - ciclo abortado")
+    if estado.estacao:
+        estado.estacao.liberada = False
+    else:
+        libera_envio_comandos = False
+    return "abortar"
+
+def preparar_tempos(estado: EstadoSequencia):
+    """Tempos adaptativos do modelo do estado (ver tempos_adaptativos.py); descarta medições de outro modelo"""
+    tempos = estado.modelo.tempos_adaptativos()
+    estado.tempos = None if tempos.modo == "desligado" else tempos
+    estado.medicoes = {}
+    if estado.tempos:
+        estado.tempos.iniciar_ciclo()
+
+def camera_estabilizacao(estado: EstadoSequencia) -> Optional[int]:
+    """Câmera que observa o display: a do decodificador LCD, se for do berço, senão a primeira disponível"""
+    cameras = [c for c, m in camera_managers.items()
+               if m and m.is_connected() and (estado.cameras is None or c in estado.cameras)]
+    lcd = estado.modelo.decodificador_lcd
+    if lcd is not None and lcd.camera_id in cameras:
+        return lcd.camera_id
+    return min(cameras) if cameras else None
+
+async def medir_display(camera_id: int, inicio: float, janela_s: float, parar: threading.Event) -> Optional[float]:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, medir_estabilizacao, camera_managers[camera_id], inicio, janela_s, parar)
+
+async def capturar_ir_medido(estado: EstadoSequencia, botao_numero: int, nano: str, timeout_ms: int) -> Dict[str, Any]:
+    """Captura IR guardando o tempo desde o P_1 até o código chegar"""
+    resultado = await capturar_dados_ir(nano=nano, timeout=timeout_ms, salvar_captura=False)
+    medicao = estado.medicoes.get(botao_numero)
+    if medicao is not None and resultado.get("success"):
+        medicao["ir_s"] = time.perf_counter() - medicao["p1"]
+    return resultado
+
+def registrar_tempos(estado: EstadoSequencia):
+    """Amostras de display/IR e o resultado de cada botão do ciclo nas estatísticas do modelo"""
+    tempos = estado.tempos
+    if tempos is None or not estado.medicoes:
+        return
+    for botao_numero, medicao in estado.medicoes.items():
+        etapas = estado.resultados.get(botao_numero, {})
+        display = etapas.get("display")
+        if isinstance(display, float):
+            tempos.registrar_display(botao_numero, display)
+        if "ir_s" in medicao:
+            tempos.registrar_ir(botao_numero, medicao["ir_s"])
+        aprovado = "ir_s" in medicao
+        if isinstance(etapas.get("validacao"), tuple):
+            aprovado = aprovado and consolidar_validacao_botao(etapas["validacao"][1])[0]
+        elif "validacao" in etapas:
+            aprovado = False
+        tempos.registrar_resultado(botao_numero, aprovado, medicao["aplicado"])
+    try:
+        tempos.salvar()
+    except Exception as e:
+        print(f"⚠️ Erro ao salvar tempos do {estado.modelo.nome}: {e}")
+
+async def executar_passo_botao(passo: Passo, estado: EstadoSequencia) -> Optional[str]:
+    """Executa um passo do plano de botões; retorna "trocar" ou "abortar" vindos da identificação do modelo"""
+    global linha_atual
+    
+    i = passo.botao
+    coord = estado.modelo.test_coordinates[i]
+    nome_botao = coord.get('nome', f'Botão {i+1}')
+    pipeline = estado.pipeline
+    
+    if passo.acao == "iniciar_botao":
+        if estado.estacao:
+            estado.estacao.botao_atual = i + 1
+        else:
+            linha_atual = i
+        print(f"🔹 Comando {len(estado.botoes_pressionados)+1}/{estado.total_botoes} - {nome_botao} (botão {i+1})")
+    elif passo.acao in ("mover", "comando", "aguardar"):
+        await executar_passos([passo])
+    elif passo.acao == "pressionar":
+        # Só depois que o Nano entregou o IR do botão anterior
+        await pipeline.aguardar("pressionar", pipeline.ultimo_botao)
+        print(f"🔘 [{i+1}] Pressionando botão {nome_botao}...")
+        espera = passo.tempo
+        if estado.tempos:
+            espera, _, aplicado = estado.tempos.aplicar(i + 1, passo.tempo, passo.timeout_ms)
+            medicao = estado.medicoes[i + 1] = {"p1": time.perf_counter(), "aplicado": aplicado, "parar": threading.Event()}
+            camera_id = camera_estabilizacao(estado)
+            if camera_id is not None:
+                pipeline.iniciar(i + 1, "display", medir_display(
+                    camera_id, medicao["p1"], passo.tempo * FATOR_ESPERA_MAXIMA, medicao["parar"]
+                ))
+        await enviar_comando_porta(passo.porta, passo.comando, passo.descricao, timeout=espera)
+    elif passo.acao == "identificar_modelo":
+        # Uma vez confirmado, o modelo não é reidentificado quando o plano é recompilado (fail-fast)
+        if IDENTIFICACAO_MODELO_ATIVA and not estado.modelo_verificado:
+            desfecho = await identificar_modelo_no_berco(estado, nome_botao)
+            estado.modelo_verificado = desfecho is None
+            return desfecho
+    elif passo.acao == "capturar_fotos":
+        print(f"📸 [{i+1}] Capturando fotos de todas as câmeras...")
+        estado.capturas[i + 1] = await capturar_frames_cameras(estado.cameras)
+    elif passo.acao == "liberar":
+        if i + 1 in estado.medicoes:
+            estado.medicoes[i + 1]["parar"].set()
+        await enviar_comando_porta(passo.porta, passo.comando, passo.descricao, timeout=passo.tempo)
+    elif passo.acao == "capturar_ir":
+        print(f"📡 [{i+1}] Capturando dados IR após pressionar {nome_botao}...")
+        if i + 1 in estado.medicoes:
+            _, timeout_ms, _ = estado.tempos.aplicar(i + 1, 0.0, passo.timeout_ms)
+            pipeline.iniciar(i + 1, "ir", capturar_ir_medido(estado, i + 1, passo.nano, timeout_ms))
+        else:
+            pipeline.iniciar(i + 1, "ir", capturar_dados_ir(nano=passo.nano, timeout=passo.timeout_ms, salvar_captura=False))
+    elif passo.acao == "validar_fotos":
+        pipeline.iniciar(i + 1, "validacao", validar_fotos_botao_em_ordem(
+            pipeline, pipeline.ultimo_botao, estado.capturas.pop(i + 1, {}), i + 1, nome_botao,
+            estado.modelo, estado.modelo.pacote, estado.registro_ciclo, estado.ciclo_fotos_dir
+        ))
+    elif passo.acao == "concluir_botao":
+        pipeline.avancar(i + 1)
+        estado.botoes_pressionados.append((i, coord, nome_botao))
+    return None
+
+def preparar_modos(estado: EstadoSequencia):
+    """Botões a visitar (reteste) e placar por controle (fail-fast) para o modelo do estado"""
+    modelo = estado.modelo
+    if estado.reteste is not None and estado.reteste.modelo not in (None, modelo.nome):
+        # Modelo trocado pela identificação: o reteste era de outro modelo, roda o ciclo inteiro
+        print(f"⚠️ Reteste de {estado.reteste.modelo} descartado - ciclo completo do {modelo.nome}")
+        estado.reteste = None
+    estado.ordem = None
+    if estado.reteste is not None:
+        estado.ordem = [i for i in modelo.ordem_visita() if i + 1 in estado.reteste.botoes]
+    estado.placar = PlacarControles({
+        i + 1: obter_controle_do_botao(coord.get('nome', f'Botão {i+1}'), modelo.test_coordinates)
+        for i, coord in enumerate(modelo.test_coordinates)
+    })
+    for dados_botao in (estado.reteste.reaproveitados if estado.reteste else []):
+        validacao = dados_botao.get("validacao") or {}
+        estado.placar.registrar(dados_botao["botao_numero"], validacao.get("aprovado", False),
+                                validacao.get("similaridade_media", 0.0))
+
+def botoes_com_veredito_aberto(estado: EstadoSequencia, restantes: List[int]) -> List[int]:
+    """Fail-fast: tira dos botões restantes os dos controles cuja reprovação já está decidida"""
+    for botao, etapas in estado.pipeline.tarefas.items():
+        tarefa = etapas.get("validacao")
+        if tarefa is not None and tarefa.done() and not tarefa.cancelled():
+            # Mesma consolidação do relatório (validação com erro = sem validações por câmera)
+            validacoes = tarefa.result()[1] if tarefa.exception() is None else []
+            estado.placar.registrar(botao, *consolidar_validacao_botao(validacoes))
+    reprovados = estado.placar.reprovados()
+    return [i for i in restantes if estado.placar.controle_por_botao.get(i + 1) not in reprovados]
+
+async def executar_plano_botoes(estado: EstadoSequencia) -> EstadoSequencia:
+    """Motor único do ciclo: executa o plano compilado da receita do modelo e junta os resultados por botão"""
+    preparar_modos(estado)
+    preparar_tempos(estado)
+    plano = estado.plano()
+    estado.total_botoes = sum(1 for p in plano.botoes if p.acao == "iniciar_botao")
+    nome_estacao = estado.estacao.nome if estado.estacao else None
+    print(f"🧾 Plano de execução ({estado.modelo.nome}{f' - {nome_estacao}' if nome_estacao else ''}): {plano.resumo()}")
+    
+    k = 0
+    try:
+        while k < len(plano.botoes):
+            passo = plano.botoes[k]
+            if passo.acao == "iniciar_botao" and not estado.liberada():
+                print("⏸️ Sequência interrompida")
+                break
+            
+            if estado.fail_fast and passo.acao == "iniciar_botao":
+                restantes = [p.botao for p in plano.botoes[k:] if p.acao == "iniciar_botao"]
+                mantidos = botoes_com_veredito_aberto(estado, restantes)
+                if len(mantidos) < len(restantes):
+                    estado.botoes_pulados += [i + 1 for i in restantes if i not in mantidos]
+                    print(f"⏭️ Fail-fast: controles {sorted(estado.placar.reprovados())} já reprovados - "
+                          f"{len(restantes) - len(mantidos)} botão(ões) pulado(s)")
+                    if not mantidos:
+                        print("⏹️ Veredito decidido - ciclo encerrado antes do fim")
+                        break
+                    # Replaneja só os botões restantes (o movimento até o próximo não pode ser omitido)
+                    estado.ordem = mantidos
+                    plano = estado.plano()
+                    estado.total_botoes = len(estado.botoes_pressionados) + len(mantidos)
+                    k = 0
+                    continue
+            
+            if nome_estacao and passo.acao == "iniciar_botao":
+                # Espera o IR do botão anterior antes de pegar o pórtico, para não segurá-lo parado
+                await estado.pipeline.aguardar("pressionar", estado.pipeline.ultimo_botao)
+                await portico.adquirir(nome_estacao)
+            
+            desfecho = await executar_passo_botao(passo, estado)
+            if nome_estacao and (passo.acao in ("liberar", "concluir_botao") or desfecho):
+                # Dedo solto: o outro berço pode mover/pressionar enquanto este captura IR e valida
+                portico.liberar(nome_estacao)
+            if desfecho == "trocar":
+                # Plano do modelo correto, reiniciando no primeiro botão
+                preparar_modos(estado)
+                preparar_tempos(estado)
+                plano = estado.plano()
+                estado.total_botoes = sum(1 for p in plano.botoes if p.acao == "iniciar_botao")
+                k = 0
+                continue
+            if desfecho == "abortar":
+                break
+            k += 1
+        
+        estado.resultados = await estado.pipeline.concluir()
+        registrar_tempos(estado)
+    except (Exception, asyncio.CancelledError):
+        # Parada: IR e validações em segundo plano saem junto com o ciclo
+        estado.pipeline.cancelar()
+        raise
+    finally:
+        if nome_estacao:
+            portico.liberar(nome_estacao)
+    return estado
+
+def resultado_ir_do_botao(estado: EstadoSequencia, botao_numero: int) -> Dict[str, Any]:
+    """Resultado da captura IR do botão (exceção da tarefa vira falha)"""
+    resultado_ir = estado.resultados.get(botao_numero, {}).get("ir")
+    if not isinstance(resultado_ir, dict):
+        return {"success": False, "error": f"Erro na captura IR: {resultado_ir}"}
+    return resultado_ir
+
+def gerar_resultado_ciclo(estado: EstadoSequencia, todos_dados_ir: list, ciclo_dir: Path, ciclo_fotos_dir: Path,
+                          ciclo_numero: int) -> Tuple[Optional[Dict[str, Any]], Optional[Path], int]:
+    """Junta IR + validação de cada botão, gera o relatório por controle e salva o JSON do ciclo
+
+    Síncrono: roda em run_in_executor depois de hardware_liberado, em paralelo com o FingerDown do
+    próximo ciclo. Retorna (relatório por controle, JSON salvo, botões no relatório).
+    """
+    estacao = estado.estacao
+    modelo = estado.modelo
+    coordenadas = modelo.test_coordinates
+    pacote_referencia = modelo.pacote
+
+    # 6. JUNTA IR + VALIDAÇÃO DE CADA BOTÃO PELO NÚMERO DO BOTÃO
+    for i, coord, nome_botao in sorted(estado.botoes_pressionados, key=lambda b: b[0]):
+        etapas = estado.resultados.get(i + 1, {})
+        resultado_ir = resultado_ir_do_botao(estado, i + 1)
+        fotos_capturadas, validacoes_fotos = [], []
+        if isinstance(etapas.get("validacao"), tuple):
+            fotos_capturadas, validacoes_fotos = etapas["validacao"]
+        else:
+            print(f"❌ [{i+1}] Erro na validação das fotos: {etapas.get('validacao')}")
+
+        # Calcula validação geral do botão (aprovado se todas as câmeras aprovarem)
+        todas_aprovadas, similaridade_media_botao = consolidar_validacao_botao(validacoes_fotos)
+
+        # SEMPRE adiciona os dados, mesmo se a captura IR falhar
+        # (o teste de imagem é o principal, o IR é complementar)
+        dados_botao = {
+            "botao_numero": i + 1,
+            "coordenadas": coord,
+            "timestamp": resultado_ir.get('timestamp') if resultado_ir.get('success') else datetime.now().isoformat(),
+            "request_id": resultado_ir.get('request_id') if resultado_ir.get('success') else None,
+            "dados_ir": resultado_ir.get('data') if resultado_ir.get('success') else None,
+            "ir_capturado": resultado_ir.get('success', False),
+            "ir_erro": resultado_ir.get('error') if not resultado_ir.get('success') else None,
+            "nome_botao": nome_botao,
+            "comando_executado": f"Pressionar {nome_botao} em X{coord['x']} Y{coord['y']}",
+            "fotos_capturadas": fotos_capturadas,
+            "validacao": {
+                "aprovado": todas_aprovadas,
+                "similaridade_media": round(similaridade_media_botao, 4),
+                "validacoes_por_camera": validacoes_fotos
+            },
+            "controle_numero": obter_controle_do_botao(nome_botao, coordenadas)
+        }
+        todos_dados_ir.append(dados_botao)
+
+        if resultado_ir.get('success'):
+            print(f"✅ [{i+1}] Botão pressionado, {len(fotos_capturadas)} fotos e dados IR capturados")
+        else:
+            print(f"⚠️ [{i+1}] Botão pressionado, {len(fotos_capturadas)} fotos capturadas (IR não capturado: {resultado_ir.get('error', 'Erro desconhecido')})")
+
+        print(f"   📊 Validação: {'✅ APROVADO' if todas_aprovadas else '❌ REPROVADO'} (Similaridade média: {similaridade_media_botao:.2%})")
+
+    print("✅ SEQUÊNCIA COM FOTOS CONCLUÍDA")
+    print(f"📊 Total de botões pressionados: {len(todos_dados_ir)} - pipeline: {estado.pipeline.resumo()}")
+    if estado.botoes_pulados:
+        print(f"⏭️ Botões pulados pelo fail-fast: {estado.botoes_pulados}")
+
+    # Reteste: botões aprovados no ciclo anterior completam o relatório
+    if estado.reteste is not None:
+        print(f"♻️ {len(estado.reteste.reaproveitados)} botão(ões) reaproveitado(s) de {estado.reteste.origem}")
+        todos_dados_ir = sorted(todos_dados_ir + estado.reteste.reaproveitados, key=lambda d: d['botao_numero'])
+    pressionados = [d for d in todos_dados_ir if 'reaproveitado_de' not in d]
+
+    # 7. GERA RELATÓRIO DE VALIDAÇÃO POR CONTROLE
+    resultados_validacao = [
+        {
+            "controle_numero": d.get('controle_numero', 1),
+            "nome_botao": d.get('nome_botao'),
+            "botao_numero": d.get('botao_numero'),
+            "validacao": d.get('validacao', {})
+        }
+        for d in todos_dados_ir if d.get('validacao')
+    ]
+
+    relatorio_controles = gerar_relatorio_controles(resultados_validacao)
+
+    # 8. IMPRIME RELATÓRIO FINAL
+    print("\n" + "="*60)
+    print("📋 RELATÓRIO FINAL DE VALIDAÇÃO POR CONTROLE")
+    print("="*60)
+    for controle_num in range(1, 5):
+        info = relatorio_controles["controles"][controle_num]
+        status_emoji = "✅" if info["aprovado"] else "❌"
+        print(f"\n{status_emoji} CONTROLE {controle_num}: {info['status'].upper()}")
+        print(f"   Total de botões: {info['total_botoes']}")
+        print(f"   Botões aprovados: {info['botoes_aprovados']}")
+        print(f"   Botões reprovados: {info['botoes_reprovados']}")
+        print(f"   Taxa de aprovação: {info['taxa_aprovacao']}%")
+        print(f"   Similaridade média: {info['similaridade_media']:.2%}")
+
+    print(f"\n📊 RESUMO GERAL:")
+    print(f"   Controles aprovados: {relatorio_controles['resumo']['controles_aprovados']}/4")
+    print(f"   Controles reprovados: {relatorio_controles['resumo']['controles_reprovados']}/4")
+    print("="*60 + "\n")
+
+    # 9. SALVA RESULTADOS NO DIRETÓRIO DO CICLO
+    if todos_dados_ir:
+        # Salva JSON consolidado no diretório do ciclo
+        json_path = ciclo_dir / f"resultado_teste_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        dados_consolidados = {
+            "metadata": {
+                "arquivo_salvo_em": datetime.now().isoformat(),
+                "ciclo_teste": ciclo_numero,
+                "estacao": estacao.nome if estacao else None,
+                "total_botoes_mapeados": len(todos_dados_ir),
+                "sequencia_executada": "FingerDown + Início1",
+                "timestamp_inicio": pressionados[0]['timestamp'] if pressionados else None,
+                "timestamp_fim": datetime.now().isoformat(),
+                "diretorio_fotos": str(ciclo_fotos_dir),
+                "registro_cameras": estado.registro_ciclo.resumo(),
+                "modelo": modelo.nome,
+                "identificacao_modelo": estado.identificacao.resumo() if estado.identificacao else None,
+                "ordem_visita": [k + 1 for k in modelo.ordem_visita()],
+                "rota_otimizada": modelo.otimizar_rota,
+                "plano_execucao": estado.plano().resumo(),
+                "pipeline": estado.pipeline.resumo(),
+                "modo": {
+                    "fail_fast": estado.fail_fast,
+                    "reteste": estado.reteste.resumo() if estado.reteste else None,
+                    "botoes_pressionados": len(pressionados),
+                    "botoes_pulados": estado.botoes_pulados,
+                    "placar": estado.placar.resumo() if estado.placar else None
+                },
+                "pacote_referencia": pacote_referencia.versao if pacote_referencia else None
+            },
+            "botoes_mapeados": todos_dados_ir,
+            "relatorio_controles": relatorio_controles
+        }
+
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(dados_consolidados, f, indent=2, ensure_ascii=False)
+        return relatorio_controles, json_path, len(todos_dados_ir)
+    return None, None, 0
+
+async def executar_sequencia_comandos_com_fotos(estacao: Optional[Estacao] = None,
+                                                hardware_liberado: Optional[asyncio.Event] = None,
+                                                fail_fast: bool = False, reteste: Optional[Reteste] = None):
+    """Executa a sequência completa COM CAPTURA DE FOTOS a cada botão pressionado (todas as câmeras ou as do berço)
+    
+    hardware_liberado é sinalizado logo após a finalização das máquinas; o relatório do ciclo
+    continua depois disso, em paralelo com o próximo ciclo da fila. Com fail_fast/reteste só
+    parte dos botões é pressionada (ver modos_ciclo.py).
+    """
+    global linha_atual, libera_envio_comandos, current_test_cycle, last_pneumatic_message, last_test_report, ciclo_interrompido
+    global relatorio_em_geracao
+    
+    if not estacao:
+        relatorio_em_geracao = None
     
     # Lista para armazenar TODOS os dados IR capturados
     todos_dados_ir = []
@@ -1520,226 +2026,99 @@ async def executar_sequencia_comandos_com_fotos():
     photos_dir = Path("camera_photos_modelo1")
     photos_dir.mkdir(exist_ok=True)
     
-    # Diretório para resultados dos testes
-    resultados_dir = Path("test_results")
-    resultados_dir.mkdir(exist_ok=True)
+    # Diretório para resultados dos testes (cada berço tem o seu)
+    resultados_dir = estacao.resultados_dir if estacao else Path("test_results")
+    resultados_dir.mkdir(parents=True, exist_ok=True)
+    ciclo_numero = estacao.ciclo if estacao else current_test_cycle
     
     # Cria subdiretório para este ciclo de teste
-    ciclo_dir = resultados_dir / f"ciclo_{current_test_cycle}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    ciclo_dir = resultados_dir / f"ciclo_{ciclo_numero}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
     ciclo_dir.mkdir(exist_ok=True)
     ciclo_fotos_dir = ciclo_dir / "fotos"
     ciclo_fotos_dir.mkdir(exist_ok=True)
     
     print(f"📁 Diretório de resultados criado: {ciclo_dir}")
     
+    # Modelo ativo no início do ciclo (coordenadas + dados de referência já carregados)
+    modelo_inicial = registro_modelos.obter(estacao.modelo) if estacao else registro_modelos.modelo_ativo
+    liberado = False
+    estado = EstadoSequencia(modelo=modelo_inicial, com_fotos=True, ciclo_fotos_dir=ciclo_fotos_dir, estacao=estacao,
+                             fail_fast=fail_fast, reteste=reteste)
+    
     try:
-        print(f"🎯 INICIANDO SEQUÊNCIA COM FOTOS - {len(test_coordinates)} COMANDOS")
+        print(f"🎯 INICIANDO SEQUÊNCIA COM FOTOS - {len(estado.modelo.test_coordinates)} COMANDOS (modelo: {estado.modelo.nome})")
         print("📸 Modo: Captura fotos de todas as câmeras a cada botão pressionado")
         print("🔘 PRESSIONAMENTO DE BOTÕES + FOTOS!")
         
-        for i, coord in enumerate(test_coordinates):
-            if not libera_envio_comandos:
-                print("⏸️ Sequência interrompida")
-                break
-                
-            linha_atual = i
-            nome_botao = coord.get('nome', f'Botão {i+1}')
-            print(f"🔹 Comando {i+1}/{len(test_coordinates)} - {nome_botao}")
-            
-            # 1. Move para posição
-            command = f"{coord['command']} X{coord['x']} Y{coord['y']}"
-            await enviar_comando_porta(2, command, f"Movimento {i+1}", timeout=1.5)
-            
-            # 2. PRESSIONA O BOTÃO
-            print(f"🔘 [{i+1}] Pressionando botão {nome_botao}...")
-            await enviar_comando_porta(1, "P_1", f"Pressionar {nome_botao}", timeout=0.3)
-            await asyncio.sleep(0.2)  # Pequena pausa para estabilização
-            
-            # 3. 📸 CAPTURA FOTOS DE TODAS AS CÂMERAS E COMPARA COM REFERÊNCIA
-            print(f"📸 [{i+1}] Capturando fotos de todas as câmeras...")
-            fotos_capturadas = []
-            validacoes_fotos = []
-            # Normaliza nome do botão para o nome do arquivo
-            nome_botao_arquivo = nome_botao.replace(' ', '_').replace('-', '_').upper()
-            
-            # Diretório de referência
-            referencia_dir = Path("camera_photos_modelo1")
-            
-            for camera_id in range(MAX_CAMERAS):
-                try:
-                    manager = camera_managers.get(camera_id)
-                    if manager and manager.is_connected():
-                        frame = manager.get_frame()
-                        if frame is not None:
-                            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-                            filename = f"botao_{i+1:03d}_{nome_botao_arquivo}_camera_{camera_id}_{timestamp}.jpg"
-                            # Salva na pasta de fotos do ciclo
-                            filepath = ciclo_fotos_dir / filename
-                            cv2.imwrite(str(filepath), frame)
-                            
-                            # 🔍 COMPARA COM IMAGEM DE REFERÊNCIA
-                            img_ref_path = encontrar_imagem_referencia(i + 1, nome_botao, camera_id, referencia_dir)
-                            
-                            validacao = {
-                                "camera_id": camera_id,
-                                "aprovado": False,
-                                "similaridade_media": 0.0,
-                                "imagem_referencia_encontrada": False
-                            }
-                            
-                            if img_ref_path and img_ref_path.exists():
-                                resultado_comparacao = comparar_imagem_com_referencia(str(filepath), str(img_ref_path))
-                                validacao.update(resultado_comparacao)
-                                validacao["imagem_referencia_encontrada"] = True
-                                validacao["imagem_referencia"] = str(img_ref_path)
-                                
-                                status = "✅ APROVADO" if resultado_comparacao["aprovado"] else "❌ REPROVADO"
-                                print(f"  {status} Câmera {camera_id}: Similaridade {resultado_comparacao['similaridade_media']:.2%}")
-                            else:
-                                print(f"  ⚠️ Câmera {camera_id}: Imagem de referência não encontrada")
-                                validacao["erro"] = "Imagem de referência não encontrada"
-                            
-                            fotos_capturadas.append({
-                                "camera_id": camera_id,
-                                "filename": filename,
-                                "filepath": str(filepath)
-                            })
-                            validacoes_fotos.append(validacao)
-                            print(f"  ✅ Foto câmera {camera_id} salva: {filename}")
-                        else:
-                            print(f"  ⚠️ Câmera {camera_id} sem frame disponível")
-                    else:
-                        print(f"  ⚠️ Câmera {camera_id} não conectada")
-                except Exception as e:
-                    print(f"  ❌ Erro ao capturar foto da câmera {camera_id}: {e}")
-            
-            # 4. Libera o botão
-            await enviar_comando_porta(1, "P_0", f"Liberar {nome_botao}", timeout=0.3)
-            
-            # 5. Captura dados IR APÓS pressionar o botão (opcional - não bloqueia o teste)
-            print(f"📡 [{i+1}] Capturando dados IR após pressionar {nome_botao}...")
-            resultado_ir = await capturar_dados_ir(
-                nano='nano1',
-                timeout=8000,
-                salvar_captura=False
-            )
-            
-            # Calcula validação geral do botão (aprovado se todas as câmeras aprovarem)
-            todas_aprovadas = all(v.get('aprovado', False) for v in validacoes_fotos if v.get('imagem_referencia_encontrada'))
-            similaridade_media_botao = sum(v.get('similaridade_media', 0.0) for v in validacoes_fotos) / len(validacoes_fotos) if validacoes_fotos else 0.0
-            
-            # SEMPRE adiciona os dados, mesmo se a captura IR falhar
-            # (o teste de imagem é o principal, o IR é complementar)
-            dados_botao = {
-                "botao_numero": i + 1,
-                "coordenadas": coord,
-                "timestamp": resultado_ir.get('timestamp') if resultado_ir.get('success') else datetime.now().isoformat(),
-                "request_id": resultado_ir.get('request_id') if resultado_ir.get('success') else None,
-                "dados_ir": resultado_ir.get('data') if resultado_ir.get('success') else None,
-                "ir_capturado": resultado_ir.get('success', False),
-                "ir_erro": resultado_ir.get('error') if not resultado_ir.get('success') else None,
-                "nome_botao": nome_botao,
-                "comando_executado": f"Pressionar {nome_botao} em X{coord['x']} Y{coord['y']}",
-                "fotos_capturadas": fotos_capturadas,
-                "validacao": {
-                    "aprovado": todas_aprovadas,
-                    "similaridade_media": round(similaridade_media_botao, 4),
-                    "validacoes_por_camera": validacoes_fotos
-                },
-                "controle_numero": obter_controle_do_botao(nome_botao)
-            }
-            todos_dados_ir.append(dados_botao)
-            
-            if resultado_ir.get('success'):
-                print(f"✅ [{i+1}] Botão pressionado, {len(fotos_capturadas)} fotos e dados IR capturados")
-            else:
-                print(f"⚠️ [{i+1}] Botão pressionado, {len(fotos_capturadas)} fotos capturadas (IR não capturado: {resultado_ir.get('error', 'Erro desconhecido')})")
-            
-            print(f"   📊 Validação: {'✅ APROVADO' if todas_aprovadas else '❌ REPROVADO'} (Similaridade média: {similaridade_media_botao:.2%})")
-            
-            # 6. Pequena pausa entre comandos
-            if i < len(test_coordinates) - 1:
-                await asyncio.sleep(1.0)
-        
-        print("✅ SEQUÊNCIA COM FOTOS CONCLUÍDA")
-        print(f"📊 Total de botões pressionados: {len(todos_dados_ir)}")
-        
-        # 7. GERA RELATÓRIO DE VALIDAÇÃO POR CONTROLE
-        resultados_validacao = [
-            {
-                "controle_numero": d.get('controle_numero', 1),
-                "nome_botao": d.get('nome_botao'),
-                "botao_numero": d.get('botao_numero'),
-                "validacao": d.get('validacao', {})
-            }
-            for d in todos_dados_ir if d.get('validacao')
-        ]
+        await executar_plano_botoes(estado)
         
-        relatorio_controles = gerar_relatorio_controles(resultados_validacao)
-        
-        # 8. IMPRIME RELATÓRIO FINAL
-        print("\n" + "="*60)
-        print("📋 RELATÓRIO FINAL DE VALIDAÇÃO POR CONTROLE")
-        print("="*60)
-        for controle_num in range(1, 5):
-            info = relatorio_controles["controles"][controle_num]
-            status_emoji = "✅" if info["aprovado"] else "❌"
-            print(f"\n{status_emoji} CONTROLE {controle_num}: {info['status'].upper()}")
-            print(f"   Total de botões: {info['total_botoes']}")
-            print(f"   Botões aprovados: {info['botoes_aprovados']}")
-            print(f"   Botões reprovados: {info['botoes_reprovados']}")
-            print(f"   Taxa de aprovação: {info['taxa_aprovacao']}%")
-            print(f"   Similaridade média: {info['similaridade_media']:.2%}")
-        
-        print(f"\n📊 RESUMO GERAL:")
-        print(f"   Controles aprovados: {relatorio_controles['resumo']['controles_aprovados']}/4")
-        print(f"   Controles reprovados: {relatorio_controles['resumo']['controles_reprovados']}/4")
-        print("="*60 + "\n")
-        
-        # 9. SALVA RESULTADOS NO DIRETÓRIO DO CICLO
-        if todos_dados_ir:
-            # Salva JSON consolidado no diretório do ciclo
-            json_path = ciclo_dir / f"resultado_teste_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-            dados_consolidados = {
-                "metadata": {
-                    "arquivo_salvo_em": datetime.now().isoformat(),
-                    "ciclo_teste": current_test_cycle,
-                    "total_botoes_mapeados": len(todos_dados_ir),
-                    "sequencia_executada": "FingerDown + Início1",
-                    "timestamp_inicio": todos_dados_ir[0]['timestamp'] if todos_dados_ir else None,
-                    "timestamp_fim": datetime.now().isoformat(),
-                    "diretorio_fotos": str(ciclo_fotos_dir)
-                },
-                "botoes_mapeados": todos_dados_ir,
-                "relatorio_controles": relatorio_controles
-            }
-            
-            with open(json_path, 'w', encoding='utf-8') as f:
-                json.dump(dados_consolidados, f, indent=2, ensure_ascii=False)
-            
+        # Botões, IR e fotos concluídos: finaliza as máquinas já (num berço, sem mexer no pórtico do outro)
+        if estacao:
+            await finalizar_estacao(estacao)
+        else:
+            await finalizar_processo()
+        liberado = True
+        if hardware_liberado:
+            hardware_liberado.set()
+        
+        # Relatório e JSON fora do event loop: o próximo ciclo da fila já pode rodar o FingerDown
+        loop = asyncio.get_running_loop()
+        geracao = loop.run_in_executor(
+            None, gerar_resultado_ciclo, estado, todos_dados_ir, ciclo_dir, ciclo_fotos_dir, ciclo_numero
+        )
+        if not estacao:
+            # Publicado antes de qualquer await: o reteste "ultimo" do próximo pedido espera este JSON
+            relatorio_em_geracao = geracao
+        relatorio_controles, json_path, total_botoes = await asyncio.shield(geracao)
+        if relatorio_controles is not None:
             # Armazena o relatório globalmente para acesso via API
             last_test_report = relatorio_controles
+            if estacao:
+                estacao.ultimo_relatorio = relatorio_controles
             
             print(f"💾 RESULTADO SALVO: {json_path}")
             print(f"📁 Fotos salvas em: {ciclo_fotos_dir}")
-            print(f"📊 Total de botões mapeados: {len(todos_dados_ir)}")
+            print(f"📊 Total de botões mapeados: {total_botoes}")
         else:
             print("⚠️ Nenhum dado IR foi capturado")
         
-        # 10. FINALIZA O PROCESSO
-        await finalizar_processo()
-        
         # Atualiza mensagem para a dashboard
         last_pneumatic_message = "✅ Teste concluído com sucesso!"
+        if estacao:
+            estacao.mensagem = last_pneumatic_message
+            last_pneumatic_message = f"{estacao.descricao}: {last_pneumatic_message}"
     
+    except asyncio.CancelledError:
+        # Parada segura em andamento: ela solta o dedo, desliga o IR e para o GRBL
+        print("⏹️ Sequência com fotos cancelada pela parada")
+        last_pneumatic_message = "⏹️ Teste interrompido pelo operador"
+        if estacao:
+            estacao.mensagem = last_pneumatic_message
+            last_pneumatic_message = f"{estacao.descricao}: {last_pneumatic_message}"
+        else:
+            ciclo_interrompido = True
+        raise
     except Exception as e:
         print(f"❌ Erro na sequência de comandos com fotos: {e}")
-        await emergency_stop()
+        # Erro só no relatório não para as máquinas (o próximo ciclo pode já estar rodando)
+        if not liberado:
+            if estacao:
+                # Parada só do berço, uma vez, em executar_ciclo_estacao (o outro berço continua)
+                estacao.mensagem = f"❌ Erro no teste: {str(e)}"
+                raise
+            await emergency_stop()
         
         # Atualiza mensagem de erro
         last_pneumatic_message = f"❌ Erro no teste: {str(e)}"
+        if estacao:
+            estacao.mensagem = last_pneumatic_message
+            last_pneumatic_message = f"{estacao.descricao}: {last_pneumatic_message}"
+    finally:
+        if hardware_liberado:
+            hardware_liberado.set()
 
-async def inicio1_com_fotos():
+async def inicio1_com_fotos(hardware_liberado: Optional[asyncio.Event] = None, fail_fast: bool = False,
+                            reteste: Optional[Reteste] = None):
     """Início do teste real COM FOTOS - sequência de comandos otimizada"""
     global linha_atual, libera_envio_comandos
     
@@ -1750,12 +2129,13 @@ async def inicio1_com_fotos():
         libera_envio_comandos = True
         linha_atual = 0
         
-        # Envia comando para iniciar IR
-        await enviar_comando_porta(1, "B1_1", "Iniciar IR", timeout=0.5)
-        await enviar_comando_porta(1, "B1_1", "Iniciar IR - 2º", timeout=2.5)
+        # Envia comando para iniciar IR (início da receita do modelo ativo)
+        await executar_passos(registro_modelos.modelo_ativo.plano_execucao().inicio)
         
         # Inicia sequência de comandos COM FOTOS
-        asyncio.create_task(executar_sequencia_comandos_com_fotos())
+        tarefas_ciclo.criar("sequencia_com_fotos", executar_sequencia_comandos_com_fotos(
+            hardware_liberado=hardware_liberado, fail_fast=fail_fast, reteste=reteste
+        ))
         
         return {"status": "success", "message": "Início1 com fotos executado"}
         
@@ -1799,7 +2179,7 @@ async def capturar_dados_ir(nano: str = 'nano1', timeout: int = 10000,
 async def pressionar_botao_otimizado(numero_comando: int):
     """Função otimizada para pressionar botão"""
     try:
-        if serial_port1 and serial_port1.is_open:
+        if porta_conectada(1):
             # Pressiona
             await enviar_comando_porta(1, "P_1", f"Pressionar [{numero_comando}]", timeout=0.3)
             
@@ -1807,8 +2187,8 @@ async def pressionar_botao_otimizado(numero_comando: int):
             await enviar_comando_porta(1, "P_0", f"Liberar [{numero_comando}]", timeout=0.3)
             
             # Solicita dados IR
-            if serial_port3 and serial_port3.is_open:
-                serial_port3.write(b"GET\n")
+            if porta_conectada(3):
+                await escrever_porta(3, b"GET\n")
                 print(f"📡 [{numero_comando}] Dados IR solicitados")
                 
         return True
@@ -1825,7 +2205,7 @@ import asyncio
 async def pressionar_botao_otimizado(numero_comando: int):
     """Função otimizada para pressionar botão + CAPTURA IR"""
     try:
-        if serial_port1 and serial_port1.is_open:
+        if porta_conectada(1):
             print(f"🔘 [{numero_comando}] Pressionando botão...")
             
             # 1. Pressiona o botão (GERA o sinal IR)
@@ -1839,7 +2219,7 @@ async def pressionar_botao_otimizado(numero_comando: int):
             
             # 4. CAPTURA os dados IR gerados (LEITURA via Node.js)
             print(f"📡 [{numero_comando}] Capturando dados IR...")
-            capture_task = asyncio.create_task(
+            capture_task = tarefas_ciclo.criar(f"captura_ir_{numero_comando}",
                 capturar_dados_ir(
                     nano='nano1',
                     timeout=8000,  # 8 segundos timeout
@@ -1992,6 +2372,49 @@ async def finalizar_processo():
     except Exception as e:
         print(f"⚠️ Erro na finalização: {e}")
 
+async def finalizar_estacao(estacao: Estacao):
+    """Finaliza um berço: solta o dedo (com o pórtico) e desliga o IR do berço, sem mover o pórtico"""
+    try:
+        print(f"🔄 Finalizando {estacao.descricao}...")
+        estacao.liberada = False
+        async with portico.reservar(estacao.nome):
+            await enviar_comando_porta(1, estacao.comandos.get("P_0", "P_0"), "Liberar pressão final", timeout=0.5)
+        await enviar_comando_porta(1, estacao.comandos.get("B1_0", "B1_0"), "Desligar IR", timeout=0.5)
+        print(f"✅ {estacao.descricao} finalizado")
+    except Exception as e:
+        print(f"⚠️ Erro na finalização do {estacao.descricao}: {e}")
+
+async def executar_ciclo_estacao(estacao: Estacao, fail_fast: bool = False, reteste: Optional[Reteste] = None):
+    """Ciclo completo de um berço: FingerDown (com o pórtico), início do IR e botões disputando o pórtico"""
+    inicio = time.perf_counter()
+    try:
+        loop = asyncio.get_running_loop()
+        modelo = await loop.run_in_executor(None, registro_modelos.obter_carregado, estacao.modelo)
+        plano = adaptar_plano(modelo.plano_execucao(), estacao)
+        pre_construir_indice_modelos()
+        print(f"=== {estacao.descricao.upper()}: CICLO {estacao.ciclo} (modelo: {modelo.nome}) ===")
+        
+        # FingerDown do berço: movimento até a posição inicial e pressão usam o pórtico
+        async with portico.reservar(estacao.nome):
+            await executar_passos(plano.preparacao)
+        await executar_passos(plano.inicio)
+        
+        await executar_sequencia_comandos_com_fotos(estacao, fail_fast=fail_fast, reteste=reteste)
+    except asyncio.CancelledError:
+        print(f"⏹️ Ciclo do {estacao.descricao} cancelado")
+        raise
+    except Exception as e:
+        print(f"❌ Erro no ciclo do {estacao.descricao}: {e}")
+        # Só este berço: o emergency_stop global descartaria os comandos do outro berço na porta 1
+        await parar_ciclos(f"erro {estacao.nome}", estacao)
+        estacao.mensagem = f"❌ Erro no teste: {str(e)}"
+    finally:
+        estacao.executando = False
+        estacao.liberada = False
+        estacao.botao_atual = None
+        estacao.duracao_ultimo_ciclo_s = round(time.perf_counter() - inicio, 3)
+        print(f"🏁 {estacao.descricao}: ciclo {estacao.ciclo} em {estacao.duracao_ultimo_ciclo_s}s - pórtico: {portico.resumo()}")
+
 
 async def ler_capturas_ir(diretorio: Optional[str] = None) -> list:
     """Lê todas as capturas IR salvas"""
@@ -2151,8 +2574,9 @@ async def testar_captura_ir():
 @app.post("/emergency_stop")
 async def emergency_stop_endpoint():
     """Endpoint para parada de emergência"""
+    parada = await parar_ciclos("emergency_stop")
     await emergency_stop()
-    return {"status": "success", "message": "Emergency stop executado"}
+    return {"status": "success", "message": "Emergency stop executado", "parada": parada.resumo()}
 
 @app.post("/reset_sequence")
 async def reset_sequence():
@@ -2172,28 +2596,71 @@ async def start_complete_process():
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
-async def execute_start_with_photos():
-    """Função interna para executar o processo completo com fotos"""
-    global fingerdown_running, current_test_cycle
+async def json_do_ultimo_ciclo() -> Optional[Path]:
+    """JSON do último ciclo único, esperando o relatório que ainda está sendo gerado em segundo plano"""
+    if relatorio_em_geracao is None:
+        return None
+    try:
+        _, json_path, _ = await asyncio.shield(relatorio_em_geracao)
+    except Exception as e:
+        print(f"⚠️ Relatório do último ciclo falhou: {e}")
+        return None
+    return json_path
+
+async def execute_start_with_photos(modelo: Optional[str] = None, proximo_modelo: Optional[str] = None,
+                                    hardware_liberado: Optional[asyncio.Event] = None,
+                                    fail_fast: bool = False, reteste: Optional[str] = None):
+    """Função interna para executar o processo completo com fotos
+    
+    reteste: JSON/diretório de um ciclo anterior (ou "ultimo") para pressionar só os botões reprovados
+    """
+    global fingerdown_running, current_test_cycle, ciclo_interrompido
     
     if fingerdown_running:
         print("⚠️ Teste já em execução, ignorando comando START")
         return {"status": "error", "message": "FingerDown já em execução"}
+    if any(estacao.executando for estacao in estacoes.values()):
+        print("⚠️ Berço em execução, ignorando comando START do ciclo único")
+        return {"status": "error", "message": "Berço em execução"}
+    
+    # Reteste lido antes de mexer nas máquinas (o "ultimo" é o ciclo que acabou de terminar)
+    reteste_ciclo = None
+    if reteste:
+        try:
+            modelo_reteste = registro_modelos.obter(modelo or registro_modelos.ativo)
+            origem = await json_do_ultimo_ciclo() if reteste == "ultimo" else None
+            reteste_ciclo = carregar_reteste(origem or localizar_resultado(reteste), modelo_reteste.nome,
+                                             len(modelo_reteste.test_coordinates))
+        except ErroReteste as e:
+            print(f"❌ Reteste inválido: {e}")
+            return {"status": "error", "message": str(e)}
+        print(f"♻️ Reteste de {reteste_ciclo.origem}: botões {sorted(reteste_ciclo.botoes)}")
     
     try:
         fingerdown_running = True
+        ciclo_interrompido = False
         current_test_cycle += 1
         
-        # 🗑️ LIMPA IMAGENS DE TESTE DO CICLO ANTERIOR
+        # Troca de modelo: se já foi pré-carregado, só troca o ponteiro
+        if modelo:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, registro_modelos.ativar, modelo)
+        # Pré-carrega o próximo modelo enquanto este ciclo roda
+        if proximo_modelo:
+            registro_modelos.pre_carregar(proximo_modelo)
+        pre_construir_indice_modelos()
+        
+        # 🗑️ LIMPA IMAGENS DE TESTE DO CICLO ANTERIOR (em segundo plano, junto com o FingerDown)
         print("🗑️ Limpando imagens de teste do ciclo anterior...")
-        limpar_imagens_teste()
+        ciclos_anteriores = list(Path("test_results").glob("ciclo_*"))
+        asyncio.get_running_loop().run_in_executor(None, limpar_imagens_teste, ciclos_anteriores)
         
         print("=== INICIANDO FINGERDOWN COM FOTOS ===")
         print(f"📦 Ciclo de teste: {current_test_cycle}")
         
         # Verificar portas conectadas
-        port1_connected = serial_port1 and serial_port1.is_open
-        port2_connected = serial_port2 and serial_port2.is_open
+        port1_connected = porta_conectada(1)
+        port2_connected = porta_conectada(2)
         
         print(f"🔌 Porta 1 conectada: {port1_connected}")
         print(f"🔌 Porta 2 conectada: {port2_connected}")
@@ -2204,41 +2671,29 @@ async def execute_start_with_photos():
         # VERIFICAÇÃO INICIAL DE ESTADO
         await verificar_estado_inicial()
         
-        # SEQUÊNCIA FINGERDOWN OTIMIZADA
-        # 1. Avançar (Porta 1)
-        await enviar_comando_porta(1, "K2_1", "Avançar", timeout=3.0)
-        
-        # 2. Mover na posição (Porta 2) - COM VERIFICAÇÃO
-        await enviar_comando_porta(2, "G90 X29.787 Y82.987", "Mover para posição inicial", timeout=4.0)
-        
-        # 3. Pressionar (Porta 1)
-        await enviar_comando_porta(1, "P_1", "Pressionar", timeout=1.5)
-        
-        # 4. Travar (Porta 1)
-        await enviar_comando_porta(1, "K4_1", "Travar", timeout=1.0)
-        
-        # 5. Expandir a pilha (Porta 1) - COM CONTROLE
-        await enviar_comando_porta(1, "K7_1", "Expandir pilha - 1º", timeout=0.8)
-        await asyncio.sleep(0.2)  # Pequena pausa entre expansões
-        await enviar_comando_porta(1, "K7_1", "Expandir pilha - 2º", timeout=0.8)
-        
-        # 6. Tirar o pressionamento (Porta 1)
-        await enviar_comando_porta(1, "P_0", "Liberar pressão", timeout=1.0)
+        # SEQUÊNCIA FINGERDOWN (preparação da receita do modelo ativo)
+        await executar_passos(registro_modelos.modelo_ativo.plano_execucao().preparacao)
         
         print("✅ FINGERDOWN COM FOTOS CONCLUÍDO")
 
         # Inicia sequência principal COM FOTOS
-        await inicio1_com_fotos()
+        resultado_inicio = await inicio1_com_fotos(hardware_liberado, fail_fast, reteste_ciclo)
+        if resultado_inicio.get("status") == "error":
+            raise Exception(resultado_inicio.get("message"))
 
         return {
             "status": "success", 
             "message": "FingerDown com fotos executado com sucesso",
             "cycle": current_test_cycle,
+            "modelo": registro_modelos.ativo,
             "timestamp": datetime.now().isoformat(),
             "port1_connected": port1_connected,
             "port2_connected": port2_connected
         }
         
+    except asyncio.CancelledError:
+        print("⏹️ FingerDown com fotos cancelado pela parada")
+        raise
     except Exception as e:
         error_msg = f"❌ Erro crítico no FingerDown com fotos: {str(e)}"
         print(error_msg)
@@ -2247,34 +2702,186 @@ async def execute_start_with_photos():
     finally:
         fingerdown_running = False
 
+async def executar_pedido_ciclo(pedido: PedidoCiclo):
+    """Executa um pedido da fila; retorna quando as máquinas ficam livres (o relatório segue em segundo plano)"""
+    # Ciclo único e berços não dividem o pórtico: espera os berços terminarem
+    while any(estacao.executando for estacao in estacoes.values()):
+        await asyncio.sleep(0.5)
+    
+    pedido.modelo = pedido.modelo or registro_modelos.ativo
+    hardware_liberado = asyncio.Event()
+    # FingerDown como tarefa registrada: a parada cancela também a preparação
+    tarefa = tarefas_ciclo.criar(f"fingerdown_pedido_{pedido.id}", execute_start_with_photos(
+        pedido.modelo, pedido.proximo_modelo, hardware_liberado, pedido.fail_fast, pedido.reteste
+    ))
+    try:
+        await asyncio.wait({tarefa})
+    except asyncio.CancelledError:
+        tarefa.cancel()
+        raise
+    if tarefa.cancelled():
+        raise CicloInterrompido("Ciclo interrompido pela parada durante o FingerDown")
+    resultado = tarefa.result()
+    if resultado.get("status") == "error":
+        raise Exception(resultado.get("message", "Erro desconhecido"))
+    await hardware_liberado.wait()
+    if ciclo_interrompido:
+        raise CicloInterrompido("Ciclo interrompido pela parada")
+
+def estimar_duracao_ciclo(nome_modelo: Optional[str]) -> float:
+    """Duração prevista pelo simulador para o plano com fotos do modelo (antes de haver ciclos medidos)"""
+    modelo = registro_modelos.obter(nome_modelo or registro_modelos.ativo)
+    return simular_plano(modelo.plano_execucao(com_fotos=True)).tempo_esperado_s
+
+# Fila de START: o próximo ciclo sai assim que o anterior libera as máquinas
+agendador_ciclos = AgendadorCiclos(executar_pedido_ciclo, estimar_duracao_ciclo)
+
 @app.post("/start_complete_process_with_photos")
-async def start_complete_process_with_photos():
-    """Inicia o processo completo FingerDown + Início1 COM CAPTURA DE FOTOS a cada botão pressionado"""
-    print("🎯 ENDPOINT /start_complete_process_with_photos ACESSADO!")
+async def start_complete_process_with_photos(modelo: Optional[str] = None, proximo_modelo: Optional[str] = None,
+                                             operador: Optional[str] = None, fail_fast: bool = False,
+                                             reteste: Optional[str] = None):
+    """Coloca na fila o processo completo FingerDown + Início1 COM CAPTURA DE FOTOS a cada botão pressionado
     
-    if fingerdown_running:
-        raise HTTPException(status_code=400, detail="FingerDown já em execução")
+    fail_fast: para assim que a reprovação dos controles está decidida
+    reteste: "ultimo", diretório do ciclo ou JSON de resultado - pressiona só os botões reprovados/sem referência
+    """
+    print("🎯 ENDPOINT /start_complete_process_with_photos ACESSADO!")
     
-    result = await execute_start_with_photos()
+    for nome in (modelo, proximo_modelo):
+        if nome and nome not in registro_modelos.modelos:
+            raise HTTPException(status_code=404, detail=f"Modelo desconhecido: {nome}")
+    # "ultimo" só é resolvido quando o pedido sai da fila
+    if reteste and reteste != "ultimo":
+        try:
+            modelo_reteste = registro_modelos.obter(modelo or registro_modelos.ativo)
+            carregar_reteste(localizar_resultado(reteste), modelo_reteste.nome, len(modelo_reteste.test_coordinates))
+        except ErroReteste as e:
+            raise HTTPException(status_code=404, detail=str(e))
     
-    if result.get("status") == "error":
-        raise HTTPException(status_code=500, detail=result.get("message", "Erro desconhecido"))
+    try:
+        pedido = agendador_ciclos.enfileirar("api", operador, modelo, proximo_modelo, fail_fast, reteste)
+    except ErroFilaCheia as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    return result
+    return {
+        "status": "success",
+        "message": "Ciclo na fila" if agendador_ciclos.atual else "Ciclo iniciado",
+        "pedido": pedido.resumo(),
+        "posicao": len(agendador_ciclos.fila),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/fila_ciclos")
+async def get_fila_ciclos():
+    """Profundidade da fila de START, ciclo em execução e ETA de cada pedido"""
+    return agendador_ciclos.resumo()
+
+@app.delete("/fila_ciclos/{pedido_id}")
+async def cancelar_pedido_ciclo(pedido_id: int):
+    """Retira um pedido da fila (o ciclo em execução não é afetado)"""
+    cancelados = agendador_ciclos.cancelar(pedido_id)
+    if not cancelados:
+        raise HTTPException(status_code=404, detail=f"Pedido {pedido_id} não está na fila")
+    return {"status": "success", "pedido": cancelados[0].resumo(), "fila": agendador_ciclos.resumo()}
+
+async def segurar_grbl():
+    """Feed hold em tempo real e falha dos movimentos pendentes (libera quem espera o Idle)"""
+    controlador = obter_controlador_grbl()
+    if controlador is not None:
+        controlador.abortar("parada")
+
+async def aguardar_grbl_parado():
+    """Espera a desaceleração do hold e descarta o planner (soft reset depois do hold mantém a posição)"""
+    controlador = obter_controlador_grbl()
+    if controlador is None:
+        return
+    loop = asyncio.get_running_loop()
+    status = await loop.run_in_executor(None, controlador.aguardar_parado)
+    if status is None:
+        raise Exception("GRBL não confirmou a parada (Hold:0/Idle)")
+    await escrever_porta(2, b"\x18")  # Ctrl-X
+    controlador.rearmar()
+
+async def soltar_dedos(estacoes_alvo: List[Estacao], descartar_normais: bool = True):
+    """P_0 pela faixa prioritária; na parada geral descarta os comandos normais ainda na fila (ex.: um P_1)
+    
+    Na parada de um berço a fila da porta 1 também tem os comandos do outro berço e fica intacta.
+    """
+    comandos = {estacao.comandos.get("P_0", "P_0") for estacao in estacoes_alvo} or {"P_0"}
+    for comando in sorted(comandos):
+        print(f"📤 [1] Parada: liberar pressão: {comando}")
+        await escrever_porta(1, f"{comando}\n".encode(), prioridade=True, descartar_normais=descartar_normais)
+
+async def desligar_irs(estacoes_alvo: List[Estacao]):
+    comandos = {estacao.comandos.get("B1_0", "B1_0") for estacao in estacoes_alvo} or {"B1_0"}
+    for comando in sorted(comandos):
+        print(f"📤 [1] Parada: desligar IR: {comando}")
+        await escrever_porta(1, f"{comando}\n".encode(), prioridade=True)
+
+async def parar_ciclos(motivo: str, estacao: Optional[Estacao] = None) -> RelatorioParada:
+    """Parada segura de todos os ciclos (ou só do berço): hold do GRBL, dedo solto e IR desligado na
+    hora; depois cancelamento das tarefas, dedo solto de novo e GRBL parado"""
+    global libera_envio_comandos, ultima_parada
+    
+    if estacao is None:
+        libera_envio_comandos = False
+        alvo = list(estacoes.values())
+    else:
+        alvo = [estacao]
+    for e in alvo:
+        e.liberada = False
+    # Num berço só o dono do pórtico para o GRBL e solta o dedo (os dois são do pórtico, e o
+    # outro berço pode estar movendo ou pressionando)
+    parar_portico = estacao is None or portico.dono == estacao.nome
+    
+    imediatas = []
+    if parar_portico:
+        imediatas += [
+            ("hold_grbl", segurar_grbl),
+            ("soltar_dedo", lambda: soltar_dedos(alvo, descartar_normais=estacao is None)),
+        ]
+    imediatas.append(("desligar_ir", lambda: desligar_irs(alvo)))
+    finais = []
+    if parar_portico:
+        # Uma tarefa pode ter escrito P_1 entre o P_0 imediato e o cancelamento
+        finais += [
+            ("confirmar_dedo_solto", lambda: soltar_dedos(alvo, descartar_normais=False)),
+            ("grbl_parado", aguardar_grbl_parado),
+        ]
+    ultima_parada = await parada_segura(tarefas_ciclo, imediatas, finais, motivo,
+                                        f"estacao:{estacao.nome}" if estacao else None)
+    return ultima_parada
 
 @app.post("/stop_process")
 async def stop_process():
-    """Para o processo em execução"""
+    """Para o processo em execução: cancela os ciclos e só responde com a máquina parada"""
     global libera_envio_comandos, process_running, fingerdown_running
     try:
         libera_envio_comandos = False
         process_running = False
+        # Parada do operador descarta os STARTs pendentes
+        cancelados = agendador_ciclos.cancelar()
+        if cancelados:
+            print(f"🗂️ {len(cancelados)} pedido(s) retirado(s) da fila")
+        parada = await parar_ciclos("stop_process")
         fingerdown_running = False
-        await emergency_stop()
-        return {"status": "success", "message": "Processo parado"}
+        return {
+            "status": "success" if parada.maquina_parada else "warning",
+            "message": "Processo parado" if parada.maquina_parada else "Parada concluída com pendências",
+            "parada": parada.resumo()
+        }
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+@app.get("/tarefas_ciclo")
+async def get_tarefas_ciclo():
+    """Tarefas de ciclo em andamento e o relatório da última parada"""
+    return {
+        "status": "success",
+        **tarefas_ciclo.resumo(),
+        "ultima_parada": ultima_parada.resumo() if ultima_parada else None
+    }
+
 @app.post("/reset_system")
 async def reset_system():
     """Reseta o sistema"""
@@ -2303,94 +2910,60 @@ async def test_ir_sequence():
 async def listen_ir_data():
     """Escuta dados da porta IR (Nano)"""
     try:
-        if serial_port3 and serial_port3.is_open:
-            while serial_port3.is_open:
-                if serial_port3.in_waiting > 0:
-                    data = serial_port3.readline().decode().strip()
-                    if data:
-                        print(f"📟 DADO IR RECEBIDO: {data}")
-                await asyncio.sleep(0.1)
+        if porta_conectada(3):
+            while porta_conectada(3):
+                linha = await ler_linha_porta(3, "dados_ir", PADRAO_DADOS_IR, timeout=0.5)
+                if linha:
+                    print(f"📟 DADO IR RECEBIDO: {linha.texto}")
     except Exception as e:
         print(f"Erro na escuta IR: {e}")
 
+def registrar_resposta_porta1(linha: LinhaSerial):
+    """Respostas da porta 1 que não são START (chamado na thread leitora do transporte)"""
+    global last_pneumatic_message
+    print(f"📝 Comando recebido (não é START): {linha.texto}")
+    last_pneumatic_message = f"📝 Comando recebido (não é START): {linha.texto}"
+
 # Escuta comando START via pneumática (Porta 1)
 async def listen_pneumatic_start():
     """Escuta comando START via pneumática na Porta 1"""
-    global fingerdown_running, serial_port1, serial_port2, last_pneumatic_message
+    global fingerdown_running, last_pneumatic_message
     
     print("🔌 Iniciando escuta de comando START via pneumática (Porta 1)...")
     
     while True:
         try:
             # Verifica se as portas 1 e 2 estão conectadas
-            port1_connected = serial_port1 and serial_port1.is_open
-            port2_connected = serial_port2 and serial_port2.is_open
+            port1_connected = porta_conectada(1)
+            port2_connected = porta_conectada(2)
             
             if port1_connected and port2_connected:
-                # Verifica se há dados na porta 1
-                if serial_port1.in_waiting > 0:
-                    # Lê o comando
-                    data = serial_port1.readline().decode().strip()
+                # As outras linhas da porta 1 vão para a própria assinatura (nada é descartado aqui)
+                assinar_porta(1, "respostas_porta1", PADRAO_RESPOSTA_PORTA1, registrar_resposta_porta1)
+                linha = await ler_linha_porta(1, "start", PADRAO_START, timeout=0.5)
+                if linha is not None:
+                    print(f"📥 DADO RECEBIDO DA PNEUMÁTICA: {linha.texto}")
+                    print("🚀 COMANDO START RECEBIDO VIA PNEUMÁTICA!")
                     
-                    if data:
-                        print(f"📥 DADO RECEBIDO DA PNEUMÁTICA: {data}")
-                        
-                        # Verifica se é o comando START (case-insensitive)
-                        if data.upper() == "START":
-                            print("🚀 COMANDO START RECEBIDO VIA PNEUMÁTICA!")
-                            
-                            # Atualiza mensagem para a dashboard
-                            last_pneumatic_message = "🚀 START recebido via pneumática! Iniciando teste..."
-                            
-                            # Verifica se já não está executando
-                            if not fingerdown_running:
-                                # Limpa o buffer completamente antes de processar
-                                try:
-                                    serial_port1.reset_input_buffer()  # Limpa buffer de entrada
-                                    serial_port1.reset_output_buffer()  # Limpa buffer de saída
-                                    # Garante que não há dados pendentes
-                                    while serial_port1.in_waiting > 0:
-                                        serial_port1.read(serial_port1.in_waiting)
-                                    print("🧹 Buffer da Porta 1 completamente limpo")
-                                except Exception as e:
-                                    print(f"⚠️ Erro ao limpar buffer: {e}")
-                                
-                                # Executa o teste com fotos
-                                print("🎯 Iniciando teste via pneumática...")
-                                try:
-                                    # Executa o teste diretamente
-                                    asyncio.create_task(execute_start_with_photos())
-                                except Exception as e:
-                                    print(f"❌ Erro ao iniciar teste via pneumática: {e}")
-                                    last_pneumatic_message = f"❌ Erro ao iniciar teste: {str(e)}"
-                            else:
-                                print("⚠️ Teste já em execução, ignorando comando START")
-                                last_pneumatic_message = "⚠️ Teste já em execução, comando START ignorado"
-                                # Limpa o buffer mesmo se o teste estiver rodando
-                                try:
-                                    serial_port1.reset_input_buffer()
-                                    while serial_port1.in_waiting > 0:
-                                        serial_port1.read(serial_port1.in_waiting)
-                                except:
-                                    pass
-                        else:
-                            print(f"📝 Comando recebido (não é START): {data}")
-                            last_pneumatic_message = f"📝 Comando recebido (não é START): {data}"
-                            
-                            # Limpa o buffer mesmo se não for START
-                            try:
-                                serial_port1.reset_input_buffer()
-                                while serial_port1.in_waiting > 0:
-                                    serial_port1.read(serial_port1.in_waiting)
-                            except:
-                                pass
+                    # Atualiza mensagem para a dashboard
+                    last_pneumatic_message = "🚀 START recebido via pneumática! Iniciando teste..."
+                    
+                    # Com um ciclo rodando o START espera na fila em vez de ser descartado
+                    try:
+                        pedido = agendador_ciclos.enfileirar("pneumatica", fail_fast=FAIL_FAST_PADRAO)
+                        if agendador_ciclos.atual:
+                            last_pneumatic_message = f"🗂️ START na fila (posição {len(agendador_ciclos.fila)}, ETA {pedido.eta_s}s)"
+                        print("🎯 Teste via pneumática na fila")
+                    except ErroFilaCheia as e:
+                        print(f"⚠️ {e} - comando START ignorado")
+                        last_pneumatic_message = f"⚠️ {e}, comando START ignorado"
             else:
                 # Se as portas não estiverem conectadas, limpa a mensagem
                 if not port1_connected or not port2_connected:
                     last_pneumatic_message = None
-            
-            # Aguarda um pouco antes de verificar novamente
-            await asyncio.sleep(0.1)
+                
+                # Aguarda um pouco antes de verificar novamente
+                await asyncio.sleep(0.1)
             
         except Exception as e:
             print(f"❌ Erro na escuta pneumática: {e}")
@@ -2440,102 +3013,137 @@ async def get_serial_ports():
         }
 
 @app.get("/connect_port/{port_number}")
-async def connect_serial_port(port_number: int, port_name: str, baud_rate: int = None):
-    """Conecta a uma porta serial"""
-    global serial_port1, serial_port2, serial_port3, serial_port4
-    
+async def connect_serial_port(port_number: str, port_name: str, baud_rate: int = None):
+    """Conecta uma porta serial (id da porta, ex.: "grbl" ou "ir:berco2", ou número 1..4)"""
     try:
-        # Define baud rate padrão se não fornecido
-        if baud_rate is None:
-            if port_number == 3:
-                baud_rate = 9600
-            else:
-                baud_rate = 115200
-        
-        print(f"Tentando conectar porta {port_number}: {port_name} @ {baud_rate} baud")
-        
-        if port_number == 1:
-            if serial_port1 and serial_port1.is_open:
-                serial_port1.close()
-            serial_port1 = serial.Serial(port_name, baud_rate, timeout=1)
-            return {"status": "success", "message": f"Porta 1 conectada: {port_name} @ {baud_rate} baud"}
-        elif port_number == 2:
-            if serial_port2 and serial_port2.is_open:
-                serial_port2.close()
-            serial_port2 = serial.Serial(port_name, baud_rate, timeout=1)
-            return {"status": "success", "message": f"Porta 2 conectada: {port_name} @ {baud_rate} baud"}
-        elif port_number == 3:
-            if serial_port3 and serial_port3.is_open:
-                serial_port3.close()
-            serial_port3 = serial.Serial(port_name, baud_rate, timeout=1)
-            return {"status": "success", "message": f"Porta 3 conectada: {port_name} @ {baud_rate} baud"}
-        elif port_number == 4:
-            if serial_port4 and serial_port4.is_open:
-                serial_port4.close()
-            serial_port4 = serial.Serial(port_name, baud_rate, timeout=1)
-            return {"status": "success", "message": f"Porta 4 conectada: {port_name} @ {baud_rate} baud"}
-        else:
-            return {"status": "error", "message": "Número de porta inválido"}
+        porta = portas.obter(port_number)
+        # Baud padrão vem do papel da porta (ex.: 9600 para o Nano IR)
+        print(f"Tentando conectar {porta.rotulo} ({porta.id}): {port_name} @ {baud_rate or porta.config.baud_rate} baud")
+        if porta.id == "grbl":
+            fechar_controlador_grbl()
+        porta.abrir(port_name, baud_rate)
+        return {"status": "success", "message": f"{porta.rotulo} conectada: {port_name} @ {porta.config.baud_rate} baud"}
+    except ErroPorta as e:
+        return {"status": "error", "message": str(e)}
     except Exception as e:
         print(f"Erro ao conectar porta {port_number}: {e}")
         return {"status": "error", "message": str(e)}
 
 @app.get("/disconnect_port/{port_number}")
-async def disconnect_serial_port(port_number: int):
+async def disconnect_serial_port(port_number: str):
     """Desconecta uma porta serial"""
-    global serial_port1, serial_port2, serial_port3, serial_port4
-    
     try:
-        print(f"Desconectando porta {port_number}")
-        
-        if port_number == 1:
-            if serial_port1 and serial_port1.is_open:
-                serial_port1.close()
-                serial_port1 = None
-            return {"status": "success", "message": "Porta 1 desconectada"}
-        elif port_number == 2:
-            if serial_port2 and serial_port2.is_open:
-                serial_port2.close()
-                serial_port2 = None
-            return {"status": "success", "message": "Porta 2 desconectada"}
-        elif port_number == 3:
-            if serial_port3 and serial_port3.is_open:
-                serial_port3.close()
-                serial_port3 = None
-            return {"status": "success", "message": "Porta 3 desconectada"}
-        elif port_number == 4:
-            if serial_port4 and serial_port4.is_open:
-                serial_port4.close()
-                serial_port4 = None
-            return {"status": "success", "message": "Porta 4 desconectada"}
-        else:
-            return {"status": "error", "message": "Número de porta inválido"}
+        porta = portas.obter(port_number)
+        print(f"Desconectando {porta.rotulo} ({porta.id})")
+        if porta.id == "grbl":
+            fechar_controlador_grbl()
+        porta.fechar()
+        return {"status": "success", "message": f"{porta.rotulo} desconectada"}
+    except ErroPorta as e:
+        return {"status": "error", "message": str(e)}
     except Exception as e:
         print(f"Erro ao desconectar porta {port_number}: {e}")
         return {"status": "error", "message": str(e)}
 
+@app.get("/portas")
+async def get_portas():
+    """Portas registradas por papel/instância: configuração, saúde e estatísticas do transporte"""
+    return {"status": "success", "portas": portas.resumo()}
+
+@app.post("/portas")
+async def registrar_porta(request: Request):
+    """Registra outra instância de um papel; body: {"papel": "ir", "instancia": "berco2", "dispositivo": ...}"""
+    try:
+        body = await request.json()
+        config = ConfiguracaoPorta(
+            papel=body.get("papel", ""),
+            instancia=body.get("instancia"),
+            dispositivo=body.get("dispositivo"),
+            baud_rate=body.get("baud_rate"),
+            descricao=body.get("descricao"),
+        )
+        porta = portas.registrar(config)
+    except ErroPorta as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "porta": porta.resumo()}
+
+@app.delete("/portas/{porta_id}")
+async def remover_porta(porta_id: str):
+    """Fecha e remove uma porta registrada (as principais 1..4 ficam)"""
+    try:
+        portas.remover(porta_id)
+    except ErroPorta as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "message": f"Porta {porta_id} removida"}
+
+@app.get("/serial/transportes/{port_number}/linhas")
+async def get_linhas_serial(port_number: str, quantidade: int = 50):
+    """Últimas linhas recebidas na porta, com horário de chegada e assinaturas que as receberam"""
+    porta = portas.porta(port_number)
+    transporte = porta.transporte if porta is not None else None
+    if transporte is None:
+        raise HTTPException(status_code=404, detail=f"Porta {port_number} sem transporte ativo")
+    return {"status": "success", "porta": port_number, "linhas": transporte.ultimas_linhas(quantidade)}
+
+@app.get("/serial/transportes")
+async def get_transportes_serial():
+    """Linhas recebidas por porta, filas e latências (enfileirado -> escrito) das faixas de escrita"""
+    return {
+        "status": "success",
+        "portas": {id_: porta.transporte.resumo() for id_, porta in portas.portas.items() if porta.transporte is not None}
+    }
+
+@app.get("/grbl/status")
+async def get_grbl_status():
+    """Estado do controlador GRBL (buffer RX, linhas pendentes) e status em tempo real"""
+    controlador = obter_controlador_grbl()
+    if controlador is None:
+        return {"status": "error", "message": "Porta 2 não está conectada"}
+    loop = asyncio.get_running_loop()
+    status = await loop.run_in_executor(None, controlador.consultar_status)
+    return {"status": "success", "grbl": status.resumo() if status else None, "controlador": controlador.resumo()}
+
+@app.post("/grbl/transmitir")
+async def transmitir_grbl(request: Request):
+    """Transmite um programa G-code com contagem de caracteres; body: {"linhas": [...], "sincronizar": true}"""
+    controlador = obter_controlador_grbl()
+    if controlador is None:
+        return {"status": "error", "message": "Porta 2 não está conectada"}
+    try:
+        body = await request.json()
+        linhas = body.get("linhas", [])
+        loop = asyncio.get_running_loop()
+        inicio = time.time()
+        futuros = await loop.run_in_executor(None, controlador.transmitir, linhas)
+        if body.get("sincronizar", True):
+            futuros.append(controlador.sincronizar())
+        await loop.run_in_executor(None, controlador.aguardar, futuros, TIMEOUT_SEGURANCA_MOVIMENTO * max(len(futuros), 1))
+        return {
+            "status": "success",
+            "linhas": len(futuros),
+            "tempo_ms": round((time.time() - inicio) * 1000, 1),
+            "controlador": controlador.resumo()
+        }
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
 @app.post("/send_home/{port_number}")
-async def send_home_command(port_number: int):
+async def send_home_command(port_number: str):
     """Envia comando $H (Home)"""
-    global serial_port1, serial_port2
-    
     try:
-        if port_number == 1:
-            if not serial_port1 or not serial_port1.is_open:
-                return {"status": "error", "message": "Porta 1 não está conectada"}
-            print("Enviando comando $H (Home) para Porta 1")
-            serial_port1.write(b"$H\n")
-            
-        elif port_number == 2:
-            if not serial_port2 or not serial_port2.is_open:
-                return {"status": "error", "message": "Porta 2 não está conectada"}
-            print("Enviando comando $H (Home) para Porta 2")
-            serial_port2.write(b"$H\n")
-            
-        else:
+        porta = portas.porta(port_number)
+        if porta is None:
             return {"status": "error", "message": "Número de porta inválido"}
+        if not porta.conectada:
+            return {"status": "error", "message": f"{porta.rotulo} não está conectada"}
+        
+        print(f"Enviando comando $H (Home) para {porta.rotulo}")
+        if porta.id == "grbl":
+            await enviar_linha_grbl("$H")
+        else:
+            await escrever_porta(porta.id, b"$H\n")
         
-        return {"status": "success", "message": f"Comando $H (Home) enviado para Porta {port_number}"}
+        return {"status": "success", "message": f"Comando $H (Home) enviado para {porta.rotulo}"}
         
     except Exception as e:
         print(f"Erro ao enviar comando Home: {e}")
@@ -2671,6 +3279,235 @@ async def save_camera_frame(camera_id: int, filename: Optional[str] = None):
         "camera_id": camera_id
     }
 
+@app.post("/construir_modelos_referencia")
+async def construir_modelos_referencia_endpoint():
+    """Reconstrói os modelos estatísticos (.npz) a partir de todas as capturas de referência"""
+    try:
+        loop = asyncio.get_running_loop()
+        modelo = registro_modelos.modelo_ativo
+        resultado = await loop.run_in_executor(
+            None, construir_modelos_referencia, [modelo.referencia_dir], modelo.modelos_estatisticos_dir
+        )
+        return {"status": "success", **resultado}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+@app.post("/pacote_referencia/compilar")
+async def compilar_pacote_referencia_endpoint():
+    """Compila o diretório de referência do modelo ativo em um único pacote .refpack e o recarrega"""
+    try:
+        loop = asyncio.get_running_loop()
+        modelo = registro_modelos.modelo_ativo
+        resultado = await loop.run_in_executor(None, compilar_pacote, modelo.referencia_dir, modelo.pacote_path)
+        limpar_cache_referencias()
+        await loop.run_in_executor(None, registro_modelos.recarregar, modelo.nome)
+        return {"status": "success", **resultado}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+@app.post("/pacote_referencia/recarregar")
+async def recarregar_pacote_referencia_endpoint():
+    """Reabre o pacote de referência do modelo ativo (um único mmap, sem decodificar JPEGs)"""
+    loop = asyncio.get_running_loop()
+    modelo = await loop.run_in_executor(None, registro_modelos.recarregar, registro_modelos.ativo)
+    if modelo.pacote is None:
+        return {"status": "no_data", "message": "Nenhum pacote de referência disponível"}
+    return {"status": "success", "pacote": modelo.pacote.versao}
+
+@app.get("/pacote_referencia")
+async def get_pacote_referencia():
+    """Retorna a versão do pacote de referência em uso"""
+    pacote = registro_modelos.modelo_ativo.pacote
+    return {"status": "success", "pacote": pacote.versao if pacote else None}
+
+@app.get("/modelos")
+async def get_modelos():
+    """Lista os modelos de controle registrados e o modelo ativo"""
+    return {"status": "success", **registro_modelos.resumo()}
+
+@app.post("/modelos/{nome}/ativar")
+async def ativar_modelo(nome: str):
+    """Ativa um modelo para os próximos ciclos (espera a pré-carga, se estiver em andamento)"""
+    # Ciclo da fila, berço ou sequência sem fotos: o ponteiro do modelo ativo é lido durante o ciclo
+    if ciclo_em_andamento():
+        raise HTTPException(status_code=400, detail="Não é possível trocar de modelo durante um ciclo")
+    if nome not in registro_modelos.modelos:
+        raise HTTPException(status_code=404, detail=f"Modelo desconhecido: {nome}")
+    loop = asyncio.get_running_loop()
+    modelo = await loop.run_in_executor(None, registro_modelos.ativar, nome)
+    return {"status": "success", "modelo": modelo.resumo()}
+
+@app.post("/modelos/{nome}/pre_carregar")
+async def pre_carregar_modelo(nome: str):
+    """Agenda a carga do modelo em background (ex.: próximo lote de controles)"""
+    if nome not in registro_modelos.modelos:
+        raise HTTPException(status_code=404, detail=f"Modelo desconhecido: {nome}")
+    registro_modelos.pre_carregar(nome)
+    return {"status": "success", "message": f"Pré-carga de {nome} agendada"}
+
+@app.get("/modelos/identificar")
+async def identificar_modelo_endpoint():
+    """Identifica o modelo no berço com os frames atuais das câmeras"""
+    frames = {
+        camera_id: manager.get_frame()
+        for camera_id, manager in camera_managers.items()
+        if manager and manager.is_connected()
+    }
+    if not frames:
+        return {"status": "no_data", "message": "Nenhuma câmera conectada"}
+    loop = asyncio.get_running_loop()
+    identificacao = await loop.run_in_executor(None, identificar_modelo, registro_modelos, frames)
+    return {"status": "success", "esperado": registro_modelos.ativo, "identificacao": identificacao.resumo()}
+
+@app.get("/modelos/{nome}/rota")
+async def get_rota_modelo(nome: str):
+    """Plano de visita de menor deslocamento do modelo (usado no ciclo se config["otimizar_rota"])"""
+    if nome not in registro_modelos.modelos:
+        raise HTTPException(status_code=404, detail=f"Modelo desconhecido: {nome}")
+    modelo = registro_modelos.obter(nome)
+    plano = modelo.plano_rota()
+    return {
+        "status": "success",
+        "modelo": nome,
+        "otimizar_rota": modelo.otimizar_rota,
+        "plano": plano.resumo(),
+        "ordem_nomes": [modelo.test_coordinates[k].get('nome') for k in plano.ordem],
+    }
+
+@app.get("/modelos/{nome}/receita")
+async def get_receita_modelo(nome: str, com_fotos: bool = True, passos: bool = False):
+    """Receita do ciclo do modelo e o resumo do plano compilado (com os passos, se pedido)"""
+    if nome not in registro_modelos.modelos:
+        raise HTTPException(status_code=404, detail=f"Modelo desconhecido: {nome}")
+    modelo = registro_modelos.obter(nome)
+    plano = modelo.plano_execucao(com_fotos)
+    resposta = {"status": "success", "modelo": nome, "receita": modelo.receita, "plano": plano.resumo()}
+    if passos:
+        resposta["passos"] = [p.resumo() for p in plano.preparacao + plano.inicio + plano.botoes]
+    return resposta
+
+@app.get("/modelos/{nome}/simular")
+async def simular_ciclo_modelo(nome: str, com_fotos: bool = True, amostras: int = 1000, folgas: bool = False):
+    """Tempo de ciclo previsto do modelo (sem a bancada): percentis, caminho crítico e folgas"""
+    if nome not in registro_modelos.modelos:
+        raise HTTPException(status_code=404, detail=f"Modelo desconhecido: {nome}")
+    modelo = registro_modelos.obter(nome)
+    resultado = simular_plano(modelo.plano_execucao(com_fotos), amostras=amostras)
+    return {"status": "success", "modelo": nome, "simulacao": resultado.resumo(folgas)}
+
+def ciclo_em_andamento() -> bool:
+    """Algum ciclo rodando: FingerDown, sequência de botões (fingerdown_running volta a False assim que
+    ela é criada), pedido da fila ou ciclo de berço"""
+    return (fingerdown_running or libera_envio_comandos or agendador_ciclos.atual is not None
+            or any(estacao.executando for estacao in estacoes.values()))
+
+@app.put("/modelos/{nome}/receita")
+async def atualizar_receita_modelo(nome: str, request: Request):
+    """Valida e aplica seções da receita do modelo (salvas em modelos/<nome>_receita.json)"""
+    if ciclo_em_andamento():
+        raise HTTPException(status_code=400, detail="Não é possível alterar a receita durante um ciclo")
+    if nome not in registro_modelos.modelos:
+        raise HTTPException(status_code=404, detail=f"Modelo desconhecido: {nome}")
+    modelo = registro_modelos.obter(nome)
+    sobrescrita = await request.json()
+    arquivo = MODELOS_CONFIG_DIR / f"{nome}_receita.json"
+    try:
+        receita = carregar_receita({"receita": sobrescrita})
+        plano = compilar_receita(receita, modelo.test_coordinates, modelo.ordem_visita())
+    except ErroReceita as e:
+        raise HTTPException(status_code=400, detail=f"Receita inválida: {e}")
+    
+    arquivo.parent.mkdir(exist_ok=True)
+    with open(arquivo, 'w', encoding='utf-8') as f:
+        json.dump(sobrescrita, f, indent=2, ensure_ascii=False)
+    modelo.config.pop("receita", None)
+    modelo.receita = receita
+    print(f"🧾 Receita do {nome} atualizada: {plano.resumo()}")
+    return {"status": "success", "modelo": nome, "arquivo": str(arquivo), "plano": plano.resumo()}
+
+@app.get("/modelos/{nome}/tempos")
+async def get_tempos_modelo(nome: str, com_fotos: bool = True):
+    """Tempos medidos por botão (display e IR), propostas de espera/timeout e estado da volta para a receita"""
+    if nome not in registro_modelos.modelos:
+        raise HTTPException(status_code=404, detail=f"Modelo desconhecido: {nome}")
+    modelo = registro_modelos.obter(nome)
+    tempos = modelo.tempos_adaptativos()
+    return {"status": "success", "tempos": tempos.resumo(esperas_receita(modelo.plano_execucao(com_fotos)))}
+
+@app.post("/modelos/{nome}/tempos/modo")
+async def definir_modo_tempos_modelo(nome: str, modo: str):
+    """desligado, propor (só mede) ou aplicar (usa as esperas propostas) - salvo em modelos/<nome>_tempos.json"""
+    if nome not in registro_modelos.modelos:
+        raise HTTPException(status_code=404, detail=f"Modelo desconhecido: {nome}")
+    tempos = registro_modelos.obter(nome).tempos_adaptativos()
+    try:
+        tempos.definir_modo(modo)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    tempos.salvar()
+    print(f"⏱️ Tempos adaptativos do {nome}: modo {modo}")
+    return {"status": "success", "modelo": nome, "modo": modo}
+
+@app.delete("/modelos/{nome}/tempos")
+async def zerar_tempos_modelo(nome: str):
+    """Descarta as medições do modelo (ex.: depois de trocar a receita ou o firmware do controle)"""
+    if ciclo_em_andamento():
+        raise HTTPException(status_code=400, detail="Não é possível zerar os tempos durante um ciclo")
+    if nome not in registro_modelos.modelos:
+        raise HTTPException(status_code=404, detail=f"Modelo desconhecido: {nome}")
+    tempos = registro_modelos.obter(nome).tempos_adaptativos()
+    tempos.zerar()
+    tempos.salvar()
+    return {"status": "success", "modelo": nome, "tempos": tempos.resumo()}
+
+@app.get("/estacoes")
+async def get_estacoes():
+    """Berços, estado de cada ciclo e uso do pórtico compartilhado"""
+    return {"estacoes": [estacao.resumo() for estacao in estacoes.values()], "portico": portico.resumo()}
+
+@app.post("/estacoes/{nome}/start")
+async def start_estacao(nome: str, modelo: Optional[str] = None, fail_fast: bool = False, reteste: Optional[str] = None):
+    """Inicia o ciclo com fotos em um berço; o outro berço pode estar rodando ao mesmo tempo"""
+    estacao = estacoes.get(nome)
+    if estacao is None:
+        raise HTTPException(status_code=404, detail=f"Estação desconhecida: {nome}")
+    if not estacao.habilitada:
+        raise HTTPException(status_code=400, detail=f"{estacao.descricao} desabilitado (configure estacoes.json)")
+    if estacao.executando:
+        raise HTTPException(status_code=400, detail=f"{estacao.descricao} já em execução")
+    if fingerdown_running or libera_envio_comandos:
+        raise HTTPException(status_code=400, detail="Ciclo único em execução")
+    modelo = modelo or estacao.modelo or registro_modelos.ativo
+    if modelo not in registro_modelos.modelos:
+        raise HTTPException(status_code=404, detail=f"Modelo desconhecido: {modelo}")
+    if not (porta_conectada(1) and porta_conectada(2)):
+        raise HTTPException(status_code=400, detail="Portas necessárias não conectadas")
+    reteste_ciclo = None
+    if reteste:
+        try:
+            reteste_ciclo = carregar_reteste(localizar_resultado(reteste, estacao.resultados_dir), modelo,
+                                             len(registro_modelos.obter(modelo).test_coordinates))
+        except ErroReteste as e:
+            raise HTTPException(status_code=404, detail=str(e))
+    
+    estacao.executando = True
+    estacao.liberada = True
+    estacao.ciclo += 1
+    estacao.modelo = modelo
+    estacao.mensagem = None
+    tarefas_ciclo.criar(f"ciclo_{nome}", executar_ciclo_estacao(estacao, fail_fast, reteste_ciclo), grupo=f"estacao:{nome}")
+    return {"status": "success", "message": f"Ciclo iniciado no {estacao.descricao}", "estacao": estacao.resumo()}
+
+@app.post("/estacoes/{nome}/stop")
+async def stop_estacao(nome: str):
+    """Cancela o ciclo do berço com parada segura (o outro berço continua)"""
+    estacao = estacoes.get(nome)
+    if estacao is None:
+        raise HTTPException(status_code=404, detail=f"Estação desconhecida: {nome}")
+    parada = await parar_ciclos(f"stop {nome}", estacao)
+    return {"status": "success", "message": f"{estacao.descricao} interrompido", "estacao": estacao.resumo(),
+            "parada": parada.resumo()}
+
 # Endpoint para listar todas as rotas
 @app.get("/get_test_report")
 async def get_test_report():
@@ -2690,10 +3527,10 @@ async def get_test_report():
 @app.get("/get_pneumatic_message")
 async def get_pneumatic_message():
     """Retorna a última mensagem recebida via pneumática"""
-    global last_pneumatic_message, serial_port1, serial_port2
+    global last_pneumatic_message
     
-    port1_connected = serial_port1 and serial_port1.is_open
-    port2_connected = serial_port2 and serial_port2.is_open
+    port1_connected = porta_conectada(1)
+    port2_connected = porta_conectada(2)
     
     return {
         "status": "success",
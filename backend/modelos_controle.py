@@ -0,0 +1,245 @@
+"""
+==============================================
+REGISTRO DE MODELOS DE CONTROLE REMOTO
+==============================================
+Cada modelo tem seu mapa de botões, coordenadas e dados de referência
+(pacote .refpack + modelos estatísticos). O modelo ativo é escolhido por
+ciclo; o próximo pode ser pré-carregado em background enquanto o ciclo
+atual roda, para a troca não ter cold load.
+
+Modelos adicionais são lidos de modelos/<nome>.json:
+    {
+        "nome": "modelo2",
+        "referencia_dir": "camera_photos_modelo2",
+        "test_coordinates": [{"command": "G90", "x": 41, "y": 135, "nome": "POWER"}, ...],
+        "config": {"lcd": {...}, "otimizar_rota": true, "restricoes_rota": {"primeiro": ["POWER"], ...}}
+    }
+
+Com "otimizar_rota" os botões são visitados na ordem de menor deslocamento
+(ver planejador_rota.py); fica desligado por padrão porque o estado do
+display em cada referência depende da ordem em que ela foi capturada.
+
+As máscaras do LCD (ver decodificador_lcd.py) e a receita do ciclo (ver
+receita_teste.py) também podem ficar em modelos/<nome>_lcd.json e
+modelos/<nome>_receita.json.
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import json
+import threading
+import time
+
+import numpy as np
+
+from decodificador_lcd import DecodificadorLCD, carregar_decodificador
+from pacote_referencia import PacoteReferencia, compilar_pacote, pacote_desatualizado, resolver_pacote
+from planejador_rota import PlanoRota, obter_plano
+from receita_teste import PlanoExecucao, carregar_receita, compilar_receita
+from referencia_estatistica import MODELOS_DIR_PADRAO, carregar_modelo_referencia
+from tempos_adaptativos import TemposAdaptativos
+
+MODELOS_CONFIG_DIR = Path("modelos")
+
+
+@dataclass
+class ModeloControle:
+    """Receita de dados de um modelo de controle remoto"""
+    nome: str
+    test_coordinates: List[Dict[str, Any]]
+    referencia_dir: Path
+    modelos_estatisticos_dir: Path = MODELOS_DIR_PADRAO
+    pacote: Optional[PacoteReferencia] = None
+    decodificador_lcd: Optional[DecodificadorLCD] = None
+    carregado_em: Optional[str] = None
+    tempo_carga_ms: Optional[float] = None
+    config: Dict[str, Any] = field(default_factory=dict)
+    receita: Optional[Dict[str, Any]] = None
+    tempos: Optional[TemposAdaptativos] = None
+
+    @property
+    def pacote_path(self) -> Path:
+        return self.referencia_dir.with_suffix(".refpack")
+
+    @property
+    def carregado(self) -> bool:
+        return self.carregado_em is not None
+
+    def carregar(self):
+        """Abre o pacote de referência e aquece o cache de páginas e dos modelos estatísticos"""
+        inicio = time.perf_counter()
+
+        self.pacote = self._abrir_pacote()
+        if self.pacote is not None:
+            # Toca todas as páginas do memmap para trazê-las ao page cache
+            for entrada in self.pacote.entradas.values():
+                np.bitwise_or.reduce(entrada.gray, axis=None)
+
+        self.decodificador_lcd = carregar_decodificador(self.config, MODELOS_CONFIG_DIR / f"{self.nome}_lcd.json")
+        self.receita = carregar_receita(self.config, MODELOS_CONFIG_DIR / f"{self.nome}_receita.json")
+        if self.otimizar_rota:
+            self.plano_rota()
+
+        for i, coord in enumerate(self.test_coordinates):
+            nome_botao = coord.get('nome', f'Botão {i+1}')
+            for camera_id in range(4):
+                carregar_modelo_referencia(i + 1, nome_botao, camera_id, self.modelos_estatisticos_dir)
+
+        self.tempo_carga_ms = (time.perf_counter() - inicio) * 1000
+        self.carregado_em = datetime.now().isoformat()
+        print(f"📦 Modelo {self.nome} carregado em {self.tempo_carga_ms:.1f} ms "
+              f"(pacote: {'sim' if self.pacote else 'não'}, LCD: {'sim' if self.decodificador_lcd else 'não'})")
+
+    def _abrir_pacote(self) -> Optional[PacoteReferencia]:
+        """Pacote em uso; desatualizado em relação às imagens, é recompilado (ou ignorado, usando os JPEGs)"""
+        caminho = resolver_pacote(self.pacote_path)
+        if caminho is None:
+            return None
+        pacote = PacoteReferencia(caminho)
+        motivo = pacote_desatualizado(pacote, self.referencia_dir)
+        if motivo is None:
+            return pacote
+        print(f"⚠️ Pacote de referência de {self.nome} desatualizado ({motivo}) - recompilando")
+        try:
+            compilar_pacote(self.referencia_dir, self.pacote_path)
+            return PacoteReferencia(resolver_pacote(self.pacote_path))
+        except Exception as e:
+            print(f"⚠️ Erro ao recompilar o pacote de {self.nome}: {e} - usando as imagens de referência")
+            return None
+
+    @property
+    def otimizar_rota(self) -> bool:
+        return bool(self.config.get("otimizar_rota", False))
+
+    def plano_rota(self) -> PlanoRota:
+        return obter_plano(self.nome, self.test_coordinates, self.config.get("restricoes_rota"))
+
+    def ordem_visita(self) -> List[int]:
+        """Índices de test_coordinates na ordem em que o ciclo pressiona os botões"""
+        if not self.otimizar_rota:
+            return list(range(len(self.test_coordinates)))
+        return self.plano_rota().ordem
+
+    def plano_execucao(self, com_fotos: bool = True, ordem: Optional[List[int]] = None) -> PlanoExecucao:
+        """Receita do modelo compilada para a ordem de visita atual (ou só para os botões de ordem)"""
+        if self.receita is None:
+            self.receita = carregar_receita(self.config, MODELOS_CONFIG_DIR / f"{self.nome}_receita.json")
+        return compilar_receita(self.receita, self.test_coordinates, self.ordem_visita() if ordem is None else ordem, com_fotos)
+
+    def tempos_adaptativos(self) -> TemposAdaptativos:
+        """Estatísticas de tempo por botão do modelo (modelos/<nome>_tempos.json)"""
+        if self.tempos is None:
+            self.tempos = TemposAdaptativos(self.nome, MODELOS_CONFIG_DIR / f"{self.nome}_tempos.json",
+                                            self.config.get("tempos_adaptativos"))
+        return self.tempos
+
+    def resumo(self) -> Dict[str, Any]:
+        return {
+            "nome": self.nome,
+            "total_botoes": len(self.test_coordinates),
+            "referencia_dir": str(self.referencia_dir),
+            "carregado": self.carregado,
+            "carregado_em": self.carregado_em,
+            "tempo_carga_ms": round(self.tempo_carga_ms, 1) if self.tempo_carga_ms is not None else None,
+            "pacote": self.pacote.versao if self.pacote else None,
+            "lcd": self.decodificador_lcd is not None,
+            "otimizar_rota": self.otimizar_rota,
+        }
+
+    @classmethod
+    def de_json(cls, dados: Dict[str, Any]) -> "ModeloControle":
+        return cls(
+            nome=dados["nome"],
+            test_coordinates=dados["test_coordinates"],
+            referencia_dir=Path(dados.get("referencia_dir", f"camera_photos_{dados['nome']}")),
+            modelos_estatisticos_dir=Path(dados.get("modelos_estatisticos_dir", MODELOS_DIR_PADRAO / dados["nome"])),
+            config=dados.get("config", {}),
+        )
+
+
+class RegistroModelos:
+    """Modelos conhecidos, modelo ativo e pré-carga em background"""
+
+    def __init__(self):
+        self.modelos: Dict[str, ModeloControle] = {}
+        self.ativo: Optional[str] = None
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ModeloPrefetch")
+        self.pre_cargas: Dict[str, Future] = {}
+
+    def registrar(self, modelo: ModeloControle):
+        with self.lock:
+            self.modelos[modelo.nome] = modelo
+            if self.ativo is None:
+                self.ativo = modelo.nome
+
+    def carregar_diretorio(self, diretorio: Path = MODELOS_CONFIG_DIR) -> List[str]:
+        """Registra todos os modelos descritos em <diretorio>/*.json"""
+        nomes = []
+        if not diretorio.exists():
+            return nomes
+        for arquivo in sorted(diretorio.glob("*.json")):
+            try:
+                with open(arquivo, 'r', encoding='utf-8') as f:
+                    modelo = ModeloControle.de_json(json.load(f))
+                self.registrar(modelo)
+                nomes.append(modelo.nome)
+            except Exception as e:
+                print(f"⚠️ Erro ao carregar modelo {arquivo.name}: {e}")
+        return nomes
+
+    def obter(self, nome: str) -> ModeloControle:
+        with self.lock:
+            if nome not in self.modelos:
+                raise KeyError(f"Modelo desconhecido: {nome}")
+            return self.modelos[nome]
+
+    @property
+    def modelo_ativo(self) -> ModeloControle:
+        with self.lock:
+            return self.modelos[self.ativo]
+
+    def pre_carregar(self, nome: str, forcar: bool = False) -> Future:
+        """Agenda a carga do modelo em background (idempotente enquanto não for forçada)"""
+        modelo = self.obter(nome)
+        with self.lock:
+            futuro = self.pre_cargas.get(nome)
+            if futuro is not None and not forcar and (not futuro.done() or modelo.carregado):
+                return futuro
+            futuro = self.executor.submit(modelo.carregar)
+            self.pre_cargas[nome] = futuro
+            return futuro
+
+    def obter_carregado(self, nome: str) -> ModeloControle:
+        """Modelo com os dados de referência carregados, sem trocar o modelo ativo (ex.: ciclo de um berço)"""
+        modelo = self.obter(nome)
+        if not modelo.carregado:
+            self.pre_carregar(nome).result()
+        return modelo
+
+    def ativar(self, nome: str) -> ModeloControle:
+        """Ativa o modelo; se a pré-carga estiver em andamento só espera ela terminar"""
+        modelo = self.obter_carregado(nome)
+        with self.lock:
+            anterior = self.ativo
+            self.ativo = nome
+        if anterior != nome:
+            print(f"🔁 Modelo ativo: {anterior} -> {nome}")
+        return modelo
+
+    def recarregar(self, nome: str) -> ModeloControle:
+        """Força nova carga (ex.: após recompilar o pacote de referência)"""
+        self.pre_carregar(nome, forcar=True).result()
+        return self.obter(nome)
+
+    def resumo(self) -> Dict[str, Any]:
+        with self.lock:
+            modelos = list(self.modelos.values())
+            ativo = self.ativo
+        return {
+            "ativo": ativo,
+            "modelos": [m.resumo() for m in modelos],
+        }
@@ -0,0 +1,143 @@
+"""
+==============================================
+MODOS DO CICLO: COMPLETO, FAIL-FAST E RETESTE
+==============================================
+    completo    - pressiona todos os botões da ordem de visita
+    fail_fast   - para de pressionar os botões de um controle assim que a
+                  reprovação dele já está decidida pela regra dos 80% /
+                  similaridade 0.70 (ver veredito_antecipado); o ciclo
+                  termina quando só restam botões de controles reprovados
+    reteste     - lê o JSON de um ciclo anterior em test_results e pressiona
+                  só os botões reprovados ou sem referência; os aprovados
+                  entram no relatório como reaproveitados
+
+Os modos se combinam: um reteste também pode parar cedo com fail_fast.
+"""
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+import json
+
+from validacao_imagens import veredito_antecipado
+
+RESULTADOS_DIR_PADRAO = Path("test_results")
+
+
+class ErroReteste(ValueError):
+    pass
+
+
+@dataclass
+class Reteste:
+    """Botões a repetir de um ciclo anterior e os já aprovados que são reaproveitados"""
+    origem: Path
+    modelo: Optional[str]
+    botoes: Set[int]  # botao_numero (índice + 1)
+    reaproveitados: List[Dict[str, Any]] = field(default_factory=list)
+
+    def resumo(self) -> Dict[str, Any]:
+        return {
+            "origem": str(self.origem),
+            "modelo": self.modelo,
+            "botoes_retestados": sorted(self.botoes),
+            "botoes_reaproveitados": sorted(d.get("botao_numero") for d in self.reaproveitados),
+        }
+
+
+def localizar_resultado(referencia: Optional[str] = None, resultados_dir: Path = RESULTADOS_DIR_PADRAO) -> Path:
+    """JSON de resultado: caminho do arquivo, diretório do ciclo ou None/"ultimo" (o mais recente)"""
+    if referencia and referencia != "ultimo":
+        caminho = Path(referencia)
+        if not caminho.exists() and (resultados_dir / referencia).exists():
+            caminho = resultados_dir / referencia
+        if caminho.is_dir():
+            candidatos = sorted(caminho.glob("resultado_teste_*.json"))
+        elif caminho.is_file():
+            return caminho
+        else:
+            raise ErroReteste(f"Resultado não encontrado: {referencia}")
+    else:
+        candidatos = sorted(resultados_dir.glob("ciclo_*/resultado_teste_*.json"), key=lambda p: p.stat().st_mtime)
+    if not candidatos:
+        raise ErroReteste(f"Nenhum resultado de ciclo em {referencia or resultados_dir}")
+    return candidatos[-1]
+
+
+def _precisa_retestar(dados_botao: Dict[str, Any]) -> bool:
+    validacao = dados_botao.get("validacao") or {}
+    por_camera = validacao.get("validacoes_por_camera") or []
+    sem_referencia = not por_camera or not all(v.get("imagem_referencia_encontrada") for v in por_camera)
+    return not validacao.get("aprovado", False) or sem_referencia
+
+
+def carregar_reteste(arquivo: Path, nome_modelo: Optional[str] = None, total_botoes: Optional[int] = None) -> Reteste:
+    """Separa os botões do ciclo anterior em retestar (reprovados/sem referência) e reaproveitar
+
+    Botões do modelo ausentes do resultado (pulados pelo fail-fast ou ciclo interrompido) são retestados.
+    Sem nenhum botão a retestar levanta ErroReteste (o ciclo não teria o que pressionar).
+    """
+    try:
+        with open(arquivo, "r", encoding="utf-8") as f:
+            dados = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ErroReteste(f"Não foi possível ler {arquivo}: {e}")
+
+    modelo = (dados.get("metadata") or {}).get("modelo")
+    if nome_modelo and modelo and modelo != nome_modelo:
+        raise ErroReteste(f"{arquivo.name} é do {modelo}, não do {nome_modelo}")
+
+    botoes, reaproveitados = set(), []
+    for dados_botao in dados.get("botoes_mapeados", []):
+        if _precisa_retestar(dados_botao):
+            botoes.add(int(dados_botao["botao_numero"]))
+        else:
+            reaproveitados.append({**dados_botao, "reaproveitado_de": str(arquivo)})
+    if total_botoes is not None:
+        presentes = {int(d["botao_numero"]) for d in dados.get("botoes_mapeados", [])}
+        botoes |= set(range(1, total_botoes + 1)) - presentes
+    if not botoes:
+        raise ErroReteste(f"{arquivo.name}: todos os botões foram aprovados, nada a retestar")
+    return Reteste(arquivo, modelo, botoes, reaproveitados)
+
+
+class PlacarControles:
+    """Aprovações por controle conforme as validações terminam, para decidir o veredito antes do fim"""
+
+    def __init__(self, controle_por_botao: Dict[int, int]):
+        # botao_numero -> controle; o total de cada controle conta todos os botões do modelo
+        self.controle_por_botao = dict(controle_por_botao)
+        self.totais: Dict[int, int] = {}
+        for controle in self.controle_por_botao.values():
+            self.totais[controle] = self.totais.get(controle, 0) + 1
+        self.avaliados: Dict[int, int] = {c: 0 for c in self.totais}
+        self.aprovados: Dict[int, int] = {c: 0 for c in self.totais}
+        self.similaridades: Dict[int, float] = {c: 0.0 for c in self.totais}
+        self.registrados: Set[int] = set()
+
+    def registrar(self, botao_numero: int, aprovado: bool, similaridade: float):
+        if botao_numero in self.registrados or botao_numero not in self.controle_por_botao:
+            return
+        self.registrados.add(botao_numero)
+        controle = self.controle_por_botao[botao_numero]
+        self.avaliados[controle] += 1
+        self.aprovados[controle] += int(bool(aprovado))
+        self.similaridades[controle] += similaridade
+
+    def veredito(self, controle: int) -> Optional[bool]:
+        return veredito_antecipado(self.aprovados[controle], self.similaridades[controle],
+                                   self.avaliados[controle], self.totais[controle])
+
+    def reprovados(self) -> Set[int]:
+        return {c for c in self.totais if self.veredito(c) is False}
+
+    def resumo(self) -> Dict[str, Any]:
+        return {
+            str(c): {
+                "avaliados": self.avaliados[c],
+                "total": self.totais[c],
+                "aprovados": self.aprovados[c],
+                "veredito": {True: "aprovado", False: "reprovado", None: "indefinido"}[self.veredito(c)],
+            }
+            for c in sorted(self.totais)
+        }
@@ -0,0 +1,386 @@
+"""
+==============================================
+MOVIMENTO GRBL POR CONFIRMAÇÃO
+==============================================
+Camada de movimento da porta 2 (GRBL): em vez de dormir um tempo fixo
+depois de cada G-code, lê as respostas do GRBL (ok / error:N / ALARM:N)
+e consulta o status em tempo real (?) até a máquina voltar a Idle. O
+movimento termina assim que o GRBL termina; o timeout é só uma rede de
+segurança.
+
+Streaming: as linhas são enviadas pelo protocolo de contagem de
+caracteres - cada linha ocupa len(linha)+1 bytes do buffer RX de 128
+bytes do GRBL até o seu ok, e novas linhas são escritas enquanto
+houver espaço. O planner do GRBL recebe vários movimentos à frente e
+pode encadeá-los; pontos de sincronização (G4 P0 ou status Idle) marcam
+onde a máquina precisa estar parada, por exemplo antes de pressionar.
+
+Uma thread leitora é dona das leituras da porta; as escritas podem vir
+de qualquer thread. Com um TransporteSerial, a thread leitora é a do
+transporte e o controlador assina só as respostas do GRBL
+(PADRAO_RESPOSTAS); as linhas de G-code vão pela faixa normal e os bytes
+de tempo real (?, !) pela prioritária.
+"""
+
+from collections import deque
+from concurrent.futures import Future, TimeoutError as TimeoutFuturo
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+import re
+import threading
+import time
+
+# Intervalo entre consultas de status (?) enquanto espera o Idle
+INTERVALO_STATUS = 0.02
+
+# Tempo máximo esperando a resposta de uma consulta de status
+TIMEOUT_STATUS = 0.5
+
+# Rede de segurança de um movimento completo (ok + Idle)
+TIMEOUT_SEGURANCA_MOVIMENTO = 10.0
+
+# Buffer serial de recepção do GRBL (RX_BUFFER_SIZE) usado na contagem de caracteres
+TAMANHO_BUFFER_RX = 128
+
+# Tempo máximo esperando espaço no buffer RX para escrever uma linha
+TIMEOUT_BUFFER = 30.0
+
+# Dwell zero: o GRBL só confirma depois de esvaziar o planner (máquina parada)
+LINHA_SINCRONIZACAO = "G4 P0"
+
+# Estados em que a máquina ainda está se movendo
+ESTADOS_MOVIMENTO = ("Run", "Jog", "Home")
+
+# Linhas do GRBL assinadas no transporte: ok/error, status, alarme, banner e mensagens [..]
+PADRAO_RESPOSTAS = re.compile(r"^(ok|error|<|ALARM|Grbl|\[)")
+
+PADRAO_POSICAO = re.compile(r"(MPos|WPos):([-\d.]+),([-\d.]+)(?:,([-\d.]+))?")
+
+
+class ErroGRBL(Exception):
+    """Resposta de erro, alarme ou reset do GRBL"""
+    pass
+
+
+@dataclass
+class StatusGRBL:
+    """Relatório de status em tempo real (<Idle|MPos:...|...>)"""
+    estado: str
+    posicao: Optional[Tuple[float, ...]]
+    bruto: str
+    recebido_em: float
+
+    def resumo(self) -> Dict[str, Any]:
+        return {"estado": self.estado, "posicao": self.posicao, "bruto": self.bruto}
+
+
+def interpretar_status(linha: str) -> Optional[StatusGRBL]:
+    """Interpreta um relatório de status do GRBL 0.9/1.1"""
+    if not (linha.startswith("<") and linha.endswith(">")):
+        return None
+    campos = re.split(r"[|,]", linha[1:-1], maxsplit=1)
+    estado = campos[0].split(":")[0]  # "Hold:0" -> "Hold"
+    match = PADRAO_POSICAO.search(linha)
+    posicao = tuple(float(v) for v in match.groups()[1:] if v is not None) if match else None
+    return StatusGRBL(estado=estado, posicao=posicao, bruto=linha, recebido_em=time.monotonic())
+
+
+class ControladorGRBL:
+    """Dono das leituras da porta GRBL: casa cada ok/error com a linha enviada e guarda o último status"""
+
+    def __init__(self, port, lock_escrita: Optional[threading.Lock] = None, transporte=None):
+        self.port = port
+        self.lock_escrita = lock_escrita or threading.Lock()
+        self.transporte = transporte
+        self.condicao = threading.Condition()
+        self.lock_linhas = threading.Lock()  # garante a mesma ordem na fila e na porta
+        self.pendentes: Deque[Tuple[str, Future, int]] = deque()
+        self.bytes_no_buffer = 0
+        self.pico_buffer = 0
+        self.linhas_enviadas = 0
+        self.linhas_confirmadas = 0
+        self.status: Optional[StatusGRBL] = None
+        self.sequencia_status = 0
+        self.alarme: Optional[str] = None
+        # Parada: movimentos recusados até o soft reset (ou rearmar)
+        self.abortado: Optional[str] = None
+        self.executando = True
+        self.assinatura = None
+        if transporte is not None:
+            self.thread = None
+            self.assinatura = transporte.assinar(
+                "grbl", PADRAO_RESPOSTAS, lambda linha: self._processar_linha(linha.texto), self._leitura_encerrada
+            )
+        else:
+            self.thread = threading.Thread(target=self._loop_leitura, daemon=True, name="GRBLLeitor")
+            self.thread.start()
+
+    # ---------- leitura ----------
+
+    def _loop_leitura(self):
+        while self.executando:
+            try:
+                if not self.port or not self.port.is_open:
+                    break
+                bruto = self.port.readline()
+            except Exception as e:
+                print(f"⚠️ Leitura GRBL interrompida: {e}")
+                break
+            if not bruto:
+                continue
+            linha = bruto.decode(errors="ignore").strip()
+            if linha:
+                self._processar_linha(linha)
+        self._leitura_encerrada()
+
+    def _leitura_encerrada(self):
+        self.executando = False
+        self._falhar_pendentes(ErroGRBL("Leitura da porta GRBL encerrada"))
+
+    def _processar_linha(self, linha: str):
+        if linha == "ok" or linha.startswith("error"):
+            with self.condicao:
+                enviado = self.pendentes.popleft() if self.pendentes else None
+                if enviado is not None:
+                    # Linha saiu do buffer RX: libera os bytes para a próxima
+                    self.bytes_no_buffer -= enviado[2]
+                    self.linhas_confirmadas += 1
+                self._confirmar(enviado, linha)
+                self.condicao.notify_all()
+            if enviado is None:
+                # ok de linha enviada fora do controlador (ex.: escrita direta na porta)
+                return
+            if linha != "ok":
+                print(f"❌ GRBL rejeitou '{enviado[0]}': {linha}")
+        elif linha.startswith("<"):
+            status = interpretar_status(linha)
+            if status is not None:
+                with self.condicao:
+                    self.status = status
+                    self.sequencia_status += 1
+                    if status.estado == "Alarm" and self.alarme is None:
+                        self.alarme = linha
+                    self.condicao.notify_all()
+        elif linha.startswith("ALARM"):
+            print(f"🚨 GRBL: {linha}")
+            with self.condicao:
+                self.alarme = linha
+            self._falhar_pendentes(ErroGRBL(linha))
+        elif linha.startswith("Grbl"):
+            # Banner de reset: tudo que estava no buffer do GRBL foi descartado
+            print(f"🔄 GRBL reiniciado: {linha}")
+            with self.condicao:
+                self.alarme = None
+                self.abortado = None
+            self._falhar_pendentes(ErroGRBL("GRBL reiniciado"))
+        else:
+            print(f"ℹ️ GRBL: {linha}")
+
+    def _confirmar(self, enviado: Optional[Tuple[str, Future, int]], resposta: str):
+        """Resolve o futuro da linha confirmada (chamado com a condição adquirida)"""
+        if enviado is None:
+            return
+        futuro = enviado[1]
+        if resposta == "ok":
+            futuro.set_result(resposta)
+        else:
+            futuro.set_exception(ErroGRBL(f"{enviado[0]}: {resposta}"))
+
+    def _falhar_pendentes(self, erro: Exception):
+        with self.condicao:
+            while self.pendentes:
+                _, futuro, _ = self.pendentes.popleft()
+                if not futuro.done():
+                    futuro.set_exception(erro)
+            self.bytes_no_buffer = 0
+            self.condicao.notify_all()
+
+    # ---------- escrita ----------
+
+    def _escrever(self, dados: bytes, prioridade: bool = False, descartar_normais: bool = False) -> Optional[Future]:
+        """Escreve os bytes; com transporte devolve o futuro da escrita (falha se ela foi descartada)"""
+        if self.transporte is not None:
+            return self.transporte.escrever(dados, prioridade, descartar_normais)
+        with self.lock_escrita:
+            self.port.write(dados)
+        return None
+
+    def _escrita_concluida(self, escrita: Future, futuro: Future):
+        """Linha que não saiu na porta (descartada pela parada ou erro de escrita) não terá ok:
+        sai da contagem do buffer RX para os próximos ok casarem com as linhas certas"""
+        erro = escrita.exception()
+        if erro is None:
+            return
+        with self.condicao:
+            for i, enviado in enumerate(self.pendentes):
+                if enviado[1] is futuro:
+                    del self.pendentes[i]
+                    self.bytes_no_buffer -= enviado[2]
+                    break
+            else:
+                return
+            self.condicao.notify_all()
+        if not futuro.done():
+            futuro.set_exception(ErroGRBL(f"{enviado[0]}: não enviada ({erro})"))
+
+    def enviar_linha(self, linha: str, timeout: float = TIMEOUT_BUFFER) -> Future:
+        """Envia uma linha de G-code assim que couber no buffer RX do GRBL
+
+        O futuro é resolvido no ok (ou falha no error/ALARM/reset).
+        """
+        linha = linha.strip()
+        dados = f"{linha}\n".encode()
+        if len(dados) > TAMANHO_BUFFER_RX:
+            raise ValueError(f"Linha maior que o buffer RX do GRBL ({len(dados)} bytes): {linha}")
+
+        futuro: Future = Future()
+        with self.lock_linhas:
+            with self.condicao:
+                # Contagem de caracteres: só escreve se a linha couber no que falta confirmar
+                if not self.condicao.wait_for(
+                    lambda: self.bytes_no_buffer + len(dados) <= TAMANHO_BUFFER_RX or not self.executando, timeout
+                ):
+                    raise TimeoutError(f"Buffer RX do GRBL sem espaço por {timeout:.1f}s")
+                if not self.executando:
+                    raise ErroGRBL("Controlador GRBL parado")
+                if self.abortado:
+                    raise ErroGRBL(f"Movimento abortado: {self.abortado}")
+                self.pendentes.append((linha, futuro, len(dados)))
+                self.bytes_no_buffer += len(dados)
+                self.pico_buffer = max(self.pico_buffer, self.bytes_no_buffer)
+                self.linhas_enviadas += 1
+            escrita = self._escrever(dados)
+        if escrita is not None:
+            escrita.add_done_callback(lambda e: self._escrita_concluida(e, futuro))
+        return futuro
+
+    def transmitir(self, linhas: Iterable[str], timeout: float = TIMEOUT_BUFFER) -> List[Future]:
+        """Transmite um programa mantendo o buffer RX cheio; retorna o futuro de cada linha"""
+        futuros = []
+        for linha in linhas:
+            linha = linha.split(";")[0].strip()  # remove comentários
+            if linha:
+                futuros.append(self.enviar_linha(linha, timeout))
+        return futuros
+
+    def sincronizar(self, timeout: float = TIMEOUT_BUFFER) -> Future:
+        """Ponto de sincronização: o futuro só resolve quando tudo que veio antes terminou de mover"""
+        return self.enviar_linha(LINHA_SINCRONIZACAO, timeout)
+
+    def aguardar(self, futuros: List[Future], timeout: float = TIMEOUT_SEGURANCA_MOVIMENTO) -> List[str]:
+        """Espera as confirmações das linhas (propaga o primeiro error/ALARM)"""
+        limite = time.monotonic() + timeout
+        respostas = []
+        for futuro in futuros:
+            try:
+                respostas.append(futuro.result(timeout=max(limite - time.monotonic(), 0.0)))
+            except TimeoutFuturo:
+                raise TimeoutError(f"GRBL não confirmou {len(futuros) - len(respostas)} linha(s) em {timeout:.1f}s")
+        return respostas
+
+    def consultar_status(self, timeout: float = TIMEOUT_STATUS) -> Optional[StatusGRBL]:
+        """Envia '?' (tempo real, sem ok) e espera o próximo relatório de status"""
+        with self.condicao:
+            sequencia = self.sequencia_status
+        self._escrever(b"?", prioridade=True)
+        with self.condicao:
+            self.condicao.wait_for(lambda: self.sequencia_status > sequencia or not self.executando, timeout)
+            return self.status if self.sequencia_status > sequencia else None
+
+    def aguardar_idle(self, timeout: float = TIMEOUT_SEGURANCA_MOVIMENTO) -> StatusGRBL:
+        """Consulta o status até o GRBL voltar a Idle
+
+        Idle só conta depois de ter visto a máquina em movimento ou em duas leituras
+        seguidas (movimento de comprimento zero nunca passa por Run).
+        """
+        limite = time.monotonic() + timeout
+        viu_movimento = False
+        idles_seguidos = 0
+        while True:
+            if self.abortado:
+                raise ErroGRBL(f"Movimento abortado: {self.abortado}")
+            status = self.consultar_status(min(TIMEOUT_STATUS, max(limite - time.monotonic(), 0.01)))
+            if status is not None:
+                if status.estado == "Alarm":
+                    raise ErroGRBL(f"GRBL em alarme: {status.bruto}")
+                if status.estado in ESTADOS_MOVIMENTO:
+                    viu_movimento = True
+                    idles_seguidos = 0
+                elif status.estado == "Idle":
+                    idles_seguidos += 1
+                    if viu_movimento or idles_seguidos >= 2:
+                        return status
+            if time.monotonic() >= limite:
+                raise TimeoutError(f"GRBL não voltou a Idle em {timeout:.1f}s (último status: "
+                                   f"{status.bruto if status else 'sem resposta'})")
+            time.sleep(INTERVALO_STATUS)
+
+    def mover(self, linha: str, timeout: float = TIMEOUT_SEGURANCA_MOVIMENTO,
+              sincronizacao: str = "status") -> Dict[str, Any]:
+        """Envia o movimento e retorna assim que ele terminar
+
+        sincronizacao="status": ok da linha + consulta '?' até Idle
+        sincronizacao="dwell":  ok de um G4 P0 enviado logo atrás (sem polling)
+        """
+        inicio = time.monotonic()
+        futuros = [self.enviar_linha(linha)]
+        if sincronizacao == "dwell":
+            futuros.append(self.sincronizar())
+        try:
+            self.aguardar(futuros, timeout)
+        except TimeoutError:
+            raise TimeoutError(f"GRBL não confirmou '{linha}' em {timeout:.1f}s")
+        tempo_ack = time.monotonic() - inicio
+
+        status = self.aguardar_idle(max(timeout - tempo_ack, 0.1)) if sincronizacao == "status" else self.status
+        return {
+            "linha": linha,
+            "tempo_ack_ms": round(tempo_ack * 1000, 1),
+            "tempo_total_ms": round((time.monotonic() - inicio) * 1000, 1),
+            "status": status.resumo() if status else None,
+        }
+
+    def abortar(self, motivo: str = "parada"):
+        """Feed hold (!) e falha imediata dos movimentos pendentes; quem espera o Idle é liberado"""
+        self._escrever(b"!", prioridade=True, descartar_normais=True)
+        with self.condicao:
+            self.abortado = motivo
+        self._falhar_pendentes(ErroGRBL(f"Movimento abortado: {motivo}"))
+
+    def aguardar_parado(self, timeout: float = 3.0) -> Optional[StatusGRBL]:
+        """Espera a desaceleração do feed hold (Hold:0) ou Idle; None se não parou no tempo"""
+        limite = time.monotonic() + timeout
+        while time.monotonic() < limite:
+            status = self.consultar_status(min(TIMEOUT_STATUS, max(limite - time.monotonic(), 0.01)))
+            if status is not None and (status.estado == "Idle" or status.bruto.startswith("<Hold:0")):
+                return status
+            time.sleep(INTERVALO_STATUS)
+        return None
+
+    def rearmar(self):
+        """Volta a aceitar movimentos (depois do soft reset da parada)"""
+        with self.condicao:
+            self.abortado = None
+
+    def resumo(self) -> Dict[str, Any]:
+        with self.condicao:
+            return {
+                "executando": self.executando,
+                "linhas_pendentes": len(self.pendentes),
+                "bytes_no_buffer": self.bytes_no_buffer,
+                "pico_buffer": self.pico_buffer,
+                "linhas_enviadas": self.linhas_enviadas,
+                "linhas_confirmadas": self.linhas_confirmadas,
+                "alarme": self.alarme,
+                "abortado": self.abortado,
+                "status": self.status.resumo() if self.status else None,
+            }
+
+    def fechar(self):
+        """Para a thread leitora (a porta continua aberta)"""
+        self.executando = False
+        if self.assinatura is not None:
+            self.transporte.cancelar_assinatura(self.assinatura)
+        if self.thread is not None and self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join(timeout=2)
+        self._falhar_pendentes(ErroGRBL("Controlador GRBL fechado"))
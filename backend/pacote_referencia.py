@@ -0,0 +1,264 @@
+"""
+==============================================
+PACOTE DE REFERÊNCIA COMPILADO
+==============================================
+Compila um diretório de referência (ex.: camera_photos_modelo1) em um
+único arquivo versionado com, por (botão, câmera): imagem processada em
+escala de cinza, histograma, dHash, ROI e metadados. O arquivo é aberto
+com np.memmap: recarregar/trocar o conjunto de referência não decodifica
+nenhum JPEG.
+
+Layout do arquivo:
+    MAGICO (8 bytes) | versão (uint32) | tamanho do cabeçalho (uint32)
+    cabeçalho JSON (utf-8) | padding até ALINHAMENTO | blocos de dados
+
+Cada compilação grava um arquivo novo (<dir>.<data_hora>.refpack) e troca
+o ponteiro <dir>.refpack.atual, que só contém o nome do arquivo em uso. O
+pacote aberto via memmap nunca é sobrescrito (no Windows um arquivo
+mapeado não pode ser substituído); versões antigas são removidas quando
+não estão mais abertas. Um <dir>.refpack sem ponteiro (formato antigo)
+continua sendo lido.
+
+O cabeçalho guarda quantas capturas havia no diretório e o mtime da mais
+recente; pacote_desatualizado() compara com o diretório atual.
+"""
+
+from datetime import datetime
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import hashlib
+import json
+import struct
+
+import numpy as np
+
+from validacao_imagens import TAMANHO_PADRAO, calcular_dhash, calcular_histograma, processar_imagem
+from referencia_estatistica import agrupar_capturas_referencia
+
+MAGICO = b"RCTPACK\x00"
+VERSAO_FORMATO = 1
+ALINHAMENTO = 64
+EXTENSAO_PACOTE = ".refpack"
+
+
+@dataclass
+class EntradaReferencia:
+    """Referência pré-processada de um (botão, câmera) - arrays são views do memmap"""
+    chave: str
+    botao_numero: int
+    nome_botao: str
+    camera_id: int
+    gray: np.ndarray
+    hist: np.ndarray
+    dhash: int
+    roi: Tuple[int, int, int, int]
+    metadados: Dict[str, Any]
+
+
+def chave_referencia(botao_numero: int, nome_botao: str, camera_id: int) -> str:
+    nome_botao_clean = nome_botao.replace(' ', '_').replace('-', '_').upper()
+    return f"botao_{botao_numero:03d}_{nome_botao_clean}_camera_{camera_id}"
+
+def _alinhar(tamanho: int) -> int:
+    return (tamanho + ALINHAMENTO - 1) // ALINHAMENTO * ALINHAMENTO
+
+def compilar_pacote(referencia_dir: Path, destino: Optional[Path] = None,
+                    rois: Optional[Dict[int, Tuple[int, int, int, int]]] = None) -> Dict[str, Any]:
+    """Compila o diretório de referência em um único arquivo .refpack"""
+    referencia_dir = Path(referencia_dir)
+    destino = Path(destino) if destino else referencia_dir.with_suffix(EXTENSAO_PACOTE)
+    rois = rois or {}
+    largura, altura = TAMANHO_PADRAO
+
+    entradas: List[Dict[str, Any]] = []
+    blocos: List[bytes] = []
+    offset = 0
+
+    def adicionar_bloco(array: np.ndarray) -> Dict[str, Any]:
+        nonlocal offset
+        dados = np.ascontiguousarray(array).tobytes()
+        descricao = {"offset": offset, "shape": list(array.shape), "dtype": str(array.dtype)}
+        preenchimento = _alinhar(len(dados)) - len(dados)
+        blocos.append(dados + b"\x00" * preenchimento)
+        offset += len(dados) + preenchimento
+        return descricao
+
+    capturas = agrupar_capturas_referencia([referencia_dir])
+    for (numero, nome, camera_id), caminhos in sorted(capturas.items()):
+        # Mesma regra do encontrar_imagem_referencia: a captura mais recente vence
+        origem = max(caminhos, key=lambda p: p.stat().st_mtime)
+        gray = processar_imagem(str(origem))
+        if gray is None:
+            continue
+
+        entradas.append({
+            "chave": chave_referencia(numero, nome, camera_id),
+            "botao_numero": numero,
+            "nome_botao": nome,
+            "camera_id": camera_id,
+            "gray": adicionar_bloco(gray),
+            "hist": adicionar_bloco(calcular_histograma(gray)),
+            "dhash": f"{calcular_dhash(gray):016x}",
+            "roi": list(rois.get(camera_id, (0, 0, largura, altura))),
+            "metadados": {
+                "arquivo_origem": origem.name,
+                "capturas_disponiveis": len(caminhos),
+                "mtime_origem": origem.stat().st_mtime,
+            },
+        })
+
+    conteudo = b"".join(blocos)
+    cabecalho = {
+        "versao_formato": VERSAO_FORMATO,
+        "criado_em": datetime.now().isoformat(),
+        "diretorio_origem": str(referencia_dir),
+        "tamanho_padrao": [largura, altura],
+        "sha256_dados": hashlib.sha256(conteudo).hexdigest(),
+        "origem": _estado_origem(capturas),
+        "entradas": entradas,
+    }
+    cabecalho_bytes = json.dumps(cabecalho, ensure_ascii=False).encode("utf-8")
+    prefixo = MAGICO + struct.pack("<II", VERSAO_FORMATO, len(cabecalho_bytes)) + cabecalho_bytes
+    prefixo += b"\x00" * (_alinhar(len(prefixo)) - len(prefixo))
+
+    # Arquivo novo + troca do ponteiro: o pacote em uso (memmap aberto) continua válido
+    versionado = destino.with_name(f"{destino.stem}.{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}{destino.suffix}")
+    temporario = versionado.with_suffix(versionado.suffix + ".tmp")
+    with open(temporario, "wb") as f:
+        f.write(prefixo)
+        f.write(conteudo)
+    temporario.replace(versionado)
+    ponteiro = _ponteiro(destino)
+    temporario = ponteiro.with_suffix(ponteiro.suffix + ".tmp")
+    temporario.write_text(versionado.name, encoding="utf-8")
+    temporario.replace(ponteiro)
+    _remover_versoes_antigas(destino, versionado)
+
+    print(f"📦 Pacote de referência compilado: {versionado} ({len(entradas)} entradas, "
+          f"{(len(prefixo) + len(conteudo)) / 1024 / 1024:.1f} MB)")
+    return {"arquivo": str(versionado), "entradas": len(entradas), "sha256_dados": cabecalho["sha256_dados"]}
+
+def _ponteiro(destino: Path) -> Path:
+    return destino.with_name(destino.name + ".atual")
+
+def _remover_versoes_antigas(destino: Path, atual: Path):
+    """Remove as versões anteriores (e o arquivo sem versão); as ainda mapeadas ficam para a próxima"""
+    antigas = list(destino.parent.glob(f"{destino.stem}.*{destino.suffix}")) + [destino]
+    for caminho in antigas:
+        if caminho == atual or not caminho.is_file():
+            continue
+        try:
+            caminho.unlink()
+        except OSError:
+            pass  # aberta via memmap (Windows)
+
+def resolver_pacote(destino: Path) -> Optional[Path]:
+    """Arquivo do pacote em uso: o apontado por <destino>.atual ou, sem ponteiro, o próprio destino"""
+    destino = Path(destino)
+    ponteiro = _ponteiro(destino)
+    if ponteiro.exists():
+        caminho = destino.with_name(ponteiro.read_text(encoding="utf-8").strip())
+        if caminho.is_file():
+            return caminho
+    return destino if destino.is_file() else None
+
+def _estado_origem(capturas: Dict[Tuple[int, str, int], List[Path]]) -> Dict[str, Any]:
+    caminhos = [c for lista in capturas.values() for c in lista]
+    return {
+        "capturas": len(caminhos),
+        "mtime_mais_recente": max((c.stat().st_mtime for c in caminhos), default=0.0),
+    }
+
+def pacote_desatualizado(pacote: "PacoteReferencia", referencia_dir: Path) -> Optional[str]:
+    """Motivo de o pacote não refletir mais o diretório de referência (None se está em dia)"""
+    origem = pacote.cabecalho.get("origem")
+    if origem is None:
+        # Pacote anterior ao campo "origem": estimado pelas entradas
+        metadados = [e.metadados for e in pacote.entradas.values()]
+        origem = {
+            "capturas": sum(m.get("capturas_disponiveis", 0) for m in metadados),
+            "mtime_mais_recente": max((m.get("mtime_origem", 0.0) for m in metadados), default=0.0),
+        }
+    atual = _estado_origem(agrupar_capturas_referencia([referencia_dir]))
+    if atual["mtime_mais_recente"] > origem["mtime_mais_recente"]:
+        return "há capturas mais novas que o pacote"
+    if atual["capturas"] != origem["capturas"]:
+        return f"{atual['capturas']} capturas no diretório, {origem['capturas']} no pacote"
+    return None
+
+
+class PacoteReferencia:
+    """Pacote de referência aberto via memmap (somente leitura)"""
+
+    def __init__(self, caminho: Path):
+        self.caminho = Path(caminho)
+        self._mm = np.memmap(self.caminho, dtype=np.uint8, mode="r")
+
+        if bytes(self._mm[:8]) != MAGICO:
+            raise ValueError(f"{self.caminho} não é um pacote de referência")
+        versao, tamanho_cabecalho = struct.unpack("<II", bytes(self._mm[8:16]))
+        if versao != VERSAO_FORMATO:
+            raise ValueError(f"Versão de pacote não suportada: {versao} (esperado {VERSAO_FORMATO})")
+
+        self.cabecalho: Dict[str, Any] = json.loads(bytes(self._mm[16:16 + tamanho_cabecalho]).decode("utf-8"))
+        self._inicio_dados = _alinhar(16 + tamanho_cabecalho)
+
+        self.entradas: Dict[str, EntradaReferencia] = {}
+        self._por_numero: Dict[Tuple[int, int], EntradaReferencia] = {}
+        for e in self.cabecalho["entradas"]:
+            entrada = EntradaReferencia(
+                chave=e["chave"],
+                botao_numero=e["botao_numero"],
+                nome_botao=e["nome_botao"],
+                camera_id=e["camera_id"],
+                gray=self._view(e["gray"]),
+                hist=self._view(e["hist"]),
+                dhash=int(e["dhash"], 16),
+                roi=tuple(e["roi"]),
+                metadados=e["metadados"],
+            )
+            self.entradas[entrada.chave] = entrada
+            self._por_numero.setdefault((entrada.botao_numero, entrada.camera_id), entrada)
+
+    def _view(self, descricao: Dict[str, Any]) -> np.ndarray:
+        return np.ndarray(
+            shape=tuple(descricao["shape"]),
+            dtype=np.dtype(descricao["dtype"]),
+            buffer=self._mm,
+            offset=self._inicio_dados + descricao["offset"],
+        )
+
+    @property
+    def versao(self) -> Dict[str, Any]:
+        """Identificação do estado exato da referência (gravada no JSON do ciclo)"""
+        return {
+            "arquivo": str(self.caminho),
+            "versao_formato": self.cabecalho["versao_formato"],
+            "criado_em": self.cabecalho["criado_em"],
+            "sha256_dados": self.cabecalho["sha256_dados"],
+            "entradas": len(self.entradas),
+        }
+
+    def obter(self, botao_numero: int, nome_botao: str, camera_id: int) -> Optional[EntradaReferencia]:
+        """Busca por chave exata; na falta dela, pelo número do botão e câmera"""
+        entrada = self.entradas.get(chave_referencia(botao_numero, nome_botao, camera_id))
+        if entrada is None:
+            entrada = self._por_numero.get((botao_numero, camera_id))
+        return entrada
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compila um diretório de referência em um pacote .refpack")
+    parser.add_argument("referencia", nargs="?", default="camera_photos_modelo1")
+    parser.add_argument("--saida", default=None)
+    parser.add_argument("--rois", default=None, help='JSON {"camera_id": [x, y, largura, altura]}')
+    args = parser.parse_args()
+
+    rois = None
+    if args.rois:
+        with open(args.rois, 'r', encoding='utf-8') as f:
+            rois = {int(k): tuple(v) for k, v in json.load(f).items()}
+
+    compilar_pacote(Path(args.referencia), Path(args.saida) if args.saida else None, rois)
@@ -0,0 +1,83 @@
+"""
+==============================================
+PIPELINE DO CICLO DE BOTÕES
+==============================================
+Etapas do botão i que não usam o hardware de movimento (captura IR do
+Nano, gravação das fotos e validação das imagens) rodam em segundo plano
+enquanto o pórtico já se move para o botão i+1. Os conflitos entre etapas
+são declarados em HAZARDS e aguardados explicitamente:
+
+    pressionar  - pressionar o próximo botão gera um novo código IR, que
+                  sobrescreveria a captura do botão anterior no Nano
+    validacao   - a validação usa o RegistroCiclo, estimado no primeiro
+                  botão; as validações rodam em ordem, uma de cada vez
+
+Os resultados de cada botão são reunidos pelo número do botão.
+"""
+
+from typing import Any, Awaitable, Dict, List, Optional
+import asyncio
+import time
+
+# hazard -> etapa do botão anterior que precisa terminar antes
+HAZARDS = {
+    "pressionar": "ir",
+    "validacao": "validacao",
+}
+
+
+class PipelineCiclo:
+    """Tarefas em segundo plano do ciclo, indexadas por número do botão e etapa"""
+
+    def __init__(self):
+        self.tarefas: Dict[int, Dict[str, asyncio.Task]] = {}
+        self.ultimo_botao: Optional[int] = None
+        self.esperas_ms: Dict[str, float] = {nome: 0.0 for nome in HAZARDS}
+        self.inicio = time.perf_counter()
+
+    def iniciar(self, botao: int, etapa: str, coro: Awaitable[Any]) -> asyncio.Task:
+        """Agenda uma etapa do botão em segundo plano"""
+        tarefa = asyncio.create_task(coro)
+        self.tarefas.setdefault(botao, {})[etapa] = tarefa
+        return tarefa
+
+    def avancar(self, botao: int):
+        """Marca o botão como o último pressionado (referência dos hazards do próximo)"""
+        self.ultimo_botao = botao
+
+    async def aguardar(self, hazard: str, anterior: Optional[int]) -> Any:
+        """Espera a etapa conflitante do botão anterior terminar (sem erro se ela falhou)"""
+        tarefa = self.tarefas.get(anterior, {}).get(HAZARDS[hazard])
+        if tarefa is None:
+            return None
+        inicio = time.perf_counter()
+        try:
+            return await asyncio.shield(tarefa)
+        except Exception:
+            return None
+        finally:
+            self.esperas_ms[hazard] += (time.perf_counter() - inicio) * 1000
+
+    async def concluir(self) -> Dict[int, Dict[str, Any]]:
+        """Espera todas as etapas e devolve {botão: {etapa: resultado}} (exceção vira o próprio resultado)"""
+        resultados: Dict[int, Dict[str, Any]] = {}
+        for botao, etapas in self.tarefas.items():
+            valores = await asyncio.gather(*etapas.values(), return_exceptions=True)
+            resultados[botao] = dict(zip(etapas.keys(), valores))
+        return resultados
+
+    def cancelar(self):
+        for etapas in self.tarefas.values():
+            for tarefa in etapas.values():
+                tarefa.cancel()
+
+    def pendentes(self) -> List[str]:
+        return [f"{botao}:{etapa}" for botao, etapas in self.tarefas.items()
+                for etapa, tarefa in etapas.items() if not tarefa.done()]
+
+    def resumo(self) -> Dict[str, Any]:
+        return {
+            "duracao_s": round(time.perf_counter() - self.inicio, 3),
+            "botoes": len(self.tarefas),
+            "espera_hazards_ms": {nome: round(ms, 1) for nome, ms in self.esperas_ms.items()},
+        }
@@ -0,0 +1,164 @@
+"""
+==============================================
+PLANEJADOR DE ROTA DOS BOTÕES
+==============================================
+Calcula a ordem de visita de test_coordinates com o menor deslocamento
+do pórtico: vizinho mais próximo seguido de 2-opt, respeitando as
+restrições funcionais (POWER primeiro, POWER_FINAL por último,
+TEMPORIZADOR antes de TEMPORIZADOR_2). Botões com a mesma coordenada
+viram pressionamentos consecutivos sem novo movimento.
+
+A ordem retornada é de índices em test_coordinates: o número do botão
+(botao_numero = índice + 1) não muda, então referências e relatórios
+continuam casando pelo número original.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import threading
+
+RESTRICOES_PADRAO = {
+    "primeiro": ["POWER"],
+    "ultimo": ["POWER_FINAL"],
+    "precedencias": [["TEMPORIZADOR", "TEMPORIZADOR_2"]],
+}
+
+# Iterações máximas do 2-opt (a rota tem poucas dezenas de pontos)
+MAX_ITERACOES_2OPT = 200
+
+
+@dataclass
+class PlanoRota:
+    """Ordem de visita e deslocamento total antes/depois"""
+    ordem: List[int]
+    grupos: List[List[int]]
+    deslocamento: float
+    deslocamento_original: float
+    restricoes: Dict[str, Any] = field(default_factory=dict)
+
+    def resumo(self) -> Dict[str, Any]:
+        reducao = 1.0 - self.deslocamento / self.deslocamento_original if self.deslocamento_original else 0.0
+        return {
+            "ordem": [i + 1 for i in self.ordem],
+            "movimentos": len(self.grupos),
+            "deslocamento_mm": round(self.deslocamento, 1),
+            "deslocamento_original_mm": round(self.deslocamento_original, 1),
+            "reducao": round(reducao, 4),
+        }
+
+
+def distancia(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    """Chebyshev: em G0 cada eixo anda em paralelo, o tempo segue o eixo com maior curso"""
+    return max(abs(a[0] - b[0]), abs(a[1] - b[1]))
+
+def _posicao(coord: Dict[str, Any]) -> Tuple[float, float]:
+    return (float(coord['x']), float(coord['y']))
+
+def deslocamento_total(coordenadas: Sequence[Dict[str, Any]], ordem: Sequence[int]) -> float:
+    return sum(distancia(_posicao(coordenadas[a]), _posicao(coordenadas[b])) for a, b in zip(ordem, ordem[1:]))
+
+def _agrupar(coordenadas: Sequence[Dict[str, Any]], fixos: set) -> List[List[int]]:
+    """Junta botões com a mesma posição em um grupo (ordem interna = ordem de autoria)"""
+    grupos: Dict[Tuple[float, float], List[int]] = {}
+    resultado: List[List[int]] = []
+    for i, coord in enumerate(coordenadas):
+        if i in fixos:
+            resultado.append([i])
+            continue
+        posicao = _posicao(coord)
+        if posicao not in grupos:
+            grupos[posicao] = []
+            resultado.append(grupos[posicao])
+        grupos[posicao].append(i)
+    return resultado
+
+def _rota_valida(rota: Sequence[int], antecessores: Dict[int, set]) -> bool:
+    vistos = set()
+    for g in rota:
+        if not antecessores.get(g, set()) <= vistos:
+            return False
+        vistos.add(g)
+    return True
+
+def planejar_rota(coordenadas: Sequence[Dict[str, Any]], restricoes: Optional[Dict[str, Any]] = None) -> PlanoRota:
+    """Vizinho mais próximo + 2-opt sobre os grupos de posição, com início/fim fixos e precedências"""
+    restricoes = {**RESTRICOES_PADRAO, **(restricoes or {})}
+    indice_por_nome = {c.get('nome'): i for i, c in enumerate(coordenadas)}
+    primeiros = [indice_por_nome[n] for n in restricoes["primeiro"] if n in indice_por_nome]
+    ultimos = [indice_por_nome[n] for n in restricoes["ultimo"] if n in indice_por_nome]
+
+    grupos = _agrupar(coordenadas, set(primeiros) | set(ultimos))
+    grupo_de = {i: g for g, membros in enumerate(grupos) for i in membros}
+    posicoes = [_posicao(coordenadas[membros[0]]) for membros in grupos]
+
+    # Precedência entre grupos (dentro do mesmo grupo a ordem de autoria já resolve)
+    antecessores: Dict[int, set] = {}
+    for antes, depois in restricoes["precedencias"]:
+        if antes in indice_por_nome and depois in indice_por_nome:
+            ga, gd = grupo_de[indice_por_nome[antes]], grupo_de[indice_por_nome[depois]]
+            if ga != gd:
+                antecessores.setdefault(gd, set()).add(ga)
+
+    inicio = [grupo_de[i] for i in primeiros]
+    fim = [grupo_de[i] for i in ultimos]
+    livres = [g for g in range(len(grupos)) if g not in inicio and g not in fim]
+
+    # Vizinho mais próximo entre os grupos cujos antecessores já foram visitados
+    rota = list(inicio)
+    visitados = set(rota)
+    while len(visitados) < len(inicio) + len(livres):
+        atual = posicoes[rota[-1]] if rota else (0.0, 0.0)
+        candidatos = [g for g in livres if g not in visitados and antecessores.get(g, set()) <= visitados]
+        if not candidatos:
+            # Precedência impossível de satisfazer: segue a ordem de autoria
+            candidatos = [g for g in livres if g not in visitados]
+        proximo = min(candidatos, key=lambda g: (distancia(atual, posicoes[g]), g))
+        rota.append(proximo)
+        visitados.add(proximo)
+    rota += fim
+
+    # 2-opt só no trecho livre (início e fim fixos)
+    a, b = len(inicio), len(rota) - len(fim)
+    custo = lambda r: sum(distancia(posicoes[x], posicoes[y]) for x, y in zip(r, r[1:]))
+    melhor_custo = custo(rota)
+    for _ in range(MAX_ITERACOES_2OPT):
+        melhorou = False
+        for i in range(a, b - 1):
+            for j in range(i + 1, b):
+                candidata = rota[:i] + rota[i:j + 1][::-1] + rota[j + 1:]
+                custo_candidata = custo(candidata)
+                if custo_candidata < melhor_custo - 1e-9 and _rota_valida(candidata, antecessores):
+                    rota, melhor_custo, melhorou = candidata, custo_candidata, True
+        if not melhorou:
+            break
+
+    grupos_ordenados = [grupos[g] for g in rota]
+    ordem = [i for membros in grupos_ordenados for i in membros]
+    return PlanoRota(
+        ordem=ordem,
+        grupos=grupos_ordenados,
+        deslocamento=deslocamento_total(coordenadas, ordem),
+        deslocamento_original=deslocamento_total(coordenadas, list(range(len(coordenadas)))),
+        restricoes=restricoes,
+    )
+
+
+_cache_planos: Dict[Tuple, PlanoRota] = {}
+_cache_lock = threading.Lock()
+
+def obter_plano(nome_modelo: str, coordenadas: Sequence[Dict[str, Any]],
+                restricoes: Optional[Dict[str, Any]] = None) -> PlanoRota:
+    """Plano em cache por modelo (recalculado se as coordenadas ou restrições mudarem)"""
+    chave = (
+        nome_modelo,
+        tuple((c.get('nome'), float(c['x']), float(c['y'])) for c in coordenadas),
+        repr(sorted((restricoes or {}).items())),
+    )
+    with _cache_lock:
+        plano = _cache_planos.get(chave)
+    if plano is None:
+        plano = planejar_rota(coordenadas, restricoes)
+        with _cache_lock:
+            _cache_planos[chave] = plano
+        print(f"🗺️ Rota do {nome_modelo}: {plano.resumo()}")
+    return plano
@@ -0,0 +1,294 @@
+"""
+==============================================
+REGISTRO DE PORTAS SERIAIS POR PAPEL
+==============================================
+Cada porta é registrada pelo papel que cumpre na bancada (os mesmos
+nomes das "portas" da receita) e por uma instância, então o mesmo papel
+pode existir várias vezes (ex.: um Nano de IR por berço):
+
+    pneumatica  - Arduino dos relés/pneumática (P_1, K2_1, B1_1, START)
+    grbl        - GRBL do pórtico XY
+    ir          - Nano de IR
+    auxiliar    - porta adicional
+
+O id da porta é o papel para a instância principal e "papel:instancia"
+para as outras ("ir:berco2"). Os números antigos 1..4 continuam valendo
+como apelidos das instâncias principais (1 = pneumatica, 2 = grbl,
+3 = ir, 4 = auxiliar), então receitas e endpoints que usam o número
+não mudam.
+
+Cada porta guarda a configuração (dispositivo, baud, timeout) - o baud
+padrão vem do papel, não mais do número -, o lock de escrita, o
+TransporteSerial enquanto está aberta e a saúde: estado
+(desconectada/conectada/erro), último erro, conexões e falhas.
+
+Configuração em portas_seriais.json (chaves sobrescrevem o padrão):
+    {
+        "ir:berco2": {"papel": "ir", "instancia": "berco2", "dispositivo": "COM7"},
+        "grbl": {"dispositivo": "/dev/ttyUSB0", "baud_rate": 250000}
+    }
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Union
+import asyncio
+import json
+import threading
+import time
+
+import serial
+
+from transporte_serial import TransporteSerial
+
+PORTAS_CONFIG_PATH = Path("portas_seriais.json")
+
+# Papel -> descrição e baud padrão
+PAPEIS = {
+    "pneumatica": {"descricao": "Relés/pneumática (Arduino)", "baud_rate": 115200},
+    "grbl": {"descricao": "Pórtico XY (GRBL)", "baud_rate": 115200},
+    "ir": {"descricao": "Dados IR (Nano)", "baud_rate": 9600},
+    "auxiliar": {"descricao": "Porta adicional", "baud_rate": 115200},
+}
+
+# Números antigos (serial_port1..4) -> id da porta
+APELIDOS_NUMERO = {1: "pneumatica", 2: "grbl", 3: "ir", 4: "auxiliar"}
+
+TIMEOUT_LEITURA_PADRAO = 1.0
+
+ChavePorta = Union[int, str]
+
+
+class ErroPorta(Exception):
+    pass
+
+
+def id_porta(papel: str, instancia: Optional[str] = None) -> str:
+    return f"{papel}:{instancia}" if instancia else papel
+
+
+@dataclass
+class ConfiguracaoPorta:
+    """Papel, instância e parâmetros de abertura de uma porta"""
+    papel: str
+    instancia: Optional[str] = None
+    dispositivo: Optional[str] = None
+    baud_rate: Optional[int] = None
+    timeout: float = TIMEOUT_LEITURA_PADRAO
+    descricao: Optional[str] = None
+
+    def __post_init__(self):
+        if self.papel not in PAPEIS:
+            raise ErroPorta(f"Papel desconhecido: {self.papel} (use {', '.join(PAPEIS)})")
+        if self.baud_rate is None:
+            self.baud_rate = PAPEIS[self.papel]["baud_rate"]
+        if self.descricao is None:
+            self.descricao = PAPEIS[self.papel]["descricao"]
+
+    @property
+    def id(self) -> str:
+        return id_porta(self.papel, self.instancia)
+
+    @classmethod
+    def de_config(cls, id_: str, dados: Dict[str, Any]) -> "ConfiguracaoPorta":
+        papel, _, instancia = id_.partition(":")
+        return cls(
+            papel=dados.get("papel", papel),
+            instancia=dados.get("instancia", instancia or None),
+            dispositivo=dados.get("dispositivo"),
+            baud_rate=dados.get("baud_rate"),
+            timeout=float(dados.get("timeout", TIMEOUT_LEITURA_PADRAO)),
+            descricao=dados.get("descricao"),
+        )
+
+
+class PortaSerial:
+    """Porta registrada: configuração, porta pyserial aberta, transporte e saúde"""
+
+    def __init__(self, config: ConfiguracaoPorta, numero: Optional[int] = None):
+        self.config = config
+        self.numero = numero
+        self.serial = None
+        self.lock = threading.Lock()
+        self.transporte: Optional[TransporteSerial] = None
+        self.ultimo_erro: Optional[str] = None
+        self.erro_em: Optional[str] = None
+        self.conectada_em: Optional[str] = None
+        self._conectada_desde: Optional[float] = None
+        self.conexoes = 0
+        self.falhas = 0
+
+    @property
+    def id(self) -> str:
+        return self.config.id
+
+    @property
+    def papel(self) -> str:
+        return self.config.papel
+
+    @property
+    def rotulo(self) -> str:
+        return f"Porta {self.numero}" if self.numero is not None else f"Porta {self.id}"
+
+    @property
+    def conectada(self) -> bool:
+        return self.serial is not None and self.serial.is_open
+
+    @property
+    def estado(self) -> str:
+        if self.conectada:
+            return "conectada"
+        return "erro" if self.ultimo_erro else "desconectada"
+
+    def abrir(self, dispositivo: Optional[str] = None, baud_rate: Optional[int] = None,
+              abrir_serial: Optional[Callable[..., Any]] = None):
+        """Fecha a porta atual (se houver) e abre o dispositivo; a configuração guarda o último usado"""
+        dispositivo = dispositivo or self.config.dispositivo
+        if not dispositivo:
+            raise ErroPorta(f"{self.rotulo}: dispositivo não configurado")
+        self.fechar()
+        if baud_rate is not None:
+            self.config.baud_rate = baud_rate
+        self.config.dispositivo = dispositivo
+        try:
+            abrir_serial = abrir_serial or serial.Serial
+            self.serial = abrir_serial(dispositivo, self.config.baud_rate, timeout=self.config.timeout)
+        except Exception as e:
+            self.registrar_falha(e)
+            raise
+        self.ultimo_erro = None
+        self.conexoes += 1
+        self.conectada_em = datetime.now().isoformat()
+        self._conectada_desde = time.monotonic()
+
+    def registrar_falha(self, erro: Exception):
+        self.falhas += 1
+        self.ultimo_erro = str(erro)
+        self.erro_em = datetime.now().isoformat()
+
+    def obter_transporte(self) -> Optional[TransporteSerial]:
+        """Transporte ligado à porta aberta (recriado se a porta mudou ou a leitura caiu)"""
+        if not self.conectada:
+            return None
+        transporte = self.transporte
+        if transporte is None or transporte.port is not self.serial or not transporte.executando:
+            if transporte is not None:
+                transporte.fechar()
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None  # criado fora do event loop: só escrita e assinaturas com callback
+            transporte = self.transporte = TransporteSerial(self.serial, self.lock, self.rotulo.lower(), loop)
+        return transporte
+
+    def fechar_transporte(self):
+        """Para as threads leitora e escritora antes de fechar/trocar a porta"""
+        transporte, self.transporte = self.transporte, None
+        if transporte is not None:
+            transporte.fechar()
+
+    def fechar(self):
+        self.fechar_transporte()
+        if self.serial is not None:
+            try:
+                if self.serial.is_open:
+                    self.serial.close()
+            except Exception as e:
+                self.registrar_falha(e)
+            self.serial = None
+        self.conectada_em = None
+        self._conectada_desde = None
+
+    def resumo(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "papel": self.papel,
+            "instancia": self.config.instancia,
+            "numero": self.numero,
+            "descricao": self.config.descricao,
+            "dispositivo": self.config.dispositivo,
+            "baud_rate": self.config.baud_rate,
+            "estado": self.estado,
+            "conectada_em": self.conectada_em,
+            "conectada_ha_s": round(time.monotonic() - self._conectada_desde, 1) if self._conectada_desde else None,
+            "conexoes": self.conexoes,
+            "falhas": self.falhas,
+            "ultimo_erro": self.ultimo_erro,
+            "erro_em": self.erro_em,
+            "transporte": self.transporte.resumo() if self.transporte is not None else None,
+        }
+
+
+class RegistroPortas:
+    """Portas seriais por id ("grbl", "ir:berco2"), com os números 1..4 como apelidos"""
+
+    def __init__(self, configs: Optional[List[ConfiguracaoPorta]] = None):
+        self.portas: Dict[str, PortaSerial] = {}
+        numeros = {id_: numero for numero, id_ in APELIDOS_NUMERO.items()}
+        for config in configs or []:
+            self.portas[config.id] = PortaSerial(config, numeros.get(config.id))
+
+    def resolver(self, chave: ChavePorta) -> str:
+        """Id da porta a partir do id, do número antigo (1..4) ou do número em texto ("2")"""
+        if isinstance(chave, str) and chave.isdigit():
+            chave = int(chave)
+        id_ = APELIDOS_NUMERO.get(chave) if isinstance(chave, int) else chave
+        if id_ is None or id_ not in self.portas:
+            raise ErroPorta(f"Porta {chave} inválida")
+        return id_
+
+    def obter(self, chave: ChavePorta) -> PortaSerial:
+        return self.portas[self.resolver(chave)]
+
+    def porta(self, chave: ChavePorta) -> Optional[PortaSerial]:
+        """Como obter(), mas None para porta desconhecida"""
+        try:
+            return self.obter(chave)
+        except ErroPorta:
+            return None
+
+    def conectada(self, chave: ChavePorta) -> bool:
+        porta = self.porta(chave)
+        return porta is not None and porta.conectada
+
+    def registrar(self, config: ConfiguracaoPorta) -> PortaSerial:
+        if config.id in self.portas:
+            raise ErroPorta(f"Porta {config.id} já registrada")
+        porta = self.portas[config.id] = PortaSerial(config)
+        return porta
+
+    def remover(self, chave: ChavePorta):
+        id_ = self.resolver(chave)
+        if id_ in APELIDOS_NUMERO.values():
+            raise ErroPorta(f"Porta {id_} é uma das portas principais e não pode ser removida")
+        self.portas.pop(id_).fechar()
+
+    def por_papel(self, papel: str) -> List[PortaSerial]:
+        return [p for p in self.portas.values() if p.papel == papel]
+
+    def fechar(self):
+        for porta in self.portas.values():
+            porta.fechar()
+
+    def resumo(self) -> Dict[str, Any]:
+        return {id_: porta.resumo() for id_, porta in self.portas.items()}
+
+
+def carregar_portas(arquivo: Path = PORTAS_CONFIG_PATH) -> RegistroPortas:
+    """Portas principais (1..4) com as chaves de portas_seriais.json por cima (se o arquivo existir)"""
+    config: Dict[str, Dict[str, Any]] = {id_: {} for id_ in APELIDOS_NUMERO.values()}
+    if arquivo.exists():
+        try:
+            with open(arquivo, "r", encoding="utf-8") as f:
+                for id_, dados in json.load(f).items():
+                    config.setdefault(id_, {}).update(dados)
+        except Exception as e:
+            print(f"⚠️ Erro ao ler {arquivo}: {e} - usando portas padrão")
+    configs = []
+    for id_, dados in config.items():
+        try:
+            configs.append(ConfiguracaoPorta.de_config(id_, dados))
+        except ErroPorta as e:
+            print(f"⚠️ {arquivo}: porta {id_} ignorada: {e}")
+    return RegistroPortas(configs)
@@ -0,0 +1,102 @@
+"""
+==============================================
+CONTROLE DE QUALIDADE DO FRAME
+==============================================
+Checagem barata (frame reduzido para 160x120) antes da validação:
+nitidez (variância do Laplaciano), proporção de pixels saturados,
+proporção de pixels escuros (dedo/atuador na frente da câmera) e brilho
+médio. Um frame reprovado é descartado e o próximo frame do stream da
+câmera é usado, até um limite de recapturas.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+TAMANHO_AVALIACAO = (160, 120)
+
+# Limiares calibrados nas capturas de camera_photos_modelo1 e test_results
+# (frames reais: nitidez >= 368, saturação <= 0.2%, escuros <= 12%, brilho 92-116)
+NITIDEZ_MINIMA = 250.0
+PROPORCAO_SATURADA_MAXIMA = 0.05
+PROPORCAO_ESCURA_MAXIMA = 0.35
+BRILHO_MINIMO = 40.0
+BRILHO_MAXIMO = 200.0
+
+# Recapturas: quantos frames novos esperar e quanto esperar por cada um (~30 fps)
+MAX_RECAPTURAS = 3
+TIMEOUT_FRAME = 0.2
+
+
+@dataclass
+class QualidadeFrame:
+    """Métricas de qualidade de um frame"""
+    nitidez: float
+    proporcao_saturada: float
+    proporcao_escura: float
+    brilho: float
+    motivos: List[str] = field(default_factory=list)
+
+    @property
+    def aprovado(self) -> bool:
+        return not self.motivos
+
+    def resumo(self) -> Dict[str, Any]:
+        return {
+            "aprovado": self.aprovado,
+            "nitidez": round(self.nitidez, 1),
+            "proporcao_saturada": round(self.proporcao_saturada, 4),
+            "proporcao_escura": round(self.proporcao_escura, 4),
+            "brilho": round(self.brilho, 1),
+            "motivos": self.motivos,
+        }
+
+
+def avaliar_qualidade(frame: np.ndarray) -> QualidadeFrame:
+    """Avalia nitidez, saturação, oclusão e brilho de um frame BGR"""
+    pequeno = cv2.resize(frame, TAMANHO_AVALIACAO, interpolation=cv2.INTER_AREA)
+    if pequeno.ndim == 3:
+        pequeno = cv2.cvtColor(pequeno, cv2.COLOR_BGR2GRAY)
+
+    _, desvio = cv2.meanStdDev(cv2.Laplacian(pequeno, cv2.CV_16S))
+    total = pequeno.size
+    qualidade = QualidadeFrame(
+        nitidez=float(desvio[0, 0]) ** 2,
+        proporcao_saturada=float(np.count_nonzero(pequeno >= 250)) / total,
+        proporcao_escura=float(np.count_nonzero(pequeno <= 5)) / total,
+        brilho=float(pequeno.mean()),
+    )
+
+    if qualidade.nitidez < NITIDEZ_MINIMA:
+        qualidade.motivos.append("desfocado")
+    if qualidade.proporcao_saturada > PROPORCAO_SATURADA_MAXIMA:
+        qualidade.motivos.append("saturado")
+    if qualidade.proporcao_escura > PROPORCAO_ESCURA_MAXIMA:
+        qualidade.motivos.append("obstruido")
+    if not BRILHO_MINIMO <= qualidade.brilho <= BRILHO_MAXIMO:
+        qualidade.motivos.append("brilho")
+    return qualidade
+
+def capturar_frame_com_qualidade(manager, max_recapturas: int = MAX_RECAPTURAS,
+                                 timeout_frame: float = TIMEOUT_FRAME) -> Tuple[Optional[np.ndarray], Optional[QualidadeFrame], int]:
+    """Retorna (frame, qualidade, recapturas): o primeiro frame aprovado ou o último recebido
+
+    Bloqueia até o próximo frame do stream a cada recaptura - chamar fora do event loop.
+    """
+    contador, frame = manager.get_frame_with_count()
+    if frame is None:
+        return None, None, 0
+
+    qualidade = avaliar_qualidade(frame)
+    recapturas = 0
+    while not qualidade.aprovado and recapturas < max_recapturas:
+        novo_contador, novo_frame = manager.wait_next_frame(contador, timeout_frame)
+        if novo_frame is None or novo_contador == contador:
+            break
+        recapturas += 1
+        contador, frame = novo_contador, novo_frame
+        qualidade = avaliar_qualidade(frame)
+
+    return frame, qualidade, recapturas
@@ -0,0 +1,268 @@
+"""
+==============================================
+RECEITA DECLARATIVA DO CICLO DE TESTE
+==============================================
+A receita (JSON) descreve as portas por papel, a preparação (FingerDown),
+o início (liga o IR) e o modelo de passos de cada botão, com as esperas e
+timeouts de cada passo. O compilador valida a receita e gera um plano de
+passos já expandido para a ordem de visita do modelo, que é executado por
+um único motor em main.py.
+
+Otimizações do compilador:
+    - pausas ("aguardar") consecutivas são somadas e absorvidas pela
+      espera do comando anterior
+    - movimento para a mesma posição do botão anterior é removido
+    - passos de foto saem do plano quando o ciclo é sem fotos
+    - passos "somente_primeiro" só entram no primeiro botão visitado
+
+Receita padrão em receitas/padrao.json; um modelo pode sobrescrever
+chaves de topo com ModeloControle.config["receita"] ou com o arquivo
+modelos/<nome>_receita.json.
+"""
+
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+import argparse
+import json
+
+RECEITA_PADRAO_PATH = Path(__file__).parent / "receitas" / "padrao.json"
+
+SECOES = ("portas", "preparacao", "inicio", "botao")
+
+# Ações -> (campos obrigatórios, permitida fora do modelo de botão)
+ACOES = {
+    "comando": (("porta", "comando"), True),
+    "mover": ((), True),
+    "aguardar": (("segundos",), True),
+    "pressionar": ((), False),
+    "liberar": ((), False),
+    "identificar_modelo": ((), False),
+    "capturar_fotos": ((), False),
+    "validar_fotos": ((), False),
+    "capturar_ir": ((), False),
+}
+
+ACOES_FOTOS = ("identificar_modelo", "capturar_fotos", "validar_fotos")
+
+# Ações que escrevem na porta e esperam "tempo" depois (absorvem a pausa seguinte)
+ACOES_COM_ESPERA = ("comando", "pressionar", "liberar")
+
+
+class ErroReceita(ValueError):
+    """Receita inválida (a mensagem lista todos os problemas encontrados)"""
+
+
+@dataclass
+class Passo:
+    """Passo do plano compilado"""
+    acao: str
+    porta: Optional[int] = None
+    comando: Optional[str] = None
+    descricao: str = ""
+    tempo: float = 0.0  # espera após o comando, timeout do movimento ou duração da pausa
+    botao: Optional[int] = None  # índice em test_coordinates
+    nano: str = "nano1"
+    timeout_ms: int = 8000
+
+    def resumo(self) -> Dict[str, Any]:
+        """Só os campos diferentes do padrão"""
+        return {f.name: getattr(self, f.name) for f in fields(self)
+                if f.name == "acao" or getattr(self, f.name) != f.default}
+
+
+@dataclass
+class PlanoExecucao:
+    """Plano compilado: preparação, início e passos dos botões na ordem de visita"""
+    preparacao: List[Passo]
+    inicio: List[Passo]
+    botoes: List[Passo]
+    com_fotos: bool
+    passos_removidos: int = 0
+    portas: Dict[str, int] = field(default_factory=dict)
+
+    def resumo(self) -> Dict[str, Any]:
+        todos = self.preparacao + self.inicio + self.botoes
+        return {
+            "com_fotos": self.com_fotos,
+            "passos": {"preparacao": len(self.preparacao), "inicio": len(self.inicio), "botoes": len(self.botoes)},
+            "movimentos": sum(1 for p in todos if p.acao == "mover"),
+            "esperas_fixas_s": round(sum(p.tempo for p in todos if p.acao in ACOES_COM_ESPERA + ("aguardar",)), 2),
+            "passos_removidos": self.passos_removidos,
+        }
+
+
+def validar_receita(receita: Dict[str, Any]):
+    """Levanta ErroReceita com todos os problemas da receita"""
+    erros = []
+    for chave in receita:
+        if chave not in SECOES:
+            erros.append(f"seção desconhecida: {chave}")
+
+    portas = receita.get("portas", {})
+    for papel, numero in portas.items():
+        if not isinstance(numero, int) or not 1 <= numero <= 4:
+            erros.append(f"porta '{papel}' inválida: {numero}")
+    for papel in ("pneumatica", "grbl"):
+        if papel not in portas:
+            erros.append(f"porta '{papel}' não definida")
+
+    for secao in ("preparacao", "inicio", "botao"):
+        for k, passo in enumerate(receita.get(secao, [])):
+            local = f"{secao}[{k}]"
+            acao = passo.get("acao")
+            if acao not in ACOES:
+                erros.append(f"{local}: ação desconhecida '{acao}'")
+                continue
+            obrigatorios, fora_do_botao = ACOES[acao]
+            if secao != "botao" and not fora_do_botao:
+                erros.append(f"{local}: '{acao}' só pode ser usada no modelo de botão")
+            if acao == "mover" and (secao == "botao") == ("x" in passo or "y" in passo):
+                erros.append(f"{local}: 'mover' usa x/y na preparação e a posição do botão no modelo de botão")
+            for campo in obrigatorios:
+                if campo not in passo:
+                    erros.append(f"{local}: campo '{campo}' obrigatório para '{acao}'")
+            porta = passo.get("porta")
+            if porta is not None and not isinstance(porta, int) and porta not in portas:
+                erros.append(f"{local}: porta '{porta}' não definida em 'portas'")
+            for campo in ("espera", "timeout", "segundos", "timeout_ms"):
+                valor = passo.get(campo)
+                if valor is not None and (not isinstance(valor, (int, float)) or valor < 0):
+                    erros.append(f"{local}: '{campo}' deve ser um número >= 0")
+
+    # Ordem dentro do botão: fotos e identificação com o botão pressionado
+    acoes = [p.get("acao") for p in receita.get("botao", [])]
+    for acao in ("pressionar", "liberar"):
+        if acoes.count(acao) != 1:
+            erros.append(f"botao: '{acao}' deve aparecer exatamente uma vez")
+    if not erros:
+        pressionar, liberar = acoes.index("pressionar"), acoes.index("liberar")
+        if pressionar > liberar:
+            erros.append("botao: 'pressionar' deve vir antes de 'liberar'")
+        for acao in ("identificar_modelo", "capturar_fotos"):
+            if acao in acoes and not pressionar < acoes.index(acao) < liberar:
+                erros.append(f"botao: '{acao}' deve ficar entre 'pressionar' e 'liberar'")
+        if "validar_fotos" in acoes and ("capturar_fotos" not in acoes or acoes.index("validar_fotos") < acoes.index("capturar_fotos")):
+            erros.append("botao: 'validar_fotos' precisa vir depois de 'capturar_fotos'")
+        if "capturar_ir" in acoes and acoes.index("capturar_ir") < pressionar:
+            erros.append("botao: 'capturar_ir' deve vir depois de 'pressionar'")
+
+    if erros:
+        raise ErroReceita("; ".join(erros))
+
+def carregar_receita(config: Optional[Dict[str, Any]] = None, arquivo: Optional[Path] = None) -> Dict[str, Any]:
+    """Receita padrão com as seções sobrescritas pelo modelo (config["receita"] ou arquivo), já validada"""
+    with open(RECEITA_PADRAO_PATH, 'r', encoding='utf-8') as f:
+        receita = json.load(f)
+
+    sobrescrita = (config or {}).get("receita")
+    if sobrescrita is None and arquivo is not None and arquivo.exists():
+        with open(arquivo, 'r', encoding='utf-8') as f:
+            sobrescrita = json.load(f)
+    if sobrescrita:
+        portas = {**receita["portas"], **sobrescrita.get("portas", {})}
+        receita = {**receita, **sobrescrita, "portas": portas}
+
+    validar_receita(receita)
+    return receita
+
+
+def _porta(valor: Any, portas: Dict[str, int]) -> int:
+    return valor if isinstance(valor, int) else portas[valor]
+
+def _otimizar(passos: List[Passo]) -> List[Passo]:
+    """Soma pausas consecutivas e as absorve na espera do comando anterior"""
+    resultado: List[Passo] = []
+    for passo in passos:
+        if passo.acao == "aguardar":
+            if passo.tempo <= 0:
+                continue
+            anterior = resultado[-1] if resultado else None
+            if anterior is not None and anterior.acao in ACOES_COM_ESPERA + ("aguardar",):
+                anterior.tempo = round(anterior.tempo + passo.tempo, 6)
+                continue
+        resultado.append(passo)
+    return resultado
+
+def _compilar_secao(passos: Sequence[Dict[str, Any]], portas: Dict[str, int]) -> List[Passo]:
+    compilados = []
+    for passo in passos:
+        acao = passo["acao"]
+        if acao == "comando":
+            compilados.append(Passo(acao, _porta(passo["porta"], portas), passo["comando"],
+                                    passo.get("descricao", passo["comando"]), float(passo.get("espera", 0.0))))
+        elif acao == "mover":
+            compilados.append(Passo(acao, portas["grbl"], f"G90 X{passo['x']} Y{passo['y']}",
+                                    passo.get("descricao", "Movimento"), float(passo.get("timeout", 2.0))))
+        elif acao == "aguardar":
+            compilados.append(Passo(acao, tempo=float(passo["segundos"])))
+    return _otimizar(compilados)
+
+def compilar_receita(receita: Dict[str, Any], coordenadas: Sequence[Dict[str, Any]],
+                     ordem: Optional[Sequence[int]] = None, com_fotos: bool = True) -> PlanoExecucao:
+    """Valida a receita e expande o modelo de botão para cada botão, na ordem de visita"""
+    validar_receita(receita)
+    portas = receita["portas"]
+    ordem = list(range(len(coordenadas))) if ordem is None else list(ordem)
+
+    botoes: List[Passo] = []
+    removidos = 0
+    posicao_anterior = None
+    for k, i in enumerate(ordem):
+        coord = coordenadas[i]
+        nome_botao = coord.get('nome', f'Botão {i+1}')
+        passos = [Passo("iniciar_botao", descricao=nome_botao, botao=i)]
+        for modelo in receita["botao"]:
+            acao = modelo["acao"]
+            if (modelo.get("somente_primeiro") and k > 0) or (acao in ACOES_FOTOS and not com_fotos):
+                removidos += 1
+                continue
+            if acao == "mover":
+                posicao = (coord['x'], coord['y'])
+                if posicao == posicao_anterior:
+                    removidos += 1
+                    continue
+                posicao_anterior = posicao
+                passos.append(Passo(acao, portas["grbl"], f"{coord.get('command', 'G90')} X{coord['x']} Y{coord['y']}",
+                                    f"Movimento {i+1}", float(modelo.get("timeout", 1.5)), botao=i))
+            elif acao == "pressionar":
+                passos.append(Passo(acao, portas["pneumatica"], "P_1", f"Pressionar {nome_botao}",
+                                    float(modelo.get("espera", 0.3)), botao=i))
+            elif acao == "liberar":
+                passos.append(Passo(acao, portas["pneumatica"], "P_0", f"Liberar {nome_botao}",
+                                    float(modelo.get("espera", 0.3)), botao=i))
+            elif acao == "comando":
+                passos.append(Passo(acao, _porta(modelo["porta"], portas), modelo["comando"],
+                                    modelo.get("descricao", modelo["comando"]), float(modelo.get("espera", 0.0)), botao=i))
+            elif acao == "aguardar":
+                passos.append(Passo(acao, tempo=float(modelo["segundos"]), botao=i))
+            elif acao == "capturar_ir":
+                passos.append(Passo(acao, descricao=nome_botao, botao=i, nano=modelo.get("nano", "nano1"),
+                                    timeout_ms=int(modelo.get("timeout_ms", 8000))))
+            else:
+                passos.append(Passo(acao, descricao=nome_botao, botao=i))
+        passos.append(Passo("concluir_botao", descricao=nome_botao, botao=i))
+        otimizados = _otimizar(passos)
+        removidos += len(passos) - len(otimizados)
+        botoes += otimizados
+
+    preparacao = _compilar_secao(receita.get("preparacao", []), portas)
+    inicio = _compilar_secao(receita.get("inicio", []), portas)
+    removidos += len(receita.get("preparacao", [])) - len(preparacao) + len(receita.get("inicio", [])) - len(inicio)
+    return PlanoExecucao(preparacao, inicio, botoes, com_fotos, removidos, dict(portas))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Valida e compila uma receita de teste sobre as coordenadas de um modelo")
+    parser.add_argument("modelo", help="JSON do modelo (modelos/<nome>.json)")
+    parser.add_argument("--receita", help="JSON com seções que sobrescrevem a receita padrão")
+    parser.add_argument("--sem-fotos", action="store_true")
+    args = parser.parse_args()
+
+    with open(args.modelo, 'r', encoding='utf-8') as f:
+        dados_modelo = json.load(f)
+    receita = carregar_receita(dados_modelo.get("config", {}), Path(args.receita) if args.receita else None)
+    plano = compilar_receita(receita, dados_modelo["test_coordinates"], com_fotos=not args.sem_fotos)
+    for passo in plano.preparacao + plano.inicio + plano.botoes:
+        print(f"  {passo.resumo()}")
+    print(f"🧾 {plano.resumo()}")
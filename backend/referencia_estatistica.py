@@ -0,0 +1,210 @@
+"""
+==============================================
+REFERÊNCIA ESTATÍSTICA (GOLDEN REFERENCE)
+==============================================
+Constrói, a partir de todas as capturas de referência de cada
+(botão, câmera), um modelo por pixel de média/desvio salvo em .npz,
+e pontua frames de teste com um mapa de z-score vetorizado
+"""
+
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import argparse
+import re
+import threading
+
+import cv2
+import numpy as np
+
+from validacao_imagens import ContextoValidacao, processar_imagem, registrar_etapa_validacao
+
+# Resolução do modelo (metade da resolução de comparação: mais compacto e menos ruidoso)
+TAMANHO_MODELO = (320, 240)
+
+# Desvio mínimo por pixel (níveis de cinza) - evita variância ~0 com poucas amostras
+DESVIO_MINIMO = 8.0
+
+# Pixel "dentro do modelo" se |z| <= Z_MAXIMO
+Z_MAXIMO = 3.0
+
+# Fração mínima de pixels dentro do modelo para aprovar
+LIMIAR_SIMILARIDADE_ESTATISTICA = 0.93
+
+MODELOS_DIR_PADRAO = Path("modelos_referencia")
+
+PADRAO_ARQUIVO_REFERENCIA = re.compile(
+    r"^botao_(?P<numero>\d{3})_(?P<nome>.+)_camera_(?P<camera>\d+)_\d{8}_\d{6}_\d+\.jpg$"
+)
+
+_cache_modelos: Dict[str, Tuple[float, Optional[Dict[str, np.ndarray]]]] = {}
+_cache_lock = threading.Lock()
+
+
+def nome_arquivo_modelo(botao_numero: int, nome_botao: str, camera_id: int) -> str:
+    """Nome do arquivo .npz do modelo de um (botão, câmera)"""
+    nome_botao_clean = nome_botao.replace(' ', '_').replace('-', '_').upper()
+    return f"botao_{botao_numero:03d}_{nome_botao_clean}_camera_{camera_id}.npz"
+
+def agrupar_capturas_referencia(referencia_dirs: Iterable[Path]) -> Dict[Tuple[int, str, int], List[Path]]:
+    """Agrupa todas as capturas de referência por (número do botão, nome, câmera)"""
+    grupos: Dict[Tuple[int, str, int], List[Path]] = defaultdict(list)
+    for referencia_dir in referencia_dirs:
+        for caminho in sorted(Path(referencia_dir).glob("botao_*_camera_*.jpg")):
+            match = PADRAO_ARQUIVO_REFERENCIA.match(caminho.name)
+            if not match:
+                continue
+            chave = (int(match["numero"]), match["nome"], int(match["camera"]))
+            grupos[chave].append(caminho)
+    return dict(grupos)
+
+def reduzir_para_modelo(gray: np.ndarray) -> np.ndarray:
+    """Converte uma imagem já processada (640x480) para a resolução do modelo em float32"""
+    return cv2.resize(gray, TAMANHO_MODELO, interpolation=cv2.INTER_AREA).astype(np.float32)
+
+def alinhar_translacao(img: np.ndarray, base: np.ndarray) -> np.ndarray:
+    """Alinha img à base por correlação de fase (translação sub-pixel)"""
+    (dx, dy), _ = cv2.phaseCorrelate(base, img)
+    matriz = np.float32([[1, 0, -dx], [0, 1, -dy]])
+    return cv2.warpAffine(img, matriz, (img.shape[1], img.shape[0]), borderMode=cv2.BORDER_REPLICATE)
+
+def construir_modelo(capturas: List[np.ndarray]) -> Dict[str, np.ndarray]:
+    """Alinha as capturas à primeira e calcula média e desvio por pixel"""
+    base = capturas[0]
+    pilha = np.stack([base] + [alinhar_translacao(c, base) for c in capturas[1:]])
+
+    media = pilha.mean(axis=0)
+    desvio = np.maximum(pilha.std(axis=0), DESVIO_MINIMO)
+
+    return {
+        "media": media.astype(np.float16),
+        "desvio": desvio.astype(np.float16),
+        "n_amostras": np.array(len(capturas), dtype=np.int32),
+    }
+
+def construir_modelos_referencia(referencia_dirs: Iterable[Path], saida_dir: Path = MODELOS_DIR_PADRAO) -> Dict[str, Any]:
+    """Gera um .npz por (botão, câmera) a partir de todas as capturas históricas"""
+    saida_dir = Path(saida_dir)
+    saida_dir.mkdir(parents=True, exist_ok=True)
+
+    grupos = agrupar_capturas_referencia(referencia_dirs)
+    gerados = []
+    ignorados = []
+
+    for (numero, nome, camera_id), caminhos in sorted(grupos.items()):
+        capturas = []
+        for caminho in caminhos:
+            gray = processar_imagem(str(caminho))
+            if gray is not None:
+                capturas.append(reduzir_para_modelo(gray))
+
+        if not capturas:
+            ignorados.append({"botao": numero, "nome": nome, "camera_id": camera_id, "motivo": "nenhuma imagem válida"})
+            continue
+
+        modelo = construir_modelo(capturas)
+        arquivo = saida_dir / nome_arquivo_modelo(numero, nome, camera_id)
+        np.savez_compressed(arquivo, **modelo)
+        gerados.append({
+            "botao": numero,
+            "nome": nome,
+            "camera_id": camera_id,
+            "amostras": len(capturas),
+            "arquivo": str(arquivo)
+        })
+
+    limpar_cache_modelos()
+    print(f"📐 {len(gerados)} modelo(s) de referência gerado(s) em {saida_dir}")
+    return {"modelos": gerados, "ignorados": ignorados, "diretorio": str(saida_dir)}
+
+def carregar_modelo_referencia(botao_numero: int, nome_botao: str, camera_id: int,
+                               modelos_dir: Path = MODELOS_DIR_PADRAO) -> Optional[Dict[str, np.ndarray]]:
+    """Carrega (com cache por mtime) o modelo estatístico de um (botão, câmera), se existir"""
+    arquivo = Path(modelos_dir) / nome_arquivo_modelo(botao_numero, nome_botao, camera_id)
+    chave = str(arquivo)
+    try:
+        mtime = arquivo.stat().st_mtime
+    except OSError:
+        return None
+
+    with _cache_lock:
+        entrada = _cache_modelos.get(chave)
+        if entrada is not None and entrada[0] == mtime:
+            return entrada[1]
+
+    try:
+        with np.load(arquivo) as dados:
+            modelo = {
+                "media": dados["media"].astype(np.float32),
+                "desvio": dados["desvio"].astype(np.float32),
+                "n_amostras": int(dados["n_amostras"]),
+            }
+    except Exception as e:
+        print(f"⚠️ Erro ao carregar modelo {arquivo.name}: {e}")
+        modelo = None
+
+    with _cache_lock:
+        _cache_modelos[chave] = (mtime, modelo)
+    return modelo
+
+def limpar_cache_modelos():
+    """Descarta os modelos carregados em memória"""
+    with _cache_lock:
+        _cache_modelos.clear()
+
+def pontuar_com_modelo(img_teste: np.ndarray, modelo: Dict[str, np.ndarray], z_maximo: float = Z_MAXIMO) -> Dict[str, float]:
+    """Pontua uma imagem processada contra o modelo: fração de pixels com |z| <= z_maximo"""
+    teste = reduzir_para_modelo(img_teste)
+    media = modelo["media"]
+    teste = alinhar_translacao(teste, media)
+
+    z = np.abs(teste - media) / modelo["desvio"]
+    return {
+        "similaridade_estatistica": float(np.count_nonzero(z <= z_maximo) / z.size),
+        "z_medio": float(z.mean()),
+    }
+
+def comparar_imagem_com_modelo(imagem_teste_path: str, modelo: Dict[str, np.ndarray],
+                               limiar: float = LIMIAR_SIMILARIDADE_ESTATISTICA) -> Dict[str, Any]:
+    """Valida uma foto de teste apenas contra o modelo estatístico"""
+    img_teste = processar_imagem(imagem_teste_path)
+    if img_teste is None:
+        return {"aprovado": False, "similaridade_media": 0.0, "erro": "Erro ao processar imagem"}
+
+    scores = pontuar_com_modelo(img_teste, modelo)
+    return {
+        "aprovado": scores["similaridade_estatistica"] >= limiar,
+        "similaridade_media": round(scores["similaridade_estatistica"], 4),
+        "similaridade_estatistica": round(scores["similaridade_estatistica"], 4),
+        "z_medio": round(scores["z_medio"], 4),
+        "amostras_modelo": modelo["n_amostras"],
+        "etapa_decisiva": "modelo_estatistico",
+        "etapas_executadas": ["modelo_estatistico"],
+    }
+
+def etapa_modelo_estatistico(ctx: ContextoValidacao) -> Optional[bool]:
+    """Etapa da cascata: decide pelo modelo estatístico quando houver um em ctx.extras"""
+    modelo = ctx.extras.get("modelo_estatistico")
+    if modelo is None:
+        return None
+
+    scores = pontuar_com_modelo(ctx.img_teste, modelo)
+    ctx.resultado["similaridade_estatistica"] = round(scores["similaridade_estatistica"], 4)
+    ctx.resultado["z_medio"] = round(scores["z_medio"], 4)
+    ctx.resultado["amostras_modelo"] = modelo["n_amostras"]
+    ctx.resultado["similaridade_media"] = round(scores["similaridade_estatistica"], 4)
+    return scores["similaridade_estatistica"] >= LIMIAR_SIMILARIDADE_ESTATISTICA
+
+registrar_etapa_validacao("modelo_estatistico", etapa_modelo_estatistico)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gera modelos estatísticos de referência (.npz)")
+    parser.add_argument("referencias", nargs="*", default=["camera_photos_modelo1"],
+                        help="Diretórios com capturas de referência")
+    parser.add_argument("--saida", default=str(MODELOS_DIR_PADRAO), help="Diretório de saída dos modelos")
+    args = parser.parse_args()
+
+    resultado = construir_modelos_referencia([Path(d) for d in args.referencias], Path(args.saida))
+    for ignorado in resultado["ignorados"]:
+        print(f"⚠️ Ignorado botão {ignorado['botao']} câmera {ignorado['camera_id']}: {ignorado['motivo']}")
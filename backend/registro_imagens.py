@@ -0,0 +1,154 @@
+"""
+==============================================
+REGISTRO DE IMAGENS POR CICLO
+==============================================
+Compensa o deslocamento do controle no berço: estima uma transformação
+euclidiana por câmera uma única vez por ciclo (primeiro botão ou região
+fiducial) e reaplica a mesma transformação a todos os frames seguintes
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+import threading
+import time
+
+import cv2
+import numpy as np
+
+# Escala usada para estimar o ECC (custo ~1/16 da resolução cheia)
+ESCALA_ESTIMATIVA = 0.25
+
+# Critérios do ECC
+ECC_ITERACOES = 50
+ECC_EPSILON = 1e-4
+
+# Correlação mínima do ECC para confiar na transformação
+ECC_CORRELACAO_MINIMA = 0.5
+
+# Deslocamento máximo plausível (pixels na resolução 640x480) e rotação (graus)
+DESLOCAMENTO_MAXIMO = 40.0
+ROTACAO_MAXIMA = 5.0
+
+MATRIZ_IDENTIDADE = np.eye(2, 3, dtype=np.float32)
+
+
+@dataclass
+class TransformacaoCamera:
+    """Transformação estimada para uma câmera no ciclo atual"""
+    matriz: np.ndarray
+    correlacao: float
+    valida: bool
+    tempo_estimativa_ms: float
+
+    @classmethod
+    def de_resumo(cls, dados: Dict[str, Any]) -> "TransformacaoCamera":
+        """Reconstrói a transformação gravada no JSON do ciclo (metadata.registro_cameras)"""
+        angulo = np.radians(float(dados.get("angulo", 0.0)))
+        matriz = np.array([[np.cos(angulo), -np.sin(angulo), float(dados.get("dx", 0.0))],
+                           [np.sin(angulo), np.cos(angulo), float(dados.get("dy", 0.0))]], dtype=np.float32)
+        return cls(matriz=matriz, correlacao=float(dados.get("correlacao", 0.0)),
+                   valida=bool(dados.get("valida", False)), tempo_estimativa_ms=0.0)
+
+    def resumo(self) -> Dict[str, Any]:
+        dx, dy = float(self.matriz[0, 2]), float(self.matriz[1, 2])
+        angulo = float(np.degrees(np.arctan2(self.matriz[1, 0], self.matriz[0, 0])))
+        return {
+            "dx": round(dx, 2),
+            "dy": round(dy, 2),
+            "angulo": round(angulo, 3),
+            "correlacao": round(self.correlacao, 4),
+            "valida": self.valida,
+        }
+
+
+class RegistroCiclo:
+    """Cache de transformações por câmera válido durante um ciclo de teste"""
+
+    def __init__(self, roi_fiducial: Optional[Tuple[int, int, int, int]] = None):
+        # roi_fiducial: (x, y, largura, altura) na resolução 640x480; None = imagem inteira
+        self.roi_fiducial = roi_fiducial
+        self.transformacoes: Dict[int, TransformacaoCamera] = {}
+        self.lock = threading.Lock()
+
+    def _mascara(self, shape: Tuple[int, int]) -> Optional[np.ndarray]:
+        if self.roi_fiducial is None:
+            return None
+        x, y, w, h = (int(v * ESCALA_ESTIMATIVA) for v in self.roi_fiducial)
+        mascara = np.zeros(shape, dtype=np.uint8)
+        mascara[y:y + h, x:x + w] = 255
+        return mascara
+
+    def estimar(self, camera_id: int, img_teste: np.ndarray, img_ref: np.ndarray) -> TransformacaoCamera:
+        """Estima (ECC euclidiano em escala reduzida) a transformação teste -> referência"""
+        inicio = time.perf_counter()
+
+        ref_pequena = cv2.resize(img_ref, None, fx=ESCALA_ESTIMATIVA, fy=ESCALA_ESTIMATIVA,
+                                 interpolation=cv2.INTER_AREA).astype(np.float32)
+        teste_pequena = cv2.resize(img_teste, None, fx=ESCALA_ESTIMATIVA, fy=ESCALA_ESTIMATIVA,
+                                   interpolation=cv2.INTER_AREA).astype(np.float32)
+
+        matriz = MATRIZ_IDENTIDADE.copy()
+        correlacao = 0.0
+        valida = False
+        try:
+            criterio = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, ECC_ITERACOES, ECC_EPSILON)
+            correlacao, matriz = cv2.findTransformECC(
+                ref_pequena, teste_pequena, matriz, cv2.MOTION_EUCLIDEAN,
+                criterio, self._mascara(ref_pequena.shape), 5
+            )
+            # Volta a translação para a resolução cheia
+            matriz[:, 2] /= ESCALA_ESTIMATIVA
+
+            deslocamento = float(np.hypot(matriz[0, 2], matriz[1, 2]))
+            angulo = abs(float(np.degrees(np.arctan2(matriz[1, 0], matriz[0, 0]))))
+            valida = (correlacao >= ECC_CORRELACAO_MINIMA
+                      and deslocamento <= DESLOCAMENTO_MAXIMO
+                      and angulo <= ROTACAO_MAXIMA)
+        except cv2.error as e:
+            print(f"⚠️ Registro câmera {camera_id}: ECC não convergiu ({e})")
+
+        if not valida:
+            matriz = MATRIZ_IDENTIDADE.copy()
+
+        transformacao = TransformacaoCamera(
+            matriz=matriz.astype(np.float32),
+            correlacao=float(correlacao),
+            valida=valida,
+            tempo_estimativa_ms=(time.perf_counter() - inicio) * 1000,
+        )
+        with self.lock:
+            self.transformacoes[camera_id] = transformacao
+
+        status = "✅" if valida else "⚠️ (identidade)"
+        print(f"📐 Registro câmera {camera_id} {status}: {transformacao.resumo()} "
+              f"em {transformacao.tempo_estimativa_ms:.1f} ms")
+        return transformacao
+
+    def obter(self, camera_id: int) -> Optional[TransformacaoCamera]:
+        with self.lock:
+            return self.transformacoes.get(camera_id)
+
+    def restaurar(self, resumo: Dict[Any, Dict[str, Any]]):
+        """Recarrega as transformações de um ciclo gravado (reprocessamento offline)"""
+        with self.lock:
+            for camera_id, dados in resumo.items():
+                self.transformacoes[int(camera_id)] = TransformacaoCamera.de_resumo(dados)
+
+    def aplicar(self, camera_id: int, img: np.ndarray) -> np.ndarray:
+        """Aplica a transformação em cache (warpAffine) - não faz nada se não houver uma válida"""
+        transformacao = self.obter(camera_id)
+        if transformacao is None or not transformacao.valida:
+            return img
+        return cv2.warpAffine(img, transformacao.matriz, (img.shape[1], img.shape[0]),
+                              flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+                              borderMode=cv2.BORDER_REPLICATE)
+
+    def alinhar(self, camera_id: int, img_teste: np.ndarray, img_ref: np.ndarray) -> np.ndarray:
+        """Estima na primeira chamada da câmera no ciclo; nas seguintes só reaplica"""
+        if self.obter(camera_id) is None:
+            self.estimar(camera_id, img_teste, img_ref)
+        return self.aplicar(camera_id, img_teste)
+
+    def resumo(self) -> Dict[int, Dict[str, Any]]:
+        with self.lock:
+            return {camera_id: t.resumo() for camera_id, t in self.transformacoes.items()}
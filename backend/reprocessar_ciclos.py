@@ -0,0 +1,276 @@
+"""
+==============================================
+REPROCESSAMENTO OFFLINE DE CICLOS
+==============================================
+Reexecuta a validação dos ciclos arquivados em test_results/ciclo_* com
+uma nova configuração (threshold, pesos, regra dos controles) em um pool
+de processos e gera o diff de veredictos por botão e por controle.
+
+Por padrão usa a mesma cascata do ciclo (CASCATA_CICLO) e o mesmo
+registro por câmera: as transformações gravadas no JSON do ciclo são
+reaplicadas e, em ciclos sem elas, estimadas na primeira comparação de
+cada câmera, na ordem de visita. Sem o decodificador do modelo a etapa
+"lcd" não decide e a cascata segue para as seguintes.
+
+Uso:
+    python reprocessar_ciclos.py --threshold 0.8 --peso-template 0.6 --workers 8
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import json
+import os
+
+from validacao_imagens import (
+    CASCATA_CICLO,
+    ConfiguracaoValidacao,
+    comparar_imagem_com_referencia,
+    consolidar_validacao_botao,
+    encontrar_imagem_referencia,
+    gerar_relatorio_controles,
+)
+from registro_imagens import RegistroCiclo
+# Importados para registrar as etapas "lcd" e "modelo_estatistico" também nos processos do pool
+import decodificador_lcd
+from referencia_estatistica import carregar_modelo_referencia
+
+# Configuração padrão: a do ciclo ao vivo
+CONFIGURACAO_CICLO = ConfiguracaoValidacao(cascata=CASCATA_CICLO)
+
+
+def carregar_resultado_ciclo(ciclo_dir: Path) -> Optional[Tuple[Path, Dict[str, Any]]]:
+    """Carrega o JSON de resultado mais recente de um diretório de ciclo"""
+    arquivos = sorted(ciclo_dir.glob("resultado_teste_*.json"))
+    if not arquivos:
+        return None
+    with open(arquivos[-1], 'r', encoding='utf-8') as f:
+        return arquivos[-1], json.load(f)
+
+def caminho_local(caminho_salvo: Optional[str], base_dir: Path) -> Optional[Path]:
+    """Converte um caminho gravado no JSON (possivelmente Windows) para o sistema atual"""
+    if not caminho_salvo:
+        return None
+    caminho = Path(caminho_salvo.replace('\\', '/'))
+    return caminho if caminho.is_absolute() else base_dir / caminho
+
+def reavaliar_camera(validacao: Dict[str, Any], foto: Optional[Path], referencia: Optional[Path],
+                     config: ConfiguracaoValidacao, modelo_ref=None,
+                     registro: Optional[RegistroCiclo] = None) -> Dict[str, Any]:
+    """Revalida uma câmera: com as imagens se existirem, senão a partir dos scores salvos"""
+    novo = {
+        "camera_id": validacao.get("camera_id"),
+        "imagem_referencia_encontrada": validacao.get("imagem_referencia_encontrada", False),
+    }
+
+    if foto is not None and foto.exists() and referencia is not None and referencia.exists():
+        resultado = comparar_imagem_com_referencia(
+            str(foto), str(referencia),
+            threshold=config.threshold,
+            cascata=config.cascata,
+            extras={"modelo_estatistico": modelo_ref},
+            registro=registro,
+            camera_id=validacao.get("camera_id"),
+            pesos=config.pesos
+        )
+        novo.update(resultado)
+        novo["imagem_referencia_encontrada"] = True
+        novo["fonte"] = "imagens"
+        return novo
+
+    template = validacao.get("similaridade_template")
+    hist = validacao.get("similaridade_hist")
+    if template is not None and hist is not None:
+        # Fotos já limpas: recalcula a média ponderada com os scores do JSON
+        media = template * config.peso_template + hist * config.peso_hist
+        novo.update({"similaridade_template": template, "similaridade_hist": hist, "fonte": "scores_salvos"})
+    else:
+        media = validacao.get("similaridade_media", 0.0)
+        novo["fonte"] = "media_salva"
+
+    novo["similaridade_media"] = round(media, 4)
+    novo["aprovado"] = novo["imagem_referencia_encontrada"] and media >= config.threshold
+    return novo
+
+def reprocessar_ciclo(tarefa: Tuple[str, str, str, Optional[str], ConfiguracaoValidacao]) -> Dict[str, Any]:
+    """Reprocessa um ciclo inteiro (executado em um processo do pool)"""
+    ciclo_dir, base_dir, referencia_dir, modelos_dir, config = tarefa
+    ciclo_dir, base_dir, referencia_dir = Path(ciclo_dir), Path(base_dir), Path(referencia_dir)
+
+    try:
+        carregado = carregar_resultado_ciclo(ciclo_dir)
+        if carregado is None:
+            return {"ciclo": ciclo_dir.name, "erro": "Nenhum resultado_teste_*.json encontrado"}
+        arquivo, dados = carregado
+
+        fotos_dir = ciclo_dir / "fotos"
+        botoes_diff = []
+        resultados_validacao = []
+
+        # Registro como no ciclo: transformações gravadas ou estimadas no primeiro botão visitado
+        metadata = dados.get("metadata") or {}
+        registro = RegistroCiclo()
+        registro.restaurar(metadata.get("registro_cameras") or {})
+        ordem = {botao_numero: k for k, botao_numero in enumerate(metadata.get("ordem_visita") or [])}
+        botoes = sorted(dados.get("botoes_mapeados", []), key=lambda b: ordem.get(b.get("botao_numero"), len(ordem)))
+
+        for botao in botoes:
+            botao_numero = botao.get("botao_numero")
+            nome_botao = botao.get("nome_botao") or ""
+            fotos_por_camera = {f.get("camera_id"): fotos_dir / f.get("filename", "") for f in botao.get("fotos_capturadas", [])}
+            validacao_antiga = botao.get("validacao", {})
+
+            novas_validacoes = []
+            for validacao in validacao_antiga.get("validacoes_por_camera", []):
+                camera_id = validacao.get("camera_id")
+                referencia = caminho_local(validacao.get("imagem_referencia"), base_dir)
+                if referencia is None or not referencia.exists():
+                    referencia = encontrar_imagem_referencia(botao_numero, nome_botao, camera_id, referencia_dir)
+                modelo_ref = None
+                if modelos_dir and "modelo_estatistico" in config.cascata:
+                    modelo_ref = carregar_modelo_referencia(botao_numero, nome_botao, camera_id, Path(modelos_dir))
+                novas_validacoes.append(
+                    reavaliar_camera(validacao, fotos_por_camera.get(camera_id), referencia, config, modelo_ref, registro)
+                )
+
+            aprovado, similaridade = consolidar_validacao_botao(novas_validacoes)
+            controle_numero = botao.get("controle_numero", 1)
+            resultados_validacao.append({
+                "controle_numero": controle_numero,
+                "nome_botao": nome_botao,
+                "botao_numero": botao_numero,
+                "validacao": {"aprovado": aprovado, "similaridade_media": round(similaridade, 4)}
+            })
+
+            antes = validacao_antiga.get("aprovado", False)
+            botoes_diff.append({
+                "botao_numero": botao_numero,
+                "nome_botao": nome_botao,
+                "controle_numero": controle_numero,
+                "antes": antes,
+                "depois": aprovado,
+                "similaridade_antes": validacao_antiga.get("similaridade_media", 0.0),
+                "similaridade_depois": round(similaridade, 4),
+                "mudou": antes != aprovado,
+                "fontes": sorted({v["fonte"] for v in novas_validacoes}),
+            })
+
+        botoes_diff.sort(key=lambda b: b["botao_numero"] or 0)
+        novo_relatorio = gerar_relatorio_controles(
+            resultados_validacao,
+            taxa_minima=config.taxa_minima_controle,
+            similaridade_minima=config.similaridade_minima_controle
+        )
+        relatorio_antigo = dados.get("relatorio_controles", {}).get("controles", {})
+        controles_diff = {}
+        for controle_num, info in novo_relatorio["controles"].items():
+            antes = relatorio_antigo.get(str(controle_num), relatorio_antigo.get(controle_num, {})).get("aprovado", False)
+            controles_diff[controle_num] = {
+                "antes": antes,
+                "depois": info["aprovado"],
+                "mudou": antes != info["aprovado"],
+                "taxa_aprovacao": info["taxa_aprovacao"],
+                "similaridade_media": info["similaridade_media"],
+            }
+
+        return {
+            "ciclo": ciclo_dir.name,
+            "arquivo": str(arquivo),
+            "botoes": botoes_diff,
+            "controles": controles_diff,
+            "erro": None,
+        }
+    except Exception as e:
+        return {"ciclo": ciclo_dir.name, "erro": str(e)}
+
+def reprocessar_ciclos(resultados_dir: Path, config: Optional[ConfiguracaoValidacao], referencia_dir: Path,
+                       modelos_dir: Optional[Path] = None, workers: Optional[int] = None) -> Dict[str, Any]:
+    """Distribui os ciclos em um pool de processos e consolida o diff de veredictos (config None = a do ciclo)"""
+    config = config or CONFIGURACAO_CICLO
+    resultados_dir = Path(resultados_dir)
+    base_dir = resultados_dir.resolve().parent
+    ciclos = sorted(d for d in resultados_dir.glob("ciclo_*") if d.is_dir())
+    tarefas = [
+        (str(c), str(base_dir), str(referencia_dir), str(modelos_dir) if modelos_dir else None, config)
+        for c in ciclos
+    ]
+
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(tarefas) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        ciclos_diff: List[Dict[str, Any]] = list(executor.map(reprocessar_ciclo, tarefas, chunksize=chunksize))
+
+    resumo = {
+        "ciclos": len(ciclos_diff),
+        "ciclos_com_erro": sum(1 for c in ciclos_diff if c.get("erro")),
+        "botoes_alterados": sum(1 for c in ciclos_diff for b in c.get("botoes", []) if b["mudou"]),
+        "controles_alterados": sum(1 for c in ciclos_diff for v in c.get("controles", {}).values() if v["mudou"]),
+    }
+    return {
+        "gerado_em": datetime.now().isoformat(),
+        "configuracao": {
+            "threshold": config.threshold,
+            "peso_template": config.peso_template,
+            "peso_hist": config.peso_hist,
+            "taxa_minima_controle": config.taxa_minima_controle,
+            "similaridade_minima_controle": config.similaridade_minima_controle,
+            "cascata": list(config.cascata),
+        },
+        "resumo": resumo,
+        "ciclos": ciclos_diff,
+    }
+
+
+if __name__ == "__main__":
+    padrao = CONFIGURACAO_CICLO
+    parser = argparse.ArgumentParser(description="Reprocessa ciclos arquivados com uma nova configuração de validação")
+    parser.add_argument("--resultados", default="test_results", help="Diretório com os ciclo_*")
+    parser.add_argument("--referencias", default="camera_photos_modelo1", help="Diretório de referência")
+    parser.add_argument("--modelos", default=None, help="Diretório de modelos estatísticos (.npz)")
+    parser.add_argument("--threshold", type=float, default=padrao.threshold)
+    parser.add_argument("--peso-template", type=float, default=padrao.peso_template)
+    parser.add_argument("--peso-hist", type=float, default=None, help="Padrão: 1 - peso-template")
+    parser.add_argument("--taxa-minima", type=float, default=padrao.taxa_minima_controle)
+    parser.add_argument("--similaridade-minima", type=float, default=padrao.similaridade_minima_controle)
+    parser.add_argument("--cascata", default=",".join(padrao.cascata), help="Etapas separadas por vírgula")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--saida", default=None, help="Arquivo JSON do diff")
+    args = parser.parse_args()
+
+    config = ConfiguracaoValidacao(
+        threshold=args.threshold,
+        peso_template=args.peso_template,
+        peso_hist=args.peso_hist if args.peso_hist is not None else round(1.0 - args.peso_template, 6),
+        taxa_minima_controle=args.taxa_minima,
+        similaridade_minima_controle=args.similaridade_minima,
+        cascata=tuple(e.strip() for e in args.cascata.split(",") if e.strip()),
+    )
+
+    resultado = reprocessar_ciclos(
+        Path(args.resultados), config, Path(args.referencias),
+        Path(args.modelos) if args.modelos else None, args.workers
+    )
+
+    for ciclo in resultado["ciclos"]:
+        if ciclo.get("erro"):
+            print(f"⚠️ {ciclo['ciclo']}: {ciclo['erro']}")
+            continue
+        for botao in ciclo["botoes"]:
+            if botao["mudou"]:
+                print(f"🔁 {ciclo['ciclo']} botão {botao['botao_numero']:03d} {botao['nome_botao']}: "
+                      f"{'APROVADO' if botao['antes'] else 'REPROVADO'} -> {'APROVADO' if botao['depois'] else 'REPROVADO'}")
+        for controle_num, controle in ciclo["controles"].items():
+            if controle["mudou"]:
+                print(f"🔁 {ciclo['ciclo']} controle {controle_num}: "
+                      f"{'APROVADO' if controle['antes'] else 'REPROVADO'} -> {'APROVADO' if controle['depois'] else 'REPROVADO'}")
+
+    saida = Path(args.saida or f"reprocessamento_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(saida, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, indent=2, ensure_ascii=False)
+
+    resumo = resultado["resumo"]
+    print(f"📊 {resumo['ciclos']} ciclo(s), {resumo['botoes_alterados']} botão(ões) e "
+          f"{resumo['controles_alterados']} controle(s) com veredicto alterado")
+    print(f"💾 Diff salvo em: {saida}")
@@ -0,0 +1,302 @@
+"""
+==============================================
+SIMULADOR DO TEMPO DE CICLO (DRY-RUN)
+==============================================
+Estima o tempo de ciclo de um plano compilado (receita_teste.py) sem a
+bancada. Cada passo vira um nó de um grafo de dependências com os mesmos
+hazards do pipeline (pipeline_ciclo.py): o pressionamento espera o IR do
+botão anterior e as validações rodam em ordem.
+
+    - movimentos: perfil trapezoidal do GRBL (velocidade máxima e
+      aceleração por eixo, como $110/$111/$120/$121), mais o ok + Idle
+    - comandos pneumáticos: latência da serial + espera da receita
+    - câmeras: espera do próximo frame e recapturas do controle de qualidade
+    - IR e validação: distribuições de latência (Monte Carlo com numpy)
+
+Relata o tempo esperado (e percentis), o caminho crítico e a folga de
+cada passo. Sem amostras (amostras=0) a simulação é determinística e leva
+poucos milissegundos, para comparar milhares de ordens ou tabelas de tempos.
+"""
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import argparse
+import json
+import re
+import time
+
+import numpy as np
+
+from movimento_grbl import INTERVALO_STATUS
+from qualidade_frame import MAX_RECAPTURAS
+from receita_teste import PlanoExecucao, Passo, carregar_receita, compilar_receita
+
+PADRAO_XY = re.compile(r"X([-\d.]+)\s*Y([-\d.]+)")
+
+
+@dataclass
+class ParametrosSimulacao:
+    """Parâmetros da bancada (ajustar com as medições da máquina)"""
+    velocidade_max_mm_min: Tuple[float, float] = (6000.0, 6000.0)  # $110 / $111
+    aceleracao_mm_s2: Tuple[float, float] = (500.0, 500.0)  # $120 / $121
+    posicao_inicial: Tuple[float, float] = (0.0, 0.0)
+    latencia_serial_s: float = 0.002
+    latencia_ack_s: float = 0.01  # ok do GRBL + primeiro status
+    atuacao_rele_s: float = 0.12  # curso do atuador pneumático após P_1/P_0
+    fps_camera: float = 30.0
+    cameras: int = 4
+    probabilidade_recaptura: float = 0.05
+    identificacao_s: float = 0.002
+    ir_mediana_s: float = 0.6  # latência do Nano/Node.js (lognormal)
+    ir_sigma: float = 0.35
+    ir_probabilidade_timeout: float = 0.01
+    validacao_media_s: float = 0.08
+    validacao_desvio_s: float = 0.02
+
+
+@dataclass
+class NoSimulacao:
+    """Passo do plano como nó do grafo de dependências"""
+    rotulo: str
+    acao: str
+    duracoes: np.ndarray
+    predecessores: List[int]
+    segundo_plano: bool = False
+
+
+@dataclass
+class ResultadoSimulacao:
+    """Tempo de ciclo, caminho crítico e folgas de uma simulação"""
+    tempo_esperado_s: float
+    percentis_s: Dict[str, float]
+    caminho_critico: List[str]
+    folgas: List[Dict[str, Any]]
+    tempo_por_acao_s: Dict[str, float]
+    alertas: List[str] = field(default_factory=list)
+    amostras: int = 0
+    tempo_simulacao_ms: float = 0.0
+
+    def resumo(self, folgas: bool = False) -> Dict[str, Any]:
+        resumo = {
+            "tempo_esperado_s": round(self.tempo_esperado_s, 3),
+            "percentis_s": {k: round(v, 3) for k, v in self.percentis_s.items()},
+            "caminho_critico": self.caminho_critico,
+            "tempo_por_acao_s": {k: round(v, 3) for k, v in self.tempo_por_acao_s.items()},
+            "alertas": self.alertas,
+            "amostras": self.amostras,
+            "tempo_simulacao_ms": round(self.tempo_simulacao_ms, 2),
+        }
+        if folgas:
+            resumo["folgas"] = self.folgas
+        return resumo
+
+
+def tempo_movimento(origem: Tuple[float, float], destino: Tuple[float, float], parametros: ParametrosSimulacao) -> float:
+    """Movimento em linha reta com perfil trapezoidal, limitado pelo eixo mais restritivo (como o planejador do GRBL)"""
+    delta = np.subtract(destino, origem, dtype=float)
+    distancia = float(np.hypot(*delta))
+    if distancia == 0.0:
+        return 0.0
+    direcao = np.abs(delta) / distancia
+    com_curso = direcao > 0
+    velocidade = float(np.min(np.array(parametros.velocidade_max_mm_min)[com_curso] / 60.0 / direcao[com_curso]))
+    aceleracao = float(np.min(np.array(parametros.aceleracao_mm_s2)[com_curso] / direcao[com_curso]))
+
+    distancia_rampas = velocidade ** 2 / aceleracao
+    if distancia >= distancia_rampas:
+        return distancia / velocidade + velocidade / aceleracao
+    # Perfil triangular: não chega à velocidade máxima
+    return 2.0 * float(np.sqrt(distancia / aceleracao))
+
+def _duracoes(passo: Passo, parametros: ParametrosSimulacao, amostras: int, rng: np.random.Generator,
+              posicao: Tuple[float, float]) -> Tuple[np.ndarray, Tuple[float, float]]:
+    """Durações amostradas do passo (e a posição do pórtico depois dele)"""
+    n = max(amostras, 1)
+    aleatorio = amostras > 0
+    acao = passo.acao
+
+    if acao == "mover":
+        achado = PADRAO_XY.search(passo.comando or "")
+        destino = (float(achado.group(1)), float(achado.group(2))) if achado else posicao
+        # Fim do movimento detectado no ok + status Idle (consulta a cada INTERVALO_STATUS)
+        espera_status = rng.uniform(0.0, INTERVALO_STATUS, n) if aleatorio else np.full(n, INTERVALO_STATUS / 2)
+        base = tempo_movimento(posicao, destino, parametros) + parametros.latencia_serial_s + parametros.latencia_ack_s
+        return base + espera_status, destino
+
+    if acao in ("comando", "pressionar", "liberar"):
+        return np.full(n, parametros.latencia_serial_s + passo.tempo), posicao
+
+    if acao == "aguardar":
+        return np.full(n, passo.tempo), posicao
+
+    if acao == "capturar_fotos":
+        # Câmeras em paralelo: espera do próximo frame + recapturas; vale a mais lenta
+        periodo = 1.0 / parametros.fps_camera
+        if not aleatorio:
+            recapturas = min(parametros.probabilidade_recaptura / (1 - parametros.probabilidade_recaptura), MAX_RECAPTURAS)
+            return np.full(n, periodo / 2 + recapturas * periodo), posicao
+        fase = rng.uniform(0.0, periodo, (n, parametros.cameras))
+        recapturas = np.minimum(rng.geometric(1 - parametros.probabilidade_recaptura, (n, parametros.cameras)) - 1, MAX_RECAPTURAS)
+        return (fase + recapturas * periodo).max(axis=1), posicao
+
+    if acao == "identificar_modelo":
+        return np.full(n, parametros.identificacao_s), posicao
+
+    if acao == "capturar_ir":
+        limite = passo.timeout_ms / 1000.0
+        if not aleatorio:
+            media = parametros.ir_mediana_s * np.exp(parametros.ir_sigma ** 2 / 2)
+            esperado = (1 - parametros.ir_probabilidade_timeout) * min(media, limite) + parametros.ir_probabilidade_timeout * limite
+            return np.full(n, esperado), posicao
+        latencia = np.minimum(rng.lognormal(np.log(parametros.ir_mediana_s), parametros.ir_sigma, n), limite)
+        return np.where(rng.random(n) < parametros.ir_probabilidade_timeout, limite, latencia), posicao
+
+    if acao == "validar_fotos":
+        if not aleatorio:
+            return np.full(n, parametros.validacao_media_s), posicao
+        return np.maximum(rng.normal(parametros.validacao_media_s, parametros.validacao_desvio_s, n), 0.0), posicao
+
+    return np.zeros(n), posicao
+
+def montar_grafo(plano: PlanoExecucao, parametros: ParametrosSimulacao, amostras: int = 0,
+                 rng: Optional[np.random.Generator] = None, incluir_preparacao: bool = True) -> List[NoSimulacao]:
+    """Grafo de dependências do plano: cadeia em primeiro plano + tarefas do pipeline com seus hazards"""
+    rng = rng or np.random.default_rng()
+    passos = (plano.preparacao + plano.inicio if incluir_preparacao else []) + plano.botoes
+
+    nos: List[NoSimulacao] = []
+    anterior: Optional[int] = None
+    ir_por_botao: Dict[int, int] = {}
+    validacao_por_botao: Dict[int, int] = {}
+    ultimo_botao: Optional[int] = None
+    posicao = parametros.posicao_inicial
+
+    for passo in passos:
+        if passo.acao == "iniciar_botao":
+            continue
+        if passo.acao == "concluir_botao":
+            ultimo_botao = passo.botao + 1
+            continue
+
+        duracoes, posicao = _duracoes(passo, parametros, amostras, rng, posicao)
+        predecessores = [anterior] if anterior is not None else []
+        rotulo = f"{passo.botao + 1:02d}:{passo.acao}" if passo.botao is not None else f"{passo.acao}:{passo.descricao or passo.comando}"
+
+        if passo.acao == "pressionar" and ultimo_botao in ir_por_botao:
+            # Hazard: o próximo pressionamento espera o IR do botão anterior
+            predecessores.append(ir_por_botao[ultimo_botao])
+        if passo.acao in ("capturar_ir", "validar_fotos"):
+            if passo.acao == "validar_fotos" and ultimo_botao in validacao_por_botao:
+                # Hazard: validações em ordem (RegistroCiclo do primeiro botão)
+                predecessores.append(validacao_por_botao[ultimo_botao])
+            nos.append(NoSimulacao(rotulo, passo.acao, duracoes, predecessores, segundo_plano=True))
+            destino = ir_por_botao if passo.acao == "capturar_ir" else validacao_por_botao
+            destino[passo.botao + 1] = len(nos) - 1
+            continue
+
+        nos.append(NoSimulacao(rotulo, passo.acao, duracoes, predecessores))
+        anterior = len(nos) - 1
+
+    # Fim do ciclo: último passo em primeiro plano e todas as tarefas do pipeline concluídas
+    finais = ([anterior] if anterior is not None else []) + [k for k, no in enumerate(nos) if no.segundo_plano]
+    nos.append(NoSimulacao("fim", "fim", np.zeros(max(amostras, 1)), finais))
+    return nos
+
+def _alertas(plano: PlanoExecucao, parametros: ParametrosSimulacao) -> List[str]:
+    """Esperas da receita menores que o curso do atuador (o passo seguinte começa com o dedo em movimento)"""
+    alertas = []
+    for passo in plano.botoes:
+        if passo.acao in ("pressionar", "liberar") and passo.tempo < parametros.atuacao_rele_s:
+            alertas.append(f"{passo.descricao}: espera {passo.tempo:.3f} s < atuação {parametros.atuacao_rele_s:.3f} s")
+    return alertas
+
+def simular_plano(plano: PlanoExecucao, parametros: Optional[ParametrosSimulacao] = None, amostras: int = 0,
+                  semente: Optional[int] = None, incluir_preparacao: bool = True) -> ResultadoSimulacao:
+    """Tempo de ciclo esperado, percentis (Monte Carlo), caminho crítico e folga de cada passo"""
+    inicio = time.perf_counter()
+    parametros = parametros or ParametrosSimulacao()
+    nos = montar_grafo(plano, parametros, amostras, np.random.default_rng(semente), incluir_preparacao)
+
+    # Passada para frente em todas as amostras de uma vez (os nós já estão em ordem topológica)
+    termino = np.zeros((len(nos), max(amostras, 1)))
+    for k, no in enumerate(nos):
+        comeco = termino[no.predecessores].max(axis=0) if no.predecessores else 0.0
+        termino[k] = comeco + no.duracoes
+    ciclo = termino[-1]
+
+    # Caminho crítico e folgas com as durações médias
+    duracao = np.array([no.duracoes.mean() for no in nos])
+    cedo = np.zeros(len(nos))
+    for k, no in enumerate(nos):
+        cedo[k] = max((cedo[p] + duracao[p] for p in no.predecessores), default=0.0)
+    total = float(cedo[-1] + duracao[-1])
+    tarde = np.full(len(nos), total)
+    for k in range(len(nos) - 1, -1, -1):
+        for p in nos[k].predecessores:
+            tarde[p] = min(tarde[p], tarde[k] - duracao[p])
+    folga = tarde - cedo
+
+    caminho = []
+    k = len(nos) - 1
+    while nos[k].predecessores:
+        k = max(nos[k].predecessores, key=lambda p: cedo[p] + duracao[p])
+        caminho.append(nos[k].rotulo)
+    caminho.reverse()
+
+    tempo_por_acao: Dict[str, float] = {}
+    for no, d in zip(nos, duracao):
+        if not no.segundo_plano and no.acao != "fim":
+            tempo_por_acao[no.acao] = tempo_por_acao.get(no.acao, 0.0) + float(d)
+    tempo_por_acao["espera_pipeline"] = max(total - sum(tempo_por_acao.values()), 0.0)
+
+    percentis = {"p50": float(np.percentile(ciclo, 50)), "p95": float(np.percentile(ciclo, 95)), "media": float(ciclo.mean())} if amostras else {}
+    return ResultadoSimulacao(
+        tempo_esperado_s=total,
+        percentis_s=percentis,
+        caminho_critico=caminho,
+        folgas=[{"passo": no.rotulo, "inicio_s": round(float(c), 3), "duracao_s": round(float(d), 3), "folga_s": round(float(f), 3)}
+                for no, c, d, f in zip(nos[:-1], cedo, duracao, folga)],
+        tempo_por_acao_s=tempo_por_acao,
+        alertas=_alertas(plano, parametros),
+        amostras=amostras,
+        tempo_simulacao_ms=(time.perf_counter() - inicio) * 1000,
+    )
+
+def comparar_ordens(receita: Dict[str, Any], coordenadas: Sequence[Dict[str, Any]], ordens: Sequence[Sequence[int]],
+                    parametros: Optional[ParametrosSimulacao] = None, com_fotos: bool = True) -> List[float]:
+    """Tempo esperado de cada ordem candidata (simulação determinística, sem a preparação)"""
+    parametros = parametros or ParametrosSimulacao()
+    return [
+        simular_plano(compilar_receita(receita, coordenadas, ordem, com_fotos), parametros, incluir_preparacao=False).tempo_esperado_s
+        for ordem in ordens
+    ]
+
+
+if __name__ == "__main__":
+    from planejador_rota import planejar_rota
+
+    parser = argparse.ArgumentParser(description="Simula o tempo de ciclo de um modelo (sem a bancada)")
+    parser.add_argument("modelo", help="JSON do modelo (modelos/<nome>.json)")
+    parser.add_argument("--receita", help="JSON com seções que sobrescrevem a receita padrão")
+    parser.add_argument("--parametros", help="JSON com ParametrosSimulacao")
+    parser.add_argument("--amostras", type=int, default=2000)
+    parser.add_argument("--sem-fotos", action="store_true")
+    args = parser.parse_args()
+
+    with open(args.modelo, 'r', encoding='utf-8') as f:
+        dados_modelo = json.load(f)
+    parametros = ParametrosSimulacao()
+    if args.parametros:
+        with open(args.parametros, 'r', encoding='utf-8') as f:
+            parametros = ParametrosSimulacao(**json.load(f))
+
+    coordenadas = dados_modelo["test_coordinates"]
+    receita = carregar_receita(dados_modelo.get("config", {}), Path(args.receita) if args.receita else None)
+    plano = compilar_receita(receita, coordenadas, com_fotos=not args.sem_fotos)
+    resultado = simular_plano(plano, parametros, args.amostras)
+    print(f"⏱️ {json.dumps(resultado.resumo(), indent=2, ensure_ascii=False)}")
+
+    rota = planejar_rota(coordenadas, dados_modelo.get("config", {}).get("restricoes_rota"))
+    original, otimizada = comparar_ordens(receita, coordenadas, [range(len(coordenadas)), rota.ordem], parametros, not args.sem_fotos)
+    print(f"🗺️ Ordem de autoria: {original:.2f} s | rota otimizada: {otimizada:.2f} s")
@@ -0,0 +1,297 @@
+"""
+==============================================
+TEMPOS ADAPTATIVOS POR BOTÃO
+==============================================
+A espera entre o P_1 e a foto (espera do "pressionar" na receita, já
+somada às pausas seguintes) e o timeout da captura IR são constantes da
+receita, ajustadas para o botão mais lento. Aqui cada ciclo registra,
+por modelo e por botão:
+
+    display_s   - tempo do P_1 até o display parar de mudar (diferença
+                  entre quadros consecutivos da câmera do LCD)
+    ir_s        - tempo do P_1 até o código IR chegar do Nano
+
+e propõe para cada botão espera = percentil + margem (limitada entre
+ESPERA_MINIMA_S e FATOR_ESPERA_MAXIMA x receita) e timeout IR =
+percentil + margem (nunca acima do timeout da receita).
+
+Modos (ModeloControle.config["tempos_adaptativos"]["modo"]):
+    desligado   - não mede nada
+    propor      - mede e propõe (padrão); o ciclo usa a receita
+    aplicar     - usa as propostas dos botões com amostras suficientes
+
+Volta automática para a receita: se a taxa de falha dos botões com tempo
+adaptado passar a taxa dos botões com tempo da receita + TOLERANCIA_FALHAS,
+o modelo inteiro fica CICLOS_CONSERVADORES ciclos com a receita; um botão
+que falha FALHAS_SEGUIDAS_MAXIMAS vezes seguidas com tempo adaptado também.
+
+Estatísticas salvas em modelos/<nome>_tempos.json.
+"""
+
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+import json
+import threading
+import time
+
+import cv2
+import numpy as np
+
+MODOS = ("desligado", "propor", "aplicar")
+CONFIG_PADRAO = {
+    "modo": "propor",
+    "percentil": 95,
+    "margem_s": 0.08,
+    "amostras_minimas": 8,
+}
+MAX_AMOSTRAS = 50
+ESPERA_MINIMA_S = 0.15
+FATOR_ESPERA_MAXIMA = 2.0
+TIMEOUT_IR_MINIMO_MS = 1500
+
+# Volta para a receita
+JANELA_RESULTADOS = 80
+RESULTADOS_MINIMOS = 16
+TOLERANCIA_FALHAS = 0.10
+CICLOS_CONSERVADORES = 5
+FALHAS_SEGUIDAS_MAXIMAS = 2
+
+# Estabilização do display: diferença média (0-255) entre quadros reduzidos
+LIMIAR_MUDANCA = 4.0
+QUADROS_ESTAVEIS = 3
+TAMANHO_COMPARACAO = (160, 120)
+
+
+def _reduzir(frame: np.ndarray) -> np.ndarray:
+    cinza = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    return cv2.resize(cinza, TAMANHO_COMPARACAO, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+def medir_estabilizacao(manager, inicio: float, janela_s: float,
+                        parar: Optional[threading.Event] = None) -> Optional[float]:
+    """Segundos desde inicio até a última mudança do display (0.0 se não mudou) - chamar fora do event loop
+
+    Observa o stream até QUADROS_ESTAVEIS quadros sem mudança depois de uma mudança, até o fim
+    da janela ou até parar ser sinalizado (dedo solto: o que muda depois não é do botão).
+    Só há amostra com a estabilização confirmada: parar, fim do stream ou fim da janela antes
+    dos quadros estáveis devolvem None (o display ainda podia estar mudando). "Não mudou" (0.0)
+    exige a janela inteira observada.
+    """
+    contador, frame = manager.get_frame_with_count()
+    if frame is None:
+        return None
+    anterior = _reduzir(frame)
+    ultima_mudanca: Optional[float] = None
+    estaveis = 0
+    while time.perf_counter() - inicio < janela_s and not (parar and parar.is_set()):
+        novo_contador, novo_frame = manager.wait_next_frame(contador, 0.5)
+        if novo_frame is None or novo_contador == contador:
+            return None
+        contador, atual = novo_contador, _reduzir(novo_frame)
+        if float(np.mean(np.abs(atual - anterior))) > LIMIAR_MUDANCA:
+            ultima_mudanca, estaveis = time.perf_counter(), 0
+        else:
+            estaveis += 1
+            if ultima_mudanca is not None and estaveis >= QUADROS_ESTAVEIS:
+                return ultima_mudanca - inicio
+        anterior = atual
+    if ultima_mudanca is None and estaveis >= QUADROS_ESTAVEIS and time.perf_counter() - inicio >= janela_s:
+        return 0.0
+    return None
+
+def esperas_receita(plano) -> Dict[int, Tuple[float, int]]:
+    """{botao_numero: (espera após o P_1, timeout IR em ms)} do plano compilado"""
+    esperas: Dict[int, List[Any]] = {}
+    for passo in plano.botoes:
+        if passo.acao == "pressionar":
+            esperas.setdefault(passo.botao + 1, [0.0, 0])[0] = passo.tempo
+        elif passo.acao == "capturar_ir":
+            esperas.setdefault(passo.botao + 1, [0.0, 0])[1] = passo.timeout_ms
+    return {botao: (espera, timeout) for botao, (espera, timeout) in esperas.items()}
+
+
+@dataclass
+class EstatisticaBotao:
+    display_s: List[float] = field(default_factory=list)
+    ir_s: List[float] = field(default_factory=list)
+    falhas_seguidas: int = 0
+    conservador_ate: int = 0
+
+    def adicionar(self, lista: List[float], valor: float):
+        lista.append(round(valor, 4))
+        del lista[:-MAX_AMOSTRAS]
+
+
+class TemposAdaptativos:
+    """Estatísticas de tempo por botão de um modelo, propostas e volta para a receita"""
+
+    def __init__(self, modelo: str, arquivo: Path, config: Optional[Dict[str, Any]] = None):
+        self.modelo = modelo
+        self.arquivo = arquivo
+        self.config = {**CONFIG_PADRAO, **(config or {})}
+        self.botoes: Dict[int, EstatisticaBotao] = {}
+        self.ciclo = 0
+        self.conservador_ate = 0
+        self.motivo_conservador: Optional[str] = None
+        # (tempo adaptado aplicado, falhou) dos últimos botões
+        self.resultados: Deque[Tuple[bool, bool]] = deque(maxlen=JANELA_RESULTADOS)
+        self.lock = threading.Lock()
+        self.carregar()
+
+    @property
+    def modo(self) -> str:
+        return self.config["modo"]
+
+    def definir_modo(self, modo: str):
+        if modo not in MODOS:
+            raise ValueError(f"Modo de tempos inválido: {modo} (use {', '.join(MODOS)})")
+        self.config["modo"] = modo
+
+    def _botao(self, botao: int) -> EstatisticaBotao:
+        return self.botoes.setdefault(botao, EstatisticaBotao())
+
+    # ---- persistência ----
+
+    def carregar(self):
+        if not self.arquivo.exists():
+            return
+        try:
+            with open(self.arquivo, "r", encoding="utf-8") as f:
+                dados = json.load(f)
+        except Exception as e:
+            print(f"⚠️ Erro ao ler {self.arquivo}: {e} - tempos adaptativos zerados")
+            return
+        self.config.update(dados.get("config", {}))
+        self.ciclo = dados.get("ciclo", 0)
+        self.conservador_ate = dados.get("conservador_ate", 0)
+        self.motivo_conservador = dados.get("motivo_conservador")
+        self.resultados.extend(tuple(r) for r in dados.get("resultados", []))
+        for botao, estatistica in dados.get("botoes", {}).items():
+            self.botoes[int(botao)] = EstatisticaBotao(**estatistica)
+
+    def salvar(self):
+        with self.lock:
+            dados = {
+                "modelo": self.modelo,
+                "config": self.config,
+                "ciclo": self.ciclo,
+                "conservador_ate": self.conservador_ate,
+                "motivo_conservador": self.motivo_conservador,
+                "resultados": [list(r) for r in self.resultados],
+                "botoes": {str(b): vars(e) for b, e in sorted(self.botoes.items())},
+            }
+        self.arquivo.parent.mkdir(exist_ok=True)
+        with open(self.arquivo, "w", encoding="utf-8") as f:
+            json.dump(dados, f, indent=2, ensure_ascii=False)
+
+    def zerar(self):
+        with self.lock:
+            self.botoes.clear()
+            self.resultados.clear()
+            self.conservador_ate = 0
+            self.motivo_conservador = None
+
+    # ---- registro ----
+
+    def iniciar_ciclo(self):
+        self.ciclo += 1
+
+    def registrar_display(self, botao: int, segundos: float):
+        with self.lock:
+            estatistica = self._botao(botao)
+            estatistica.adicionar(estatistica.display_s, segundos)
+
+    def registrar_ir(self, botao: int, segundos: float):
+        with self.lock:
+            estatistica = self._botao(botao)
+            estatistica.adicionar(estatistica.ir_s, segundos)
+
+    def registrar_resultado(self, botao: int, aprovado: bool, aplicado: bool):
+        """Resultado do botão no ciclo; dispara a volta para a receita se as falhas subirem"""
+        with self.lock:
+            self.resultados.append((aplicado, not aprovado))
+            estatistica = self._botao(botao)
+            if aplicado and not aprovado:
+                estatistica.falhas_seguidas += 1
+                if estatistica.falhas_seguidas >= FALHAS_SEGUIDAS_MAXIMAS:
+                    estatistica.conservador_ate = self.ciclo + CICLOS_CONSERVADORES
+                    estatistica.falhas_seguidas = 0
+                    print(f"⏱️ {self.modelo} botão {botao}: {FALHAS_SEGUIDAS_MAXIMAS} falhas com tempo adaptado - volta para a receita")
+            elif aprovado:
+                estatistica.falhas_seguidas = 0
+
+            aplicados = [falhou for a, falhou in self.resultados if a]
+            receita = [falhou for a, falhou in self.resultados if not a]
+            if len(aplicados) < RESULTADOS_MINIMOS:
+                return
+            taxa_aplicada = sum(aplicados) / len(aplicados)
+            taxa_receita = sum(receita) / len(receita) if len(receita) >= RESULTADOS_MINIMOS else 0.0
+            if taxa_aplicada > taxa_receita + TOLERANCIA_FALHAS:
+                self.conservador_ate = self.ciclo + CICLOS_CONSERVADORES
+                self.motivo_conservador = (f"falhas com tempo adaptado {taxa_aplicada:.0%} > "
+                                           f"receita {taxa_receita:.0%} + {TOLERANCIA_FALHAS:.0%}")
+                # Recomeça a comparação depois do período conservador
+                self.resultados = deque(((a, f) for a, f in self.resultados if not a), maxlen=JANELA_RESULTADOS)
+                print(f"⚠️ Tempos do {self.modelo}: {self.motivo_conservador} - {CICLOS_CONSERVADORES} ciclos com a receita")
+
+    # ---- propostas ----
+
+    def _percentil(self, amostras: List[float]) -> Optional[float]:
+        if len(amostras) < self.config["amostras_minimas"]:
+            return None
+        return float(np.percentile(amostras, self.config["percentil"]))
+
+    def proposta(self, botao: int, espera_receita: float, timeout_receita_ms: int) -> Dict[str, Any]:
+        estatistica = self.botoes.get(botao, EstatisticaBotao())
+        proposta: Dict[str, Any] = {
+            "amostras_display": len(estatistica.display_s),
+            "amostras_ir": len(estatistica.ir_s),
+            "espera_receita_s": espera_receita,
+            "timeout_ir_receita_ms": timeout_receita_ms,
+            "espera_s": None,
+            "timeout_ir_ms": None,
+        }
+        display = self._percentil(estatistica.display_s)
+        if display is not None:
+            espera = display + self.config["margem_s"]
+            proposta["espera_s"] = round(min(max(espera, ESPERA_MINIMA_S), espera_receita * FATOR_ESPERA_MAXIMA), 3)
+        ir = self._percentil(estatistica.ir_s)
+        if ir is not None:
+            # Medido desde o P_1; como timeout (contado depois do P_0) fica com folga
+            timeout = int((ir + self.config["margem_s"]) * 1000)
+            proposta["timeout_ir_ms"] = min(max(timeout, TIMEOUT_IR_MINIMO_MS), timeout_receita_ms)
+        return proposta
+
+    def conservador(self, botao: int) -> bool:
+        return self.ciclo <= self.conservador_ate or self.ciclo <= self._botao(botao).conservador_ate
+
+    def aplicar(self, botao: int, espera_receita: float, timeout_receita_ms: int) -> Tuple[float, int, bool]:
+        """(espera após o P_1, timeout IR, se o tempo adaptado foi aplicado) para o botão neste ciclo"""
+        if self.modo != "aplicar" or self.conservador(botao):
+            return espera_receita, timeout_receita_ms, False
+        proposta = self.proposta(botao, espera_receita, timeout_receita_ms)
+        if proposta["espera_s"] is None and proposta["timeout_ir_ms"] is None:
+            return espera_receita, timeout_receita_ms, False
+        return (proposta["espera_s"] if proposta["espera_s"] is not None else espera_receita,
+                proposta["timeout_ir_ms"] or timeout_receita_ms, True)
+
+    def resumo(self, esperas_receita: Optional[Dict[int, Tuple[float, int]]] = None) -> Dict[str, Any]:
+        aplicados = [falhou for a, falhou in self.resultados if a]
+        receita = [falhou for a, falhou in self.resultados if not a]
+        resumo = {
+            "modelo": self.modelo,
+            "config": self.config,
+            "ciclo": self.ciclo,
+            "conservador": self.ciclo <= self.conservador_ate,
+            "conservador_ate_ciclo": self.conservador_ate,
+            "motivo_conservador": self.motivo_conservador,
+            "taxa_falha_adaptado": round(sum(aplicados) / len(aplicados), 3) if aplicados else None,
+            "taxa_falha_receita": round(sum(receita) / len(receita), 3) if receita else None,
+        }
+        if esperas_receita is not None:
+            resumo["botoes"] = {
+                str(botao): {**self.proposta(botao, espera, timeout), "conservador": self.conservador(botao)}
+                for botao, (espera, timeout) in sorted(esperas_receita.items())
+            }
+        return resumo
@@ -0,0 +1,262 @@
+"""
+==============================================
+TRANSPORTE SERIAL ASSÍNCRONO
+==============================================
+Dono único de uma porta serial aberta:
+
+    escrita - pelo EscalonadorSerial da porta (thread escritora, faixa
+              prioritária); cada escrita devolve um futuro resolvido
+              quando os bytes saíram
+    leitura - uma thread leitora por porta monta as linhas (\\n) a partir
+              de read(in_waiting), marca o instante de chegada e publica
+              cada linha para as assinaturas cujo padrão casa com ela
+
+Assinaturas (pub/sub por padrão regex, ex.: START da pneumática,
+ok/status do GRBL, respostas dos relés, dados IR):
+
+    callback    - chamado na própria thread leitora (ex.: ControladorGRBL,
+                  que casa ok/error sem passar pelo event loop)
+    fila        - sem callback, as linhas ficam na fila da assinatura e
+                  são lidas com await ler()
+
+Uma linha vai para todas as assinaturas que casam; cada assinatura só
+descarta a própria fila, nunca as linhas (ou bytes) de outro consumidor.
+Linhas sem assinante ficam só no histórico da porta.
+
+Nenhuma coroutine chama readline()/read() da pyserial: uma linha parcial
+fica no buffer da thread leitora em vez de bloquear o event loop pelo
+timeout da porta.
+"""
+
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional, Pattern, Union
+import asyncio
+import re
+import threading
+import time
+
+from escalonador_serial import EscalonadorSerial
+
+# Linhas guardadas na fila de uma assinatura sem leitor (as mais antigas são descartadas)
+LINHAS_MAXIMAS = 256
+# Linha sem \n maior que isso é entregue assim mesmo (lixo/ruído na porta)
+TAMANHO_MAXIMO_LINHA = 1024
+# Últimas linhas de cada porta, para diagnóstico
+LINHAS_HISTORICO = 100
+
+
+@dataclass
+class LinhaSerial:
+    """Uma linha recebida, com o instante de chegada (monotonic e relógio)"""
+    texto: str
+    porta: str
+    recebida_em: float = field(default_factory=time.monotonic)
+    horario: str = field(default_factory=lambda: datetime.now().isoformat())
+    assinantes: List[str] = field(default_factory=list)
+
+    def resumo(self) -> Dict[str, Any]:
+        return {"texto": self.texto, "horario": self.horario, "assinantes": self.assinantes}
+
+
+class Assinatura:
+    """Linhas de uma porta que casam com um padrão, entregues a um callback ou numa fila"""
+
+    def __init__(self, transporte: "TransporteSerial", nome: str, padrao: Optional[Pattern] = None,
+                 callback: Optional[Callable[[LinhaSerial], None]] = None,
+                 ao_encerrar: Optional[Callable[[], None]] = None):
+        self.transporte = transporte
+        self.nome = nome
+        self.padrao = padrao
+        self.callback = callback
+        self.ao_encerrar = ao_encerrar
+        self.linhas: Deque[LinhaSerial] = deque(maxlen=LINHAS_MAXIMAS)
+        self.nova_linha = asyncio.Event() if callback is None and transporte.loop is not None else None
+        self.entregues = 0
+        self.descartadas = 0
+        self.ativa = True
+
+    def casa(self, texto: str) -> bool:
+        return self.padrao is None or self.padrao.search(texto) is not None
+
+    def _enfileirar(self, linha: LinhaSerial):
+        """No event loop: guarda a linha e acorda quem espera em ler()"""
+        if len(self.linhas) == self.linhas.maxlen:
+            self.descartadas += 1
+        self.linhas.append(linha)
+        self.nova_linha.set()
+
+    async def ler(self, timeout: Optional[float] = None) -> Optional[LinhaSerial]:
+        """Próxima linha da assinatura (None no timeout ou com a porta encerrada)"""
+        if self.nova_linha is None:
+            raise RuntimeError(f"{self.transporte.nome}: assinatura {self.nome} não tem fila")
+        while not self.linhas:
+            if not self.ativa:
+                return None
+            self.nova_linha.clear()
+            try:
+                await asyncio.wait_for(self.nova_linha.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self.linhas.popleft()
+
+    def descartar_pendentes(self) -> int:
+        """Esvazia só a fila desta assinatura; retorna quantas linhas foram descartadas"""
+        descartadas = len(self.linhas)
+        self.linhas.clear()
+        return descartadas
+
+    def _encerrar(self):
+        self.ativa = False
+        if self.nova_linha is not None:
+            self.nova_linha.set()
+        if self.ao_encerrar is not None:
+            self.ao_encerrar()
+
+    def resumo(self) -> Dict[str, Any]:
+        return {
+            "padrao": self.padrao.pattern if self.padrao is not None else None,
+            "modo": "callback" if self.callback is not None else "fila",
+            "entregues": self.entregues,
+            "na_fila": len(self.linhas),
+            "descartadas": self.descartadas,
+        }
+
+
+class TransporteSerial:
+    """Leitura por linhas com assinaturas e escrita com futuros de uma porta serial"""
+
+    def __init__(self, port, lock: threading.Lock, nome: str = "porta",
+                 loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.port = port
+        self.nome = nome
+        self.loop = loop
+        self.escalonador = EscalonadorSerial(port, lock, nome)
+        self.assinaturas: Dict[str, Assinatura] = {}
+        self.lock_assinaturas = threading.Lock()
+        self.historico: Deque[LinhaSerial] = deque(maxlen=LINHAS_HISTORICO)
+        self.parcial = bytearray()
+        self.linhas_recebidas = 0
+        self.linhas_sem_assinante = 0
+        self.executando = True
+        self.thread = threading.Thread(target=self._loop_leitura, daemon=True, name=f"Leitor-{nome}")
+        self.thread.start()
+
+    # ---------- assinaturas ----------
+
+    def assinar(self, nome: str, padrao: Union[str, Pattern, None] = None,
+                callback: Optional[Callable[[LinhaSerial], None]] = None,
+                ao_encerrar: Optional[Callable[[], None]] = None) -> Assinatura:
+        """Assinatura pelo nome (a existente é reaproveitada); padrão None recebe todas as linhas"""
+        with self.lock_assinaturas:
+            assinatura = self.assinaturas.get(nome)
+            if assinatura is None:
+                if isinstance(padrao, str):
+                    padrao = re.compile(padrao)
+                assinatura = self.assinaturas[nome] = Assinatura(self, nome, padrao, callback, ao_encerrar)
+        if not self.executando:
+            assinatura._encerrar()
+        return assinatura
+
+    def cancelar_assinatura(self, assinatura: Assinatura):
+        with self.lock_assinaturas:
+            if self.assinaturas.get(assinatura.nome) is assinatura:
+                del self.assinaturas[assinatura.nome]
+        assinatura.ativa = False
+
+    # ---------- leitura ----------
+
+    def _loop_leitura(self):
+        while self.executando:
+            try:
+                if not self.port or not self.port.is_open:
+                    break
+                # Bloqueia no máximo o timeout da porta, e só nesta thread
+                bruto = self.port.read(self.port.in_waiting or 1)
+            except Exception as e:
+                if self.executando:
+                    print(f"⚠️ Leitura da {self.nome} interrompida: {e}")
+                break
+            if bruto:
+                self._montar_linhas(bruto)
+
+        self.executando = False
+        self.escalonador.fechar()
+        self._encerrar_assinaturas()
+
+    def _montar_linhas(self, bruto: bytes):
+        self.parcial += bruto
+        while True:
+            fim = self.parcial.find(b"\n")
+            if fim < 0:
+                if len(self.parcial) > TAMANHO_MAXIMO_LINHA:
+                    fim = len(self.parcial) - 1
+                else:
+                    return
+            texto = self.parcial[:fim + 1].decode(errors="ignore").strip()
+            del self.parcial[:fim + 1]
+            if texto:
+                self._publicar(LinhaSerial(texto, self.nome))
+
+    def _publicar(self, linha: LinhaSerial):
+        self.linhas_recebidas += 1
+        self.historico.append(linha)
+        with self.lock_assinaturas:
+            destinos = [a for a in self.assinaturas.values() if a.casa(linha.texto)]
+        if not destinos:
+            self.linhas_sem_assinante += 1
+            print(f"ℹ️ {self.nome}: linha sem assinante: {linha.texto}")
+            return
+        for assinatura in destinos:
+            linha.assinantes.append(assinatura.nome)
+            assinatura.entregues += 1
+            if assinatura.callback is not None:
+                try:
+                    assinatura.callback(linha)
+                except Exception as e:
+                    print(f"⚠️ {self.nome}: erro em {assinatura.nome} ao processar '{linha.texto}': {e}")
+            elif self.loop is not None:
+                self.loop.call_soon_threadsafe(assinatura._enfileirar, linha)
+
+    def _encerrar_assinaturas(self):
+        with self.lock_assinaturas:
+            assinaturas = list(self.assinaturas.values())
+        for assinatura in assinaturas:
+            if assinatura.nova_linha is not None and self.loop is not None and not self.loop.is_closed():
+                self.loop.call_soon_threadsafe(assinatura._encerrar)
+            else:
+                assinatura._encerrar()
+
+    # ---------- escrita ----------
+
+    def escrever(self, dados: bytes, prioridade: bool = False, descartar_normais: bool = False) -> Future:
+        """Escrita não bloqueante; o futuro resolve quando os bytes saíram na porta"""
+        return self.escalonador.enviar(dados, prioridade, descartar_normais)
+
+    async def enviar(self, dados: bytes, prioridade: bool = False, descartar_normais: bool = False):
+        await asyncio.wrap_future(self.escrever(dados, prioridade, descartar_normais))
+
+    # ---------- ciclo de vida ----------
+
+    def ultimas_linhas(self, quantidade: int = LINHAS_HISTORICO) -> List[Dict[str, Any]]:
+        return [linha.resumo() for linha in list(self.historico)[-quantidade:]]
+
+    def resumo(self) -> Dict[str, Any]:
+        with self.lock_assinaturas:
+            assinaturas = {nome: a.resumo() for nome, a in self.assinaturas.items()}
+        return {
+            "executando": self.executando,
+            "linhas_recebidas": self.linhas_recebidas,
+            "linhas_sem_assinante": self.linhas_sem_assinante,
+            "assinaturas": assinaturas,
+            "escrita": self.escalonador.resumo(),
+        }
+
+    def fechar(self):
+        """Para as threads leitora e escritora (a porta continua aberta)"""
+        self.executando = False
+        self.escalonador.fechar()
+        if self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join(timeout=2)
@@ -0,0 +1,468 @@
+"""
+==============================================
+VALIDAÇÃO DE IMAGENS
+==============================================
+Pré-processamento, métricas de similaridade e cascata de validação
+ordenada por custo (hash perceptual -> template matching + histograma)
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+import threading
+
+import cv2
+import numpy as np
+
+# Tamanho padrão de comparação (largura, altura)
+TAMANHO_PADRAO = (640, 480)
+
+# Limiares da etapa de hash (distância de Hamming em 64 bits)
+LIMIAR_HASH_ACEITE = 3      # <= aceita direto, sem template matching
+LIMIAR_HASH_REJEICAO = 28   # >= rejeita direto (≈ imagens sem relação)
+
+# Cache de referências pré-processadas: caminho -> (mtime, imagem, hash)
+MAX_REFERENCIAS_CACHE = 256
+_cache_referencias: "OrderedDict[str, Tuple[float, np.ndarray, int]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+# =========================
+# PRÉ-PROCESSAMENTO
+# =========================
+
+def processar_frame(img: np.ndarray) -> np.ndarray:
+    """Redimensiona, converte para escala de cinza, aplica blur e normaliza um frame BGR"""
+    # Redimensiona para tamanho padrão (640x480)
+    img = cv2.resize(img, TAMANHO_PADRAO)
+
+    # Converte para escala de cinza
+    if img.ndim == 3:
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    else:
+        gray = img
+
+    # Aplica blur para reduzir ruído
+    gray = cv2.GaussianBlur(gray, (5, 5), 0)
+
+    # Normaliza
+    return cv2.normalize(gray, None, 0, 255, cv2.NORM_MINMAX)
+
+def processar_imagem(img_path: str) -> np.ndarray:
+    """Processa imagem: carrega, redimensiona, converte para escala de cinza e normaliza"""
+    try:
+        img = cv2.imread(str(img_path))
+        if img is None:
+            raise ValueError(f"Não foi possível carregar imagem: {img_path}")
+
+        return processar_frame(img)
+    except Exception as e:
+        print(f"❌ Erro ao processar imagem {img_path}: {e}")
+        return None
+
+
+# =========================
+# MÉTRICAS DE SIMILARIDADE
+# =========================
+
+def calcular_similaridade_template_matching(img1: np.ndarray, img2: np.ndarray) -> float:
+    """Calcula similaridade usando template matching"""
+    try:
+        if img1 is None or img2 is None:
+            return 0.0
+
+        # Garante que as imagens têm o mesmo tamanho
+        if img1.shape != img2.shape:
+            img2 = cv2.resize(img2, (img1.shape[1], img1.shape[0]))
+
+        # Template matching
+        result = cv2.matchTemplate(img1, img2, cv2.TM_CCOEFF_NORMED)
+        similarity = float(result[0][0])
+        return max(0.0, similarity)  # Garante que não seja negativo
+    except Exception as e:
+        print(f"❌ Erro ao calcular template matching: {e}")
+        return 0.0
+
+def calcular_similaridade_histograma(img1: np.ndarray, img2: np.ndarray) -> float:
+    """Calcula similaridade usando histograma"""
+    try:
+        if img1 is None or img2 is None:
+            return 0.0
+
+        # Garante que as imagens têm o mesmo tamanho
+        if img1.shape != img2.shape:
+            img2 = cv2.resize(img2, (img1.shape[1], img1.shape[0]))
+
+        # Calcula e normaliza histogramas
+        hist1 = calcular_histograma(img1)
+        hist2 = calcular_histograma(img2)
+
+        # Calcula correlação
+        return comparar_histogramas(hist1, hist2)
+    except Exception as e:
+        print(f"❌ Erro ao calcular similaridade de histograma: {e}")
+        return 0.0
+
+def calcular_histograma(img: np.ndarray) -> np.ndarray:
+    """Histograma de 256 bins normalizado (float32), no formato usado pela comparação"""
+    hist = cv2.calcHist([img], [0], None, [256], [0, 256])
+    return cv2.normalize(hist, hist).flatten()
+
+def comparar_histogramas(hist1: np.ndarray, hist2: np.ndarray) -> float:
+    """Correlação entre dois histogramas já normalizados"""
+    return float(cv2.compareHist(np.ascontiguousarray(hist1, dtype=np.float32),
+                                 np.ascontiguousarray(hist2, dtype=np.float32),
+                                 cv2.HISTCMP_CORREL))
+
+def calcular_dhash(gray: np.ndarray) -> int:
+    """Calcula o difference hash de 64 bits (gradiente horizontal numa grade 9x8)"""
+    pequena = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = pequena[:, 1:] > pequena[:, :-1]
+    return int.from_bytes(np.packbits(bits.flatten()).tobytes(), "big")
+
+def distancia_hamming(hash1: int, hash2: int) -> int:
+    """Número de bits diferentes entre dois hashes de 64 bits"""
+    return (hash1 ^ hash2).bit_count()
+
+
+# =========================
+# REFERÊNCIAS
+# =========================
+
+def encontrar_imagem_referencia(botao_numero: int, nome_botao: str, camera_id: int, referencia_dir: Path) -> Optional[Path]:
+    """Encontra imagem de referência correspondente"""
+    try:
+        nome_botao_clean = nome_botao.replace(' ', '_').replace('-', '_').upper()
+
+        # Padrões de busca
+        patterns = [
+            f"botao_{botao_numero:03d}_{nome_botao_clean}_camera_{camera_id}_*.jpg",
+            f"botao_{botao_numero:03d}_*_{nome_botao_clean}_*_camera_{camera_id}_*.jpg",
+            f"*{nome_botao_clean}*camera_{camera_id}*.jpg",
+            f"*botao_{botao_numero:03d}*camera_{camera_id}*.jpg"
+        ]
+
+        for pattern in patterns:
+            matches = list(referencia_dir.glob(pattern))
+            if matches:
+                # Retorna a mais recente se houver múltiplas
+                return max(matches, key=lambda p: p.stat().st_mtime)
+
+        return None
+    except Exception as e:
+        print(f"❌ Erro ao buscar imagem de referência: {e}")
+        return None
+
+def carregar_referencia(imagem_ref_path: str) -> Tuple[Optional[np.ndarray], Optional[int]]:
+    """Retorna a referência pré-processada e seu hash, usando cache por caminho + mtime"""
+    chave = str(imagem_ref_path)
+    try:
+        mtime = Path(chave).stat().st_mtime
+    except OSError:
+        return None, None
+
+    with _cache_lock:
+        entrada = _cache_referencias.get(chave)
+        if entrada is not None and entrada[0] == mtime:
+            _cache_referencias.move_to_end(chave)
+            return entrada[1], entrada[2]
+
+    img_ref = processar_imagem(chave)
+    if img_ref is None:
+        return None, None
+    hash_ref = calcular_dhash(img_ref)
+
+    with _cache_lock:
+        _cache_referencias[chave] = (mtime, img_ref, hash_ref)
+        _cache_referencias.move_to_end(chave)
+        while len(_cache_referencias) > MAX_REFERENCIAS_CACHE:
+            _cache_referencias.popitem(last=False)
+
+    return img_ref, hash_ref
+
+def limpar_cache_referencias():
+    """Descarta as referências pré-processadas (ex.: após trocar o conjunto de referência)"""
+    with _cache_lock:
+        _cache_referencias.clear()
+
+
+# =========================
+# CASCATA DE VALIDAÇÃO
+# =========================
+
+@dataclass
+class ContextoValidacao:
+    """Estado compartilhado entre as etapas da cascata para uma comparação"""
+    img_teste: np.ndarray
+    img_ref: np.ndarray
+    threshold: float
+    hash_teste: Optional[int] = None
+    hash_ref: Optional[int] = None
+    peso_template: float = 0.7
+    peso_hist: float = 0.3
+    extras: Dict[str, Any] = field(default_factory=dict)
+    resultado: Dict[str, Any] = field(default_factory=dict)
+
+# Uma etapa recebe o contexto, grava seus scores em contexto.resultado e retorna
+# True (aprova), False (reprova) ou None (inconclusivo -> próxima etapa)
+EtapaValidacao = Callable[[ContextoValidacao], Optional[bool]]
+
+def etapa_hash(ctx: ContextoValidacao) -> Optional[bool]:
+    """Etapa barata: decide pelos extremos da distância de Hamming entre dHashes"""
+    if ctx.hash_teste is None:
+        ctx.hash_teste = calcular_dhash(ctx.img_teste)
+    if ctx.hash_ref is None:
+        ctx.hash_ref = calcular_dhash(ctx.img_ref)
+
+    distancia = distancia_hamming(ctx.hash_teste, ctx.hash_ref)
+    similaridade = 1.0 - distancia / 64.0
+    ctx.resultado["distancia_hash"] = distancia
+    ctx.resultado["similaridade_hash"] = round(similaridade, 4)
+
+    if distancia <= LIMIAR_HASH_ACEITE or distancia >= LIMIAR_HASH_REJEICAO:
+        ctx.resultado["similaridade_media"] = round(similaridade, 4)
+        return distancia <= LIMIAR_HASH_ACEITE
+    return None
+
+def etapa_template_histograma(ctx: ContextoValidacao) -> Optional[bool]:
+    """Etapa completa: template matching + histograma com média ponderada"""
+    template_score = calcular_similaridade_template_matching(ctx.img_teste, ctx.img_ref)
+    hist_ref = ctx.extras.get("hist_ref")
+    if hist_ref is not None and ctx.img_teste.shape == ctx.img_ref.shape:
+        # Histograma da referência pré-calculado (pacote de referência)
+        hist_score = comparar_histogramas(calcular_histograma(ctx.img_teste), hist_ref)
+    else:
+        hist_score = calcular_similaridade_histograma(ctx.img_teste, ctx.img_ref)
+
+    # Média ponderada (template matching tem mais peso)
+    similaridade_media = (template_score * ctx.peso_template) + (hist_score * ctx.peso_hist)
+
+    ctx.resultado["similaridade_template"] = round(template_score, 4)
+    ctx.resultado["similaridade_hist"] = round(hist_score, 4)
+    ctx.resultado["similaridade_media"] = round(similaridade_media, 4)
+    return similaridade_media >= ctx.threshold
+
+# Registro de etapas disponíveis (nome -> função)
+ETAPAS_VALIDACAO: Dict[str, EtapaValidacao] = {
+    "hash": etapa_hash,
+    "template_histograma": etapa_template_histograma,
+}
+
+# Ordem padrão: da etapa mais barata para a mais cara
+CASCATA_PADRAO: Tuple[str, ...] = ("hash", "template_histograma")
+
+# Cascata usada no ciclo: display LCD (se o modelo tiver máscaras) -> hash -> modelo estatístico (se existir)
+# -> template + histograma ("lcd" e "modelo_estatistico" são registradas por decodificador_lcd e
+# referencia_estatistica)
+CASCATA_CICLO: Tuple[str, ...] = ("lcd", "hash", "modelo_estatistico", "template_histograma")
+
+@dataclass(frozen=True)
+class ConfiguracaoValidacao:
+    """Parâmetros de decisão da validação (câmera, botão e controle)"""
+    threshold: float = 0.75
+    peso_template: float = 0.7
+    peso_hist: float = 0.3
+    taxa_minima_controle: float = 0.8
+    similaridade_minima_controle: float = 0.70
+    cascata: Tuple[str, ...] = CASCATA_PADRAO
+
+    @property
+    def pesos(self) -> Tuple[float, float]:
+        return (self.peso_template, self.peso_hist)
+
+def registrar_etapa_validacao(nome: str, etapa: EtapaValidacao):
+    """Registra (ou substitui) uma etapa que pode ser usada em uma cascata"""
+    ETAPAS_VALIDACAO[nome] = etapa
+
+def executar_cascata(ctx: ContextoValidacao, cascata: Sequence[str]) -> Dict[str, Any]:
+    """Executa as etapas em ordem até uma delas decidir; a última sempre decide"""
+    executadas = []
+    aprovado = False
+    etapa_decisiva = None
+
+    for nome in cascata:
+        etapa = ETAPAS_VALIDACAO.get(nome)
+        if etapa is None:
+            raise ValueError(f"Etapa de validação desconhecida: {nome}")
+
+        executadas.append(nome)
+        decisao = etapa(ctx)
+        if decisao is not None:
+            aprovado = bool(decisao)
+            etapa_decisiva = nome
+            break
+
+    resultado = {
+        "aprovado": aprovado,
+        "similaridade_template": None,
+        "similaridade_hist": None,
+        "similaridade_media": 0.0,
+    }
+    resultado.update(ctx.resultado)
+    resultado["threshold"] = ctx.threshold
+    resultado["etapa_decisiva"] = etapa_decisiva
+    resultado["etapas_executadas"] = executadas
+    return resultado
+
+def comparar_com_referencia_processada(img_teste: np.ndarray, img_ref: np.ndarray, hash_ref: Optional[int] = None,
+                                       threshold: float = 0.75,
+                                       cascata: Optional[Sequence[str]] = None,
+                                       extras: Optional[Dict[str, Any]] = None,
+                                       registro=None, camera_id: Optional[int] = None,
+                                       pesos: Tuple[float, float] = (0.7, 0.3)) -> Dict[str, Any]:
+    """Executa a cascata sobre imagens já processadas (frames em memória ou pacote de referência)
+
+    Se um RegistroCiclo for informado, a imagem de teste é alinhada à referência com a
+    transformação em cache da câmera (estimada só na primeira comparação do ciclo).
+    """
+    if registro is not None and camera_id is not None:
+        img_teste = registro.alinhar(camera_id, img_teste, img_ref)
+
+    ctx = ContextoValidacao(img_teste=img_teste, img_ref=img_ref, threshold=threshold,
+                            hash_ref=hash_ref, peso_template=pesos[0], peso_hist=pesos[1],
+                            extras=dict(extras or {}))
+    resultado = executar_cascata(ctx, cascata or CASCATA_PADRAO)
+
+    if registro is not None and camera_id is not None:
+        transformacao = registro.obter(camera_id)
+        if transformacao is not None:
+            resultado["registro"] = transformacao.resumo()
+    return resultado
+
+def comparar_imagem_com_referencia(imagem_teste_path: str, imagem_ref_path: str, threshold: float = 0.75,
+                                   cascata: Optional[Sequence[str]] = None,
+                                   extras: Optional[Dict[str, Any]] = None,
+                                   registro=None, camera_id: Optional[int] = None,
+                                   pesos: Tuple[float, float] = (0.7, 0.3)) -> Dict[str, Any]:
+    """Compara imagem de teste com imagem de referência usando a cascata de validação"""
+    try:
+        # Processa ambas as imagens (referência vem do cache com hash pré-calculado)
+        img_teste = processar_imagem(imagem_teste_path)
+        img_ref, hash_ref = carregar_referencia(imagem_ref_path)
+
+        if img_teste is None or img_ref is None:
+            return {
+                "aprovado": False,
+                "similaridade_template": 0.0,
+                "similaridade_hist": 0.0,
+                "similaridade_media": 0.0,
+                "erro": "Erro ao processar imagens"
+            }
+
+        return comparar_com_referencia_processada(
+            img_teste, img_ref, hash_ref, threshold=threshold, cascata=cascata,
+            extras=extras, registro=registro, camera_id=camera_id, pesos=pesos
+        )
+    except Exception as e:
+        print(f"❌ Erro ao comparar imagens: {e}")
+        return {
+            "aprovado": False,
+            "similaridade_template": 0.0,
+            "similaridade_hist": 0.0,
+            "similaridade_media": 0.0,
+            "erro": str(e)
+        }
+
+
+# =========================
+# CONSOLIDAÇÃO POR BOTÃO E CONTROLE
+# =========================
+
+def consolidar_validacao_botao(validacoes_por_camera: list) -> Tuple[bool, float]:
+    """Botão aprovado se todas as câmeras com referência aprovarem; retorna (aprovado, similaridade média)"""
+    aprovado = all(v.get('aprovado', False) for v in validacoes_por_camera if v.get('imagem_referencia_encontrada'))
+    similaridades = [v.get('similaridade_media', 0.0) for v in validacoes_por_camera]
+    similaridade_media = sum(similaridades) / len(similaridades) if similaridades else 0.0
+    return aprovado, similaridade_media
+
+def gerar_relatorio_controles(resultados_validacao: list, taxa_minima: float = 0.8,
+                              similaridade_minima: float = 0.70) -> Dict[str, Any]:
+    """Gera relatório final de aprovação/reprovação por controle"""
+    # Agrupa resultados por controle
+    controles_resultados = {1: [], 2: [], 3: [], 4: []}
+
+    for resultado in resultados_validacao:
+        controle_num = resultado.get('controle_numero', 1)
+        if controle_num in controles_resultados:
+            controles_resultados[controle_num].append(resultado)
+
+    relatorio = {
+        "controles": {},
+        "resumo": {
+            "total_controles": 4,
+            "controles_aprovados": 0,
+            "controles_reprovados": 0
+        }
+    }
+
+    for controle_num in range(1, 5):
+        resultados_controle = controles_resultados[controle_num]
+
+        if not resultados_controle:
+            relatorio["controles"][controle_num] = {
+                "status": "sem_dados",
+                "aprovado": False,
+                "total_botoes": 0,
+                "botoes_aprovados": 0,
+                "botoes_reprovados": 0,
+                "taxa_aprovacao": 0.0,
+                "similaridade_media": 0.0,
+                "botoes": []
+            }
+            continue
+
+        # Calcula estatísticas
+        total_botoes = len(resultados_controle)
+        botoes_aprovados = sum(1 for r in resultados_controle if r.get('validacao', {}).get('aprovado', False))
+        botoes_reprovados = total_botoes - botoes_aprovados
+
+        # Calcula similaridade média
+        similaridades = [r.get('validacao', {}).get('similaridade_media', 0.0) for r in resultados_controle]
+        similaridade_media = sum(similaridades) / len(similaridades) if similaridades else 0.0
+
+        # Controle é aprovado se pelo menos 80% (taxa_minima) dos botões foram aprovados
+        taxa_aprovacao = botoes_aprovados / total_botoes if total_botoes > 0 else 0.0
+        controle_aprovado = taxa_aprovacao >= taxa_minima and similaridade_media >= similaridade_minima
+
+        relatorio["controles"][controle_num] = {
+            "status": "aprovado" if controle_aprovado else "reprovado",
+            "aprovado": controle_aprovado,
+            "total_botoes": total_botoes,
+            "botoes_aprovados": botoes_aprovados,
+            "botoes_reprovados": botoes_reprovados,
+            "taxa_aprovacao": round(taxa_aprovacao * 100, 2),
+            "similaridade_media": round(similaridade_media, 4),
+            "botoes": [
+                {
+                    "nome": r.get('nome_botao'),
+                    "aprovado": r.get('validacao', {}).get('aprovado', False),
+                    "similaridade": r.get('validacao', {}).get('similaridade_media', 0.0)
+                }
+                for r in resultados_controle
+            ]
+        }
+
+        if controle_aprovado:
+            relatorio["resumo"]["controles_aprovados"] += 1
+        else:
+            relatorio["resumo"]["controles_reprovados"] += 1
+
+    return relatorio
+
+def veredito_antecipado(botoes_aprovados: int, soma_similaridades: float, avaliados: int, total_botoes: int,
+                        taxa_minima: float = 0.8, similaridade_minima: float = 0.70) -> Optional[bool]:
+    """Veredito do controle (regra de gerar_relatorio_controles) já decidido com parte dos botões avaliados
+
+    Os botões restantes valem no máximo aprovado com similaridade 1.0 e no mínimo reprovado com 0.0:
+    False se nem o melhor caso aprova, True se nem o pior caso reprova, None enquanto indefinido.
+    """
+    if total_botoes <= 0:
+        return None
+    restantes = total_botoes - avaliados
+    if (botoes_aprovados + restantes) / total_botoes < taxa_minima or \
+            (soma_similaridades + restantes) / total_botoes < similaridade_minima:
+        return False
+    if botoes_aprovados / total_botoes >= taxa_minima and soma_similaridades / total_botoes >= similaridade_minima:
+        return True
+    return None